@@ -9,7 +9,7 @@ from sqlalchemy import engine_from_config, pool
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
 
 from app.base import Base
-from app.models import User, Chat, Message, ReadReceipt, SMSCode  # noqa: F401
+from app.models import User, Chat, Message, ReadReceipt, ChatEvent, UserEvent, SMSCode  # noqa: F401
 from app.config import settings
 
 config = context.config
@@ -0,0 +1,59 @@
+"""add per-chat sequence numbers and chat_events log
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-19
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision: str = "0005"
+down_revision: Union[str, None] = "0004"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("chats", sa.Column("last_seq", sa.BigInteger, server_default="0", nullable=False))
+    op.add_column("messages", sa.Column("seq", sa.BigInteger, nullable=True))
+
+    # Backfill: number existing messages per chat in creation order
+    op.execute(
+        """
+        UPDATE messages m SET seq = numbered.rn
+        FROM (
+            SELECT id, row_number() OVER (PARTITION BY chat_id ORDER BY created_at, id) AS rn
+            FROM messages
+        ) AS numbered
+        WHERE m.id = numbered.id
+        """
+    )
+    op.execute(
+        """
+        UPDATE chats c SET last_seq = agg.max_seq
+        FROM (SELECT chat_id, max(seq) AS max_seq FROM messages GROUP BY chat_id) AS agg
+        WHERE c.id = agg.chat_id
+        """
+    )
+    op.create_index("ix_messages_chat_id_seq", "messages", ["chat_id", "seq"])
+
+    op.create_table(
+        "chat_events",
+        sa.Column("id", sa.BigInteger, primary_key=True, autoincrement=True),
+        sa.Column("chat_id", postgresql.UUID(as_uuid=True), sa.ForeignKey("chats.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("seq", sa.BigInteger, nullable=False),
+        sa.Column("event_type", sa.String(32), nullable=False),
+        sa.Column("message_id", postgresql.UUID(as_uuid=True), nullable=True),
+        sa.Column("payload", postgresql.JSONB, nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.UniqueConstraint("chat_id", "seq", name="uq_chat_event_seq"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("chat_events")
+    op.drop_index("ix_messages_chat_id_seq", table_name="messages")
+    op.drop_column("messages", "seq")
+    op.drop_column("chats", "last_seq")
@@ -0,0 +1,34 @@
+"""add user_events change feed
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-19
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision: str = "0006"
+down_revision: Union[str, None] = "0005"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "user_events",
+        sa.Column("id", sa.BigInteger, primary_key=True, autoincrement=True),
+        sa.Column("user_id", postgresql.UUID(as_uuid=True), sa.ForeignKey("users.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("xid", sa.BigInteger, nullable=False, server_default=sa.text("pg_current_xact_id()::text::bigint")),
+        sa.Column("event_type", sa.String(32), nullable=False),
+        sa.Column("entity_key", sa.String(80), nullable=False),
+        sa.Column("payload", postgresql.JSONB, nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+    )
+    op.create_index("ix_user_events_user_xid_id", "user_events", ["user_id", "xid", "id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_user_events_user_xid_id", table_name="user_events")
+    op.drop_table("user_events")
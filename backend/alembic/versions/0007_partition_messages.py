@@ -0,0 +1,133 @@
+"""partition messages by created_at
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-19
+
+Rebuilds ``messages`` as a table range-partitioned by month on ``created_at``
+(see ``app.partitions``).  Partitions are created from the oldest message's
+month through a few months ahead and existing rows are copied over, so on a
+large table run this in a maintenance window.
+
+A primary key on a partitioned table must contain the partition key, so it
+becomes ``(id, created_at)``, and ``read_receipts.message_id`` can no longer
+be a foreign key to ``messages.id``; deleting a message through the ORM still
+removes its receipts.
+"""
+from typing import Sequence, Union
+from alembic import op
+
+revision: str = "0007"
+down_revision: Union[str, None] = "0006"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+MONTHS_AHEAD = 3
+
+COLUMNS = (
+    "id, chat_id, seq, sender_id, content, image_url, is_edited, forwarded_from_id, "
+    "status, created_at, updated_at"
+)
+
+
+def _drop_foreign_keys(table: str) -> None:
+    # frees the constraint names for the table that replaces it
+    for column in ("chat_id", "sender_id", "forwarded_from_id"):
+        op.execute(f"ALTER TABLE {table} DROP CONSTRAINT messages_{column}_fkey")
+
+
+def upgrade() -> None:
+    op.drop_constraint("read_receipts_message_id_fkey", "read_receipts", type_="foreignkey")
+
+    op.execute("ALTER TABLE messages RENAME TO messages_unpartitioned")
+    op.execute("ALTER INDEX messages_pkey RENAME TO messages_unpartitioned_pkey")
+    op.execute("DROP INDEX ix_messages_chat_id, ix_messages_chat_id_seq, ix_messages_sender_id")
+    _drop_foreign_keys("messages_unpartitioned")
+
+    op.execute(
+        """
+        CREATE TABLE messages (
+            id uuid NOT NULL DEFAULT gen_random_uuid(),
+            chat_id uuid NOT NULL REFERENCES chats(id) ON DELETE CASCADE,
+            seq bigint,
+            sender_id uuid REFERENCES users(id) ON DELETE SET NULL,
+            content text,
+            image_url varchar(512),
+            is_edited boolean NOT NULL DEFAULT false,
+            forwarded_from_id uuid REFERENCES users(id) ON DELETE SET NULL,
+            status messagestatus NOT NULL DEFAULT 'sent',
+            created_at timestamptz NOT NULL DEFAULT now(),
+            updated_at timestamptz DEFAULT now(),
+            CONSTRAINT messages_pkey PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+        """
+    )
+
+    # Monthly partitions (UTC month boundaries) named messages_pYYYY_MM
+    op.execute(
+        f"""
+        DO $$
+        DECLARE m timestamp;
+        BEGIN
+            FOR m IN SELECT generate_series(
+                date_trunc('month', coalesce((SELECT min(created_at) FROM messages_unpartitioned), now()) AT TIME ZONE 'UTC'),
+                date_trunc('month', now() AT TIME ZONE 'UTC') + interval '{MONTHS_AHEAD} months',
+                interval '1 month'
+            ) LOOP
+                EXECUTE format(
+                    'CREATE TABLE %I PARTITION OF messages FOR VALUES FROM (%L) TO (%L)',
+                    'messages_p' || to_char(m, 'YYYY_MM'), m::text || '+00', (m + interval '1 month')::text || '+00'
+                );
+            END LOOP;
+        END $$
+        """
+    )
+
+    op.execute(
+        f"""
+        INSERT INTO messages ({COLUMNS})
+        SELECT id, chat_id, seq, sender_id, content, image_url, is_edited, forwarded_from_id,
+               status, coalesce(created_at, updated_at, now()), updated_at
+        FROM messages_unpartitioned
+        """
+    )
+    op.execute("DROP TABLE messages_unpartitioned")
+
+    # Created on the parent, so every partition (present and future) gets them
+    op.create_index("ix_messages_chat_id_created_at", "messages", ["chat_id", "created_at"])
+    op.create_index("ix_messages_chat_id_seq", "messages", ["chat_id", "seq"])
+    op.create_index("ix_messages_sender_id", "messages", ["sender_id"])
+
+
+def downgrade() -> None:
+    op.execute("ALTER TABLE messages RENAME TO messages_partitioned")
+    op.execute("ALTER INDEX messages_pkey RENAME TO messages_partitioned_pkey")
+    op.execute("DROP INDEX ix_messages_chat_id_created_at, ix_messages_chat_id_seq, ix_messages_sender_id")
+    _drop_foreign_keys("messages_partitioned")
+    op.execute(
+        """
+        CREATE TABLE messages (
+            id uuid PRIMARY KEY DEFAULT gen_random_uuid(),
+            chat_id uuid NOT NULL REFERENCES chats(id) ON DELETE CASCADE,
+            sender_id uuid REFERENCES users(id) ON DELETE SET NULL,
+            content text,
+            status messagestatus NOT NULL DEFAULT 'sent',
+            created_at timestamptz DEFAULT now(),
+            updated_at timestamptz DEFAULT now(),
+            image_url varchar(512),
+            is_edited boolean NOT NULL DEFAULT false,
+            forwarded_from_id uuid REFERENCES users(id) ON DELETE SET NULL,
+            seq bigint
+        )
+        """
+    )
+    op.execute(f"INSERT INTO messages ({COLUMNS}) SELECT {COLUMNS} FROM messages_partitioned")
+    op.execute("DROP TABLE messages_partitioned")
+    op.create_index("ix_messages_chat_id", "messages", ["chat_id"])
+    op.create_index("ix_messages_chat_id_seq", "messages", ["chat_id", "seq"])
+    op.create_index("ix_messages_sender_id", "messages", ["sender_id"])
+    op.execute("DELETE FROM read_receipts WHERE message_id NOT IN (SELECT id FROM messages)")
+    op.create_foreign_key(
+        "read_receipts_message_id_fkey", "read_receipts", "messages",
+        ["message_id"], ["id"], ondelete="CASCADE",
+    )
@@ -0,0 +1,62 @@
+"""member counts, read cursors and aggregated message status for large groups
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-19
+
+``chats.member_count`` is kept by statement-level triggers on
+``chat_members``, so bulk membership changes cost one UPDATE per chat.
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "0008"
+down_revision: Union[str, None] = "0007"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("chats", sa.Column("member_count", sa.Integer, server_default="0", nullable=False))
+    op.execute(
+        """
+        UPDATE chats c SET member_count = agg.n
+        FROM (SELECT chat_id, count(*) AS n FROM chat_members GROUP BY chat_id) AS agg
+        WHERE c.id = agg.chat_id
+        """
+    )
+    for op_name, sign, table in (("INSERT", "+", "NEW"), ("DELETE", "-", "OLD")):
+        func = f"chat_members_count_{op_name.lower()}"
+        op.execute(
+            f"""
+            CREATE FUNCTION {func}() RETURNS trigger LANGUAGE plpgsql AS $$
+            BEGIN
+                UPDATE chats c SET member_count = c.member_count {sign} d.n
+                FROM (SELECT chat_id, count(*) AS n FROM changed GROUP BY chat_id) AS d
+                WHERE c.id = d.chat_id;
+                RETURN NULL;
+            END $$
+            """
+        )
+        op.execute(
+            f"""
+            CREATE TRIGGER {func} AFTER {op_name} ON chat_members
+            REFERENCING {table} TABLE AS changed
+            FOR EACH STATEMENT EXECUTE FUNCTION {func}()
+            """
+        )
+
+    op.add_column("chat_members", sa.Column("last_read_seq", sa.BigInteger, server_default="0", nullable=False))
+    op.add_column("messages", sa.Column("delivered_count", sa.Integer, server_default="0", nullable=False))
+    op.add_column("messages", sa.Column("read_count", sa.Integer, server_default="0", nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column("messages", "read_count")
+    op.drop_column("messages", "delivered_count")
+    op.drop_column("chat_members", "last_read_seq")
+    for op_name in ("insert", "delete"):
+        op.execute(f"DROP TRIGGER chat_members_count_{op_name} ON chat_members")
+        op.execute(f"DROP FUNCTION chat_members_count_{op_name}()")
+    op.drop_column("chats", "member_count")
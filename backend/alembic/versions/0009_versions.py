@@ -0,0 +1,89 @@
+"""version counters on chats and users for ETags
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-19
+
+Both are bumped by triggers: ``chats.version`` on any update of the chat
+row (which every chat event does, through ``last_seq``, and membership
+changes do, through ``member_count``) and when a member's profile changes;
+``users.version`` whenever a field of ``UserOut`` changes.  Message status
+changes don't update the chat row; their code bumps ``chats.status_version``
+(migration 0014), which does.
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "0009"
+down_revision: Union[str, None] = "0008"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+PROFILE = ("phone", "username", "display_name", "bio", "avatar_url")
+
+
+def upgrade() -> None:
+    op.add_column("chats", sa.Column("version", sa.BigInteger, server_default="0", nullable=False))
+    op.add_column("users", sa.Column("version", sa.BigInteger, server_default="0", nullable=False))
+
+    op.execute(
+        """
+        CREATE FUNCTION chats_bump_version() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            NEW.version := OLD.version + 1;
+            RETURN NEW;
+        END $$
+        """
+    )
+    op.execute(
+        "CREATE TRIGGER chats_bump_version BEFORE UPDATE ON chats "
+        "FOR EACH ROW EXECUTE FUNCTION chats_bump_version()"
+    )
+
+    old = ", ".join(f"OLD.{c}" for c in (*PROFILE, "last_seen"))
+    new = ", ".join(f"NEW.{c}" for c in (*PROFILE, "last_seen"))
+    op.execute(
+        f"""
+        CREATE FUNCTION users_bump_version() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            IF ({old}) IS DISTINCT FROM ({new}) THEN
+                NEW.version := OLD.version + 1;
+            END IF;
+            RETURN NEW;
+        END $$
+        """
+    )
+    op.execute(
+        "CREATE TRIGGER users_bump_version BEFORE UPDATE ON users "
+        "FOR EACH ROW EXECUTE FUNCTION users_bump_version()"
+    )
+
+    # chat payloads embed member profiles (but not last_seen, which changes on every disconnect)
+    old = ", ".join(f"OLD.{c}" for c in PROFILE)
+    new = ", ".join(f"NEW.{c}" for c in PROFILE)
+    op.execute(
+        """
+        CREATE FUNCTION users_bump_chat_versions() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            UPDATE chats SET version = version + 1
+            WHERE id IN (SELECT chat_id FROM chat_members WHERE user_id = NEW.id);
+            RETURN NULL;
+        END $$
+        """
+    )
+    op.execute(
+        f"""
+        CREATE TRIGGER users_bump_chat_versions AFTER UPDATE ON users
+        FOR EACH ROW WHEN (({old}) IS DISTINCT FROM ({new}))
+        EXECUTE FUNCTION users_bump_chat_versions()
+        """
+    )
+
+
+def downgrade() -> None:
+    for table, name in (("users", "users_bump_chat_versions"), ("users", "users_bump_version"), ("chats", "chats_bump_version")):
+        op.execute(f"DROP TRIGGER {name} ON {table}")
+        op.execute(f"DROP FUNCTION {name}()")
+    op.drop_column("users", "version")
+    op.drop_column("chats", "version")
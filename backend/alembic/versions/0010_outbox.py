@@ -0,0 +1,39 @@
+"""notification outbox
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-19
+
+Socket notifications written with the change that causes them and sent
+after commit by each worker's dispatcher (see app.outbox).  Rows are only
+kept for ``OUTBOX_RETENTION`` seconds.
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision: str = "0010"
+down_revision: Union[str, None] = "0009"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "outbox",
+        sa.Column("id", sa.BigInteger, primary_key=True, autoincrement=True),
+        sa.Column("xid", sa.BigInteger, nullable=False, server_default=sa.text("pg_current_xact_id()::text::bigint")),
+        sa.Column("chat_id", postgresql.UUID(as_uuid=True), nullable=True),
+        sa.Column("user_ids", postgresql.ARRAY(postgresql.UUID(as_uuid=True)), nullable=True),
+        sa.Column("payload", postgresql.JSONB, nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+    )
+    op.create_index("ix_outbox_xid_id", "outbox", ["xid", "id"])
+    op.create_index("ix_outbox_created_at", "outbox", ["created_at"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_outbox_created_at", table_name="outbox")
+    op.drop_index("ix_outbox_xid_id", table_name="outbox")
+    op.drop_table("outbox")
@@ -0,0 +1,23 @@
+"""chat_events retention
+
+Revision ID: 0011
+Revises: 0010
+Create Date: 2026-10-19
+
+``chat_events`` are pruned by age (see ``app.events.prune_events``).
+"""
+from typing import Sequence, Union
+from alembic import op
+
+revision: str = "0011"
+down_revision: Union[str, None] = "0010"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index("ix_chat_events_created_at", "chat_events", ["created_at"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_chat_events_created_at", table_name="chat_events")
@@ -0,0 +1,34 @@
+"""user_events retention
+
+Revision ID: 0012
+Revises: 0011
+Create Date: 2026-10-19
+
+``user_events`` are pruned by age like ``chat_events``.  ``prune_horizons``
+remembers the newest cursor deleted, so a sync from before it is told to
+reload instead of silently missing events.
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "0012"
+down_revision: Union[str, None] = "0011"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index("ix_user_events_created_at", "user_events", ["created_at"])
+    op.create_table(
+        "prune_horizons",
+        sa.Column("name", sa.String(32), primary_key=True),
+        sa.Column("xid", sa.BigInteger, nullable=False),
+        sa.Column("id", sa.BigInteger, nullable=False),
+        sa.Column("pruned_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("prune_horizons")
+    op.drop_index("ix_user_events_created_at", table_name="user_events")
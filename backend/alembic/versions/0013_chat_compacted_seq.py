@@ -0,0 +1,38 @@
+"""chats.compacted_seq
+
+Revision ID: 0013
+Revises: 0012
+Create Date: 2026-10-19
+
+The last ``seq`` moved into segment files (see app.segments), 0 for chats
+never compacted, so reading history only looks for segments of chats that
+have them.  Filled in from the files already in ``SEGMENT_DIR``.
+"""
+import os
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+from app.config import settings
+
+revision: str = "0013"
+down_revision: Union[str, None] = "0012"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("chats", sa.Column("compacted_seq", sa.BigInteger, server_default="0", nullable=False))
+    if not os.path.isdir(settings.SEGMENT_DIR):
+        return
+    for chat_id in os.listdir(settings.SEGMENT_DIR):
+        names = [n for n in os.listdir(os.path.join(settings.SEGMENT_DIR, chat_id)) if n.endswith(".seg")]
+        if names:
+            last = max(int(n[:-4].partition("-")[2]) for n in names)
+            op.execute(sa.text("UPDATE chats SET compacted_seq = :last WHERE id = CAST(:id AS uuid)").bindparams(
+                last=last, id=chat_id,
+            ))
+
+
+def downgrade() -> None:
+    op.drop_column("chats", "compacted_seq")
@@ -0,0 +1,28 @@
+"""chats.status_version
+
+Revision ID: 0014
+Revises: 0013
+Create Date: 2026-10-19
+
+Counts changes to the status (and large-group counts) of the chat's messages,
+which live in ``messages`` and so don't touch the chat row by themselves.
+Bumped by the code making them (``app.large_groups.bump_status_version``);
+updating the row bumps ``chats.version`` too, so chat ETags change with the
+last message's status.
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "0014"
+down_revision: Union[str, None] = "0013"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("chats", sa.Column("status_version", sa.BigInteger, server_default="0", nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column("chats", "status_version")
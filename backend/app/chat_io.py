@@ -0,0 +1,294 @@
+"""Streaming chat export and bulk import."""
+
+import argparse
+import asyncio
+import sys
+import uuid
+import zlib
+from datetime import datetime, timezone
+from typing import AsyncIterator, Dict, List, Optional
+
+import orjson
+from sqlalchemy import or_, select
+from sqlalchemy.ext.asyncio import AsyncEngine
+from starlette.concurrency import run_in_threadpool
+
+from app.config import settings
+from app.events import next_chat_seq
+from app.ids import uuid7
+from app.models import Chat, Message, User, chat_members
+from app.partitions import ensure_partitions, month_start
+from app.segments import Segment, segment_paths, tombstone_seqs
+from app.serializers import MESSAGE_RECORD_FIELDS, dumps, message_records_query
+
+CHUNK_SIZE = 64 * 1024
+FORMAT_VERSION = 1
+
+# COPY column order; ``updated_at`` is set to ``created_at``
+COPY_COLUMNS = (
+    "id", "chat_id", "seq", "sender_id", "content", "image_url", "is_edited",
+    "forwarded_from_id", "status", "created_at", "updated_at",
+)
+
+
+class ImportFailed(ValueError):
+    """An import file (or one of its batches) that couldn't be loaded."""
+
+
+# ---------- export ----------
+
+async def _export_records(engine: AsyncEngine, chat_id: uuid.UUID) -> AsyncIterator[dict]:
+    async with engine.connect() as conn:
+        chat = (await conn.execute(select(Chat.__table__).where(Chat.id == chat_id))).one()
+        member_ids = (await conn.execute(
+            select(chat_members.c.user_id).where(chat_members.c.chat_id == chat_id)
+        )).scalars().all()
+        yield {
+            "type": "chat",
+            "version": FORMAT_VERSION,
+            "id": chat.id,
+            "chat_type": chat.chat_type,
+            "title": chat.title,
+            "avatar_url": chat.avatar_url,
+            "created_at": chat.created_at,
+            "member_ids": member_ids,
+            "exported_at": datetime.now(timezone.utc),
+        }
+
+        deleted = set((await conn.execute(select(tombstone_seqs(chat_id)))).scalar_one())
+        after = 0
+        for _, last, path in segment_paths(chat_id):
+            segment = await run_in_threadpool(Segment, path)
+            seq = segment.fields.index("seq")
+            for i in range(segment.blocks):
+                for record in await run_in_threadpool(segment.block, i):
+                    if record[seq] not in deleted:
+                        yield {"type": "message", **dict(zip(segment.fields, record))}
+            after = last
+
+        # rows a crashed compaction already wrote to a segment are skipped
+        result = await conn.stream(
+            message_records_query()
+            .where(Message.chat_id == chat_id, or_(Message.seq > after, Message.seq.is_(None)))
+            .order_by(Message.seq.asc().nulls_last(), Message.created_at)
+            .execution_options(yield_per=1000)
+        )
+        async for row in result:
+            yield {"type": "message", **dict(zip(MESSAGE_RECORD_FIELDS, row))}
+
+
+async def export_chat(engine: AsyncEngine, chat_id: uuid.UUID, gzip: bool = False) -> AsyncIterator[bytes]:
+    """NDJSON export of a chat in ``CHUNK_SIZE`` chunks, gzipped if ``gzip``."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if gzip else None
+    buffer: List[bytes] = []
+    size = 0
+    async for record in _export_records(engine, chat_id):
+        line = dumps(record) + b"\n"
+        buffer.append(line)
+        size += len(line)
+        if size >= CHUNK_SIZE:
+            chunk = b"".join(buffer)
+            buffer, size = [], 0
+            if compressor is not None:
+                chunk = compressor.compress(chunk)
+            if chunk:
+                yield chunk
+    chunk = b"".join(buffer)
+    if compressor is not None:
+        chunk = compressor.compress(chunk) + compressor.flush()
+    if chunk:
+        yield chunk
+
+
+# ---------- import ----------
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Split a byte stream into lines, gunzipping it if it starts with the gzip magic."""
+    decompressor = None
+    pending = b""
+    first = True
+    async for chunk in chunks:
+        if first:
+            first = False
+            if chunk[:2] == b"\x1f\x8b":
+                decompressor = zlib.decompressobj(47)
+        if decompressor is not None:
+            chunk = decompressor.decompress(chunk)
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            yield line
+    if decompressor is not None:
+        pending += decompressor.flush()
+    if pending:
+        yield pending
+
+
+def _parse_batch(lines: List[bytes], first_line: int) -> List[dict]:
+    """Decode message lines into COPY-ready dicts; other record types are skipped."""
+    messages = []
+    now = datetime.now(timezone.utc)
+    for n, line in enumerate(lines, first_line):
+        if not line.strip():
+            continue
+        try:
+            record = orjson.loads(line)
+            if record.get("type", "message") != "message":
+                continue
+            created_at = record.get("created_at")
+            created_at = datetime.fromisoformat(created_at) if created_at else now
+            if created_at.tzinfo is None:
+                created_at = created_at.replace(tzinfo=timezone.utc)
+            created_at = min(created_at, now)
+            messages.append({
+                "id": uuid7(),
+                "sender_id": uuid.UUID(record["sender_id"]) if record.get("sender_id") else None,
+                "content": record.get("content"),
+                "image_url": record.get("image_url"),
+                "is_edited": bool(record.get("is_edited", False)),
+                "forwarded_from_id": uuid.UUID(record["forwarded_from_id"]) if record.get("forwarded_from_id") else None,
+                "status": record.get("status") or "sent",
+                "created_at": created_at,
+            })
+        except (ValueError, TypeError, AttributeError) as exc:
+            raise ImportFailed(f"line {n}: {exc}") from exc
+    return messages
+
+
+async def _load_batch(engine: AsyncEngine, chat_id: uuid.UUID, messages: List[dict], state: Dict) -> int:
+    """COPY one batch in its own transaction; returns the last seq assigned.
+
+    ``state`` carries what the batches before it covered: the oldest
+    partition month, the last seq and the last ``created_at``.
+    """
+    # seq and created_at must agree (compaction and paging rely on it): a
+    # date earlier than the message before it becomes that message's
+    floor = state.get("created_at")
+    for m in messages:
+        if floor is not None and m["created_at"] < floor:
+            m["created_at"] = floor
+        floor = m["created_at"]
+    async with engine.begin() as conn:
+        user_ids = {m[k] for m in messages for k in ("sender_id", "forwarded_from_id") if m[k]}
+        known = set()
+        if user_ids:
+            known = set((await conn.execute(select(User.id).where(User.id.in_(user_ids)))).scalars())
+        oldest = min(m["created_at"] for m in messages)
+        if state.get("from") is None or month_start(oldest) < state["from"]:
+            await ensure_partitions(conn, start=oldest)
+            state["from"] = month_start(oldest)
+
+        last = await next_chat_seq(conn, chat_id, count=len(messages))
+        seq = last - len(messages)
+        if seq != state.get("seq", 0):
+            raise ImportFailed("the chat got other messages during the import")
+        records = []
+        for m in messages:
+            seq += 1
+            records.append((
+                m["id"], chat_id, seq,
+                m["sender_id"] if m["sender_id"] in known else None,
+                m["content"], m["image_url"], m["is_edited"],
+                m["forwarded_from_id"] if m["forwarded_from_id"] in known else None,
+                m["status"], m["created_at"], m["created_at"],
+            ))
+        raw = await conn.get_raw_connection()
+        await raw.driver_connection.copy_records_to_table("messages", records=records, columns=COPY_COLUMNS)
+    state["seq"], state["created_at"] = last, floor
+    return last
+
+
+async def import_chat(
+    engine: AsyncEngine,
+    chat_id: uuid.UUID,
+    lines: AsyncIterator[bytes],
+    batch_size: int = settings.IMPORT_BATCH_SIZE,
+) -> dict:
+    """Load NDJSON message lines into ``chat_id``, which must have no history
+    yet.  Returns counts and the seq range.
+
+    Imported messages get the chat's first seqs in file order, so they can't
+    go into a chat whose seqs are already taken by newer messages.  No chat
+    events are recorded: members see the history when they next load the
+    chat, and a reconnecting socket gets the chat in ``reset`` (its log has a
+    gap where the import's seqs are).
+    """
+    async with engine.connect() as conn:
+        last = (await conn.execute(select(Chat.last_seq).where(Chat.id == chat_id))).scalar_one_or_none()
+    if last is None:
+        raise ImportFailed("chat not found")
+    if last:
+        raise ImportFailed("the chat already has messages; import into a new chat")
+    imported = 0
+    first_seq: Optional[int] = None
+    last_seq: Optional[int] = None
+    state: Dict = {}
+    batch: List[bytes] = []
+    line_no = 1
+
+    async def flush():
+        nonlocal imported, first_seq, last_seq, batch, line_no
+        messages = await run_in_threadpool(_parse_batch, batch, line_no)
+        line_no += len(batch)
+        batch = []
+        if not messages:
+            return
+        try:
+            last_seq = await _load_batch(engine, chat_id, messages, state)
+        except Exception as exc:
+            raise ImportFailed(f"{exc} ({imported} messages were imported before this batch)") from exc
+        if first_seq is None:
+            first_seq = last_seq - len(messages) + 1
+        imported += len(messages)
+
+    async for line in lines:
+        batch.append(line)
+        if len(batch) >= batch_size:
+            await flush()
+    if batch:
+        await flush()
+    return {"imported": imported, "first_seq": first_seq, "last_seq": last_seq}
+
+
+# ---------- CLI ----------
+
+async def _file_chunks(path: str) -> AsyncIterator[bytes]:
+    with open(path, "rb") as f:
+        while True:
+            chunk = await run_in_threadpool(f.read, 1024 * 1024)
+            if not chunk:
+                return
+            yield chunk
+
+
+async def _main(args) -> None:
+    from app.database import engine
+
+    chat_id = uuid.UUID(args.chat_id)
+    try:
+        if args.command == "export":
+            out = open(args.output, "wb") if args.output else sys.stdout.buffer
+            async for chunk in export_chat(engine, chat_id, gzip=args.gzip):
+                out.write(chunk)
+            out.flush()
+        else:
+            print(await import_chat(engine, chat_id, iter_lines(_file_chunks(args.file))))
+    finally:
+        await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export or import a chat's messages as NDJSON")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export")
+    export.add_argument("chat_id")
+    export.add_argument("-o", "--output", help="file to write (default stdout)")
+    export.add_argument("--gzip", action="store_true")
+    imp = sub.add_parser("import")
+    imp.add_argument("chat_id")
+    imp.add_argument("file", help="NDJSON file, optionally gzipped")
+    asyncio.run(_main(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -17,6 +17,127 @@ class Settings(BaseSettings):
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 7  # 7 days
     UPLOAD_DIR: str = "uploads"
     FRONTEND_URL: str = "http://localhost:5173"
+    LOG_LEVEL: str = "INFO"
+    WS_REPLAY_LIMIT: int = 500  # max missed events replayed per chat on reconnect
+    WS_REPLAY_MAX_CHATS: int = 500
+    WS_BATCH_MAX_OPS: int = 500  # ops handled per "batch" frame; the rest are dropped
+
+    # HTTP response compression (gzip always, brotli if the package is installed)
+    COMPRESSION_ENABLED: bool = True
+    COMPRESSION_MIN_SIZE: int = 1024  # bytes; smaller bodies are sent as-is
+    COMPRESSION_GZIP_LEVEL: int = 6
+    COMPRESSION_BROTLI_ENABLED: bool = True
+    COMPRESSION_BROTLI_QUALITY: int = 4
+
+    # WebSocket permessage-deflate (applied when served via `python -m app.server`)
+    WS_DEFLATE_ENABLED: bool = True
+    WS_DEFLATE_LEVEL: int = 6
+    WS_DEFLATE_MEM_LEVEL: int = 8
+    WS_DEFLATE_WINDOW_BITS: int = 15  # 9..15; lower trades ratio for per-socket memory
+    WS_DEFLATE_MIN_SIZE: int = 256  # bytes; smaller frames are sent uncompressed
+
+    # Prometheus metrics at GET /metrics
+    METRICS_ENABLED: bool = True
+    METRICS_LOOP_LAG_INTERVAL: float = 0.5  # seconds between event-loop lag samples
+
+    # Connection pool, per worker process: the server sees up to
+    # workers x (DB_POOL_SIZE + DB_MAX_OVERFLOW) connections per engine
+    DB_POOL_SIZE: int = 20
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30  # seconds to wait for a free connection before failing
+    DB_POOL_RECYCLE: int = 1800  # seconds; older connections are replaced on checkout, -1 never
+    DB_POOL_PRE_PING: bool = False  # test each checkout (survives server/bouncer restarts, costs a round trip)
+    DB_STATEMENT_CACHE_SIZE: int = 100  # prepared statements cached per connection
+    DB_PGBOUNCER: bool = False  # behind a transaction-mode pooler: never reuse prepared statements
+    DB_APPLICATION_NAME: str = "messenger"  # shown in pg_stat_activity
+
+    # Read replicas for read-only endpoints (see app.database)
+    DATABASE_REPLICA_URLS: str = ""  # comma-separated; empty sends everything to DATABASE_URL
+    REPLICA_MAX_LAG: float = 5.0  # seconds behind the primary before a replica stops getting reads
+    REPLICA_CHECK_INTERVAL: float = 2.0
+    REPLICA_CHECK_TIMEOUT: float = 1.0
+    READ_YOUR_WRITES_SECONDS: float = 10.0  # a user's reads stay on the primary this long after a write
+
+    # Large groups (see app.large_groups)
+    LARGE_GROUP_MIN_MEMBERS: int = 1000
+    LARGE_GROUP_READ_WINDOW: int = 200  # newest messages a read is counted toward
+    STATUS_FLUSH_INTERVAL: float = 2.0  # seconds between writes of aggregated delivered/read counts
+    WS_FANOUT_SHARD_SIZE: int = 500  # recipients per concurrent send task
+    CHAT_MEMBER_PREVIEW: int = 10  # members embedded in each ChatOut
+
+    # Newest messages of active chats kept in memory (see app.recent)
+    MESSAGE_CACHE_PER_CHAT: int = 100  # 0 turns the cache off
+    MESSAGE_CACHE_MAX_BYTES: int = 32 * 1024 * 1024  # encoded size of all cached messages
+
+    # Event log retention (see app.events.prune_events). Chats keep at least
+    # their newest WS_REPLAY_LIMIT events; older cursors get a reset
+    EVENT_RETENTION_DAYS: int = 30  # chat and user events older than this are deleted; 0 keeps everything
+    EVENT_PRUNE_INTERVAL: float = 3600  # seconds
+    EVENT_PRUNE_BATCH: int = 10_000  # rows per DELETE
+
+    # Socket notifications written by REST handlers (see app.outbox)
+    OUTBOX_POLL_INTERVAL: float = 0.5  # seconds; commits on the same worker wake the dispatcher at once
+    OUTBOX_BATCH_SIZE: int = 500  # rows per dispatcher read
+    OUTBOX_RETENTION: int = 300  # seconds sent rows are kept
+
+    # Bulk profile lookup (see app.profiles)
+    USER_LOOKUP_MAX: int = 200  # ids per GET /api/users or resolve_users frame
+    PROFILE_CACHE_TTL: float = 60.0
+    PROFILE_CACHE_SIZE: int = 10_000
+
+    # Per-user admission control (see app.ratelimit). Limits are
+    # "<requests per second>/<burst>" keyed by "http" (every API request),
+    # "http:<endpoint name>" and "ws:<frame type>"; set as JSON to override
+    # some of them, the others keep these defaults
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMITS: dict[str, str] = {
+        "http": "20/60",
+        "http:login_password": "1/10",  # anonymous endpoints count per client IP
+        "http:verify_sms_code": "1/10",
+        "http:request_sms_code": "0.2/3",
+        "http:search_users": "2/10",
+        "http:send_message": "5/20",
+        "ws:connect": "1/10",
+        "ws:message": "5/20",
+        "ws:typing": "2/10",
+        "ws:read": "20/60",
+        "ws:batch": "2/10",  # plus a ws:message token per message in the batch
+        "ws:resolve_users": "2/10",
+    }
+    # Load shedding: while the average DB pool checkout over the last
+    # OVERLOAD_WINDOW seconds waits longer than OVERLOAD_POOL_WAIT, API
+    # requests get 503 and new sockets are closed, both with a retry hint
+    OVERLOAD_SHEDDING_ENABLED: bool = True
+    OVERLOAD_POOL_WAIT: float = 0.5  # seconds
+    OVERLOAD_WINDOW: float = 5.0  # seconds
+    OVERLOAD_RETRY_AFTER: int = 5  # seconds suggested to clients
+
+    # Raise instead of logging when an endpoint exceeds its @query_budget (tests/CI)
+    QUERY_BUDGET_STRICT: bool = False
+
+    # Monthly partitions of `messages` (see app.partitions)
+    PARTITION_MAINTENANCE_ENABLED: bool = True
+    PARTITION_MAINTENANCE_INTERVAL: float = 3600  # seconds
+    MESSAGE_PARTITIONS_AHEAD: int = 3  # months created in advance
+    MESSAGE_RETENTION_MONTHS: int = 0  # older months are detached to the archive schema once compacted; 0 keeps everything
+    MESSAGE_ARCHIVE_SCHEMA: str = "archive"
+
+    # Compressed per-chat segment files for cold history (see app.segments)
+    SEGMENT_DIR: str = "segments"
+    MESSAGE_HOT_DAYS: int = 0  # messages older than this are compacted out of Postgres; 0 disables
+    SEGMENT_BLOCK_MESSAGES: int = 256  # messages per compressed block (the unit of a read)
+    SEGMENT_MIN_MESSAGES: int = 500  # don't write segments smaller than this
+    SEGMENT_OPEN_FILES: int = 256  # memory-mapped segments kept open per process
+
+    # Chat export / bulk import (see app.chat_io)
+    IMPORT_BATCH_SIZE: int = 10000  # messages per COPY and transaction
+
+    # Event-loop watchdog and /api/admin diagnostics
+    LOOP_WATCHDOG_ENABLED: bool = True
+    LOOP_WATCHDOG_THRESHOLD: float = 0.1  # seconds the loop may be held before the stack is logged
+    LOOP_WATCHDOG_INTERVAL: float = 0.02
+    PROFILE_MAX_SECONDS: int = 60
+    ADMIN_USER_IDS: str = ""  # comma-separated user UUIDs allowed to use /api/admin and chat import
 
     @field_validator("DATABASE_URL", mode="before")
     @classmethod
@@ -24,6 +145,17 @@ class Settings(BaseSettings):
         """Always ensure the URL uses asyncpg driver."""
         return _build_db_url(v, "asyncpg")
 
+    @field_validator("RATE_LIMITS", mode="after")
+    @classmethod
+    def merge_rate_limits(cls, v: dict[str, str]) -> dict[str, str]:
+        """Overriding one limit must not drop the rest (login and SMS throttling)."""
+        return {**cls.model_fields["RATE_LIMITS"].default, **v}
+
+    @property
+    def DATABASE_REPLICA_URL_LIST(self) -> list[str]:
+        """Replica URLs from ``DATABASE_REPLICA_URLS``, with the asyncpg driver."""
+        return [_build_db_url(u.strip(), "asyncpg") for u in self.DATABASE_REPLICA_URLS.split(",") if u.strip()]
+
     @property
     def DATABASE_URL_SYNC(self) -> str:
         """Derive a sync URL (psycopg2) from the async one."""
@@ -1,12 +1,228 @@
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
+"""Engines and sessions: the primary, plus optional read replicas."""
+
+import asyncio
+import collections
+import itertools
+import logging
+import time
+import uuid
+from typing import Deque, Dict, List, Optional, Tuple
+
+from sqlalchemy import event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine, async_sessionmaker
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
 from app.base import Base  # re-export for backward compat
 from app.config import settings
 
-engine = create_async_engine(settings.DATABASE_URL, echo=False, pool_size=20, max_overflow=10)
+logger = logging.getLogger(__name__)
+
+
+class PoolWaits:
+    """How long recent connection checkouts waited for a free connection."""
+
+    def __init__(self, window: float):
+        self.window = window
+        self._waits: Deque[Tuple[float, float]] = collections.deque()
+
+    def record(self, wait: float) -> None:
+        now = time.monotonic()
+        self._waits.append((now, wait))
+        while self._waits and self._waits[0][0] < now - self.window:
+            self._waits.popleft()
+
+    def average(self) -> float:
+        """Mean wait over the last ``window`` seconds (0 if nothing was checked out)."""
+        cutoff = time.monotonic() - self.window
+        recent = [w for t, w in self._waits if t >= cutoff]
+        return sum(recent) / len(recent) if recent else 0.0
+
+
+pool_waits = PoolWaits(settings.OVERLOAD_WINDOW)
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Records each checkout's wait in ``pool_waits`` (what load shedding watches)."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            pool_waits.record(time.perf_counter() - start)
+
+
+def engine_options() -> dict:
+    """``create_async_engine`` arguments from the ``DB_*`` settings.
+
+    With ``DB_PGBOUNCER`` consecutive transactions may run on different
+    server connections, so a statement prepared on one isn't there for the
+    next: both caches (asyncpg's own and SQLAlchemy's adapter) are turned off
+    and each statement gets a unique name so two never collide on a shared
+    server connection.
+    """
+    connect_args: dict = {"server_settings": {"application_name": settings.DB_APPLICATION_NAME}}
+    if settings.DB_PGBOUNCER:
+        connect_args.update(
+            statement_cache_size=0,
+            prepared_statement_cache_size=0,
+            prepared_statement_name_func=lambda: f"__asyncpg_{uuid.uuid4()}__",
+        )
+    else:
+        connect_args.update(
+            statement_cache_size=settings.DB_STATEMENT_CACHE_SIZE,
+            prepared_statement_cache_size=settings.DB_STATEMENT_CACHE_SIZE,
+        )
+    return {
+        "echo": False,
+        "poolclass": TimedQueuePool,
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+        "connect_args": connect_args,
+    }
+
+
+engine = create_async_engine(settings.DATABASE_URL, **engine_options())
 async_session = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
 
 async def get_db() -> AsyncSession:  # type: ignore[misc]
     async with async_session() as session:
         yield session
+
+
+# ---------- read replicas ----------
+
+# 0 when everything received has been replayed (an idle primary sends nothing,
+# so the last replay timestamp alone would make a caught-up replica look stale)
+_LAG_SQL = text(
+    """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE coalesce(extract(epoch FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+    """
+)
+
+
+class Replica:
+    def __init__(self, url: str):
+        self.engine: AsyncEngine = create_async_engine(url, **engine_options())
+        parsed = make_url(url)
+        self.name = f"{parsed.host}:{parsed.port or 5432}/{parsed.database}"
+        self.healthy = False
+        self.lag: Optional[float] = None
+
+    async def check(self) -> None:
+        try:
+            async with self.engine.connect() as conn:
+                lag = await asyncio.wait_for(conn.scalar(_LAG_SQL), settings.REPLICA_CHECK_TIMEOUT)
+            self.lag = float(lag)
+            self.healthy = True
+        except Exception as exc:
+            if self.healthy:
+                logger.warning("replica %s failed its health check: %s", self.name, exc)
+            self.healthy = False
+
+    @property
+    def usable(self) -> bool:
+        return self.healthy and self.lag is not None and self.lag <= settings.REPLICA_MAX_LAG
+
+
+class ReplicaSet:
+    def __init__(self, urls: List[str]):
+        self.replicas = [Replica(url) for url in urls]
+        self._next = itertools.count()
+        self._recent_writers: Dict[uuid.UUID, float] = {}
+
+    def pick(self) -> Optional[AsyncEngine]:
+        """A usable replica's engine, round-robin, or ``None`` for the primary."""
+        usable = [r for r in self.replicas if r.usable]
+        if not usable:
+            return None
+        return usable[next(self._next) % len(usable)].engine
+
+    async def monitor(self, interval: float = settings.REPLICA_CHECK_INTERVAL):
+        """Health- and lag-check every replica every ``interval`` seconds."""
+        while True:
+            await asyncio.gather(*(r.check() for r in self.replicas))
+            await asyncio.sleep(interval)
+
+    def wrote(self, user_id: uuid.UUID) -> None:
+        self._recent_writers[user_id] = time.monotonic() + settings.READ_YOUR_WRITES_SECONDS
+        if len(self._recent_writers) > 100_000:
+            now = time.monotonic()
+            self._recent_writers = {u: t for u, t in self._recent_writers.items() if t > now}
+
+    def wrote_recently(self, user_id: uuid.UUID) -> bool:
+        deadline = self._recent_writers.get(user_id)
+        return deadline is not None and deadline > time.monotonic()
+
+    async def dispose(self) -> None:
+        for r in self.replicas:
+            await r.engine.dispose()
+
+
+replicas = ReplicaSet(settings.DATABASE_REPLICA_URL_LIST)
+
+
+class RoutingSession(Session):
+    """Reads go to ``info["replica"]`` (a sync engine) unless the session is
+    flushing or pinned with :func:`use_primary`."""
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        replica = self.info.get("replica")
+        if replica is None or self._flushing or self.info.get("primary"):
+            return engine.sync_engine
+        return replica
+
+
+read_session = async_sessionmaker(class_=AsyncSession, sync_session_class=RoutingSession, expire_on_commit=False)
+
+
+def use_primary(session: AsyncSession) -> None:
+    session.info["primary"] = True
+
+
+def on_replica(session: AsyncSession) -> bool:
+    return session.info.get("replica") is not None and not session.info.get("primary")
+
+
+def read_engine(user_id: Optional[uuid.UUID] = None) -> AsyncEngine:
+    """Engine for a standalone read on behalf of ``user_id`` (e.g. a streamed export)."""
+    if user_id is not None and replicas.wrote_recently(user_id):
+        return engine
+    return replicas.pick() or engine
+
+
+async def get_read_db() -> AsyncSession:  # type: ignore[misc]
+    async with read_session() as session:
+        replica = replicas.pick()
+        if replica is not None:
+            session.info["replica"] = replica.sync_engine
+        yield session
+
+
+# A session that wrote and commits marks its user (``info["user_id"]``, set
+# by authentication) so their next reads on this process see the write.
+
+@event.listens_for(Session, "after_flush")
+def _after_flush(session, flush_context):
+    session.info["wrote"] = True
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _on_execute(orm_execute_state):
+    if not orm_execute_state.is_select:
+        orm_execute_state.session.info["wrote"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(session):
+    if session.info.pop("wrote", False) and session.info.get("user_id") is not None:
+        replicas.wrote(session.info["user_id"])
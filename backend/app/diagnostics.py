@@ -0,0 +1,117 @@
+"""Event-loop stall detection and an on-demand sampling profiler."""
+
+import asyncio
+import logging
+import sys
+import threading
+import time
+from collections import Counter, deque
+from types import FrameType
+from typing import Deque, Dict, List, Optional
+
+from app.config import settings
+from app.metrics import LOOP_STALLS
+
+logger = logging.getLogger(__name__)
+
+
+def _frame_label(frame: FrameType) -> str:
+    code = frame.f_code
+    module = frame.f_globals.get("__name__", "?")
+    return f"{module}:{code.co_name}:{frame.f_lineno}"
+
+
+def _stack(frame: Optional[FrameType]) -> List[str]:
+    """Frames of a stack, outermost first."""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.reverse()
+    return labels
+
+
+class LoopWatchdog:
+    def __init__(self, threshold: float, interval: float, keep: int = 50):
+        self.threshold = threshold
+        self.interval = interval
+        self.stalls: Deque[Dict] = deque(maxlen=keep)
+        self._beat = time.monotonic()
+        self._loop_thread: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stop = threading.Event()
+
+    async def _heartbeat(self):
+        while True:
+            self._beat = time.monotonic()
+            await asyncio.sleep(self.interval)
+
+    def _watch(self):
+        stall = None
+        while not self._stop.wait(self.interval):
+            beat = self._beat
+            if stall is not None and beat != stall["beat"]:
+                # loop is back: the heartbeat that ran next bounds the stall
+                stall["duration"] = round(beat - stall["beat"], 3)
+                stall = None
+            blocked = time.monotonic() - beat
+            if stall is not None or blocked < self.threshold:
+                continue
+            stack = _stack(sys._current_frames().get(self._loop_thread))
+            stall = {"at": time.time(), "beat": beat, "duration": None, "stack": stack}
+            self.stalls.append(stall)
+            LOOP_STALLS.inc()
+            logger.warning(
+                "event loop blocked for %.0f ms so far, stack:\n  %s",
+                blocked * 1000, "\n  ".join(stack),
+            )
+
+    def start(self):
+        self._stop.clear()
+        self._beat = time.monotonic()
+        self._loop_thread = threading.get_ident()
+        self._task = asyncio.create_task(self._heartbeat())
+        threading.Thread(target=self._watch, name="loop-watchdog", daemon=True).start()
+
+    async def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+watchdog = LoopWatchdog(settings.LOOP_WATCHDOG_THRESHOLD, settings.LOOP_WATCHDOG_INTERVAL)
+
+
+# ---------- sampling profiler ----------
+
+_profile_lock = threading.Lock()
+
+
+class ProfilerBusy(RuntimeError):
+    pass
+
+
+def sample_stacks(thread_id: Optional[int], seconds: float, interval: float) -> str:
+    """Sample ``thread_id`` (every thread except this one if ``None``) and
+    return collapsed stacks.  Blocking; run it in a worker thread."""
+    if not _profile_lock.acquire(blocking=False):
+        raise ProfilerBusy("a profile is already running")
+    try:
+        me = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        counts: Counter = Counter()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            for ident, frame in sys._current_frames().items():
+                if ident == me or (thread_id is not None and ident != thread_id):
+                    continue
+                stack = _stack(frame)
+                if thread_id is None:
+                    stack.insert(0, names.get(ident, str(ident)))
+                counts[";".join(stack)] += 1
+            time.sleep(interval)
+        return "".join(f"{stack} {n}\n" for stack, n in counts.most_common())
+    finally:
+        _profile_lock.release()
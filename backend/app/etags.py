@@ -0,0 +1,41 @@
+"""Conditional GET for chats and profiles."""
+
+import hashlib
+from typing import Any, Iterable
+
+from fastapi import Response
+from starlette.requests import HTTPConnection
+
+# clients may cache but must revalidate every time
+CACHE_CONTROL = "private, no-cache"
+
+
+def etag(*parts: Any) -> str:
+    """Weak ETag over ``parts`` (ids, versions, query flags)."""
+    digest = hashlib.blake2b(repr(parts).encode(), digest_size=12).hexdigest()
+    return f'W/"{digest}"'
+
+
+def collection_etag(kind: str, versions: Iterable[tuple], *extra: Any) -> str:
+    """ETag of a list response from its ``(id, version)`` pairs, in order."""
+    return etag(kind, *extra, *((str(i), v) for i, v in versions))
+
+
+def matches(request: HTTPConnection, tag: str) -> bool:
+    """Whether ``If-None-Match`` names ``tag`` (weak comparison, as RFC 9110 asks for GET)."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    bare = tag.removeprefix("W/")
+    return any(t.strip().removeprefix("W/") == bare for t in header.split(","))
+
+
+def not_modified(tag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": tag, "Cache-Control": CACHE_CONTROL})
+
+
+def set_etag(response: Response, tag: str) -> None:
+    response.headers["ETag"] = tag
+    response.headers["Cache-Control"] = CACHE_CONTROL
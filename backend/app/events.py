@@ -0,0 +1,357 @@
+"""Event logs: per-chat sequencing/replay and the per-user change feed."""
+
+import asyncio
+import logging
+import uuid
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from sqlalchemy import (
+    CompoundSelect, Integer, Select, String, and_, column, delete, func, insert, literal, or_, select, text, true,
+    tuple_, union, update, values,
+)
+from sqlalchemy.dialects.postgresql import JSONB, insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from app.config import settings
+from app import recent
+from app.large_groups import small_chat
+from app.models import Chat, ChatEvent, PruneHorizon, UserEvent, chat_members
+
+logger = logging.getLogger(__name__)
+
+
+async def next_chat_seq(db: AsyncSession, chat_id: uuid.UUID, count: int = 1) -> int:
+    """Allocate the next sequence number for a chat.
+
+    The row lock taken by the UPDATE serializes writers of the same chat until
+    commit, so numbers are gapless and match commit order.  With ``count`` > 1
+    a block is reserved and its last number returned.
+    """
+    result = await db.execute(
+        update(Chat)
+        .where(Chat.id == chat_id)
+        .values(last_seq=Chat.last_seq + count)
+        .returning(Chat.last_seq)
+    )
+    return result.scalar_one()
+
+
+async def record_chat_event(
+    db: AsyncSession,
+    chat_id: uuid.UUID,
+    payload: dict,
+    seq: Optional[int] = None,
+    message_id: Optional[uuid.UUID] = None,
+) -> dict:
+    """Stamp ``payload`` with a sequence number and append it to the chat log
+    and to every member's change feed (none in a large group, see ``feed_audience``).
+
+    Returns the stamped payload, ready to be sent to members after commit.
+    """
+    if seq is None:
+        seq = await next_chat_seq(db, chat_id)
+    payload = {**payload, "chat_id": str(chat_id), "seq": seq}
+    db.add(ChatEvent(
+        chat_id=chat_id,
+        seq=seq,
+        event_type=payload["type"],
+        message_id=message_id,
+        payload=payload,
+    ))
+    entity_key = f"message:{message_id}" if message_id else f"chat:{chat_id}"
+    await record_user_events(db, payload, entity_key, feed_audience(chat_id))
+    recent.stage(db, [payload])
+    return payload
+
+
+async def record_chat_events(
+    db: AsyncSession,
+    chat_id: uuid.UUID,
+    events: List[Tuple[dict, int, Optional[uuid.UUID]]],
+) -> List[dict]:
+    """``record_chat_event`` for several ``(payload, seq, message_id)`` at once,
+    with seqs already allocated: two INSERTs however many events there are."""
+    stamped = [{**payload, "chat_id": str(chat_id), "seq": seq} for payload, seq, _ in events]
+    await db.execute(insert(ChatEvent), [
+        {"chat_id": chat_id, "seq": seq, "event_type": payload["type"], "message_id": message_id, "payload": payload}
+        for payload, (_, seq, message_id) in zip(stamped, events)
+    ])
+    await record_user_event_batch(db, [
+        (payload, f"message:{message_id}" if message_id else f"chat:{chat_id}")
+        for payload, (_, _, message_id) in zip(stamped, events)
+    ], feed_audience(chat_id))
+    recent.stage(db, stamped)
+    return stamped
+
+
+def parse_since(raw: Optional[str]) -> Dict[uuid.UUID, int]:
+    """Parse the ``since`` handshake param: ``<chat_id>:<seq>,<chat_id>:<seq>``."""
+    cursors: Dict[uuid.UUID, int] = {}
+    if not raw:
+        return cursors
+    for part in raw.split(","):
+        chat_id, _, seq = part.strip().partition(":")
+        try:
+            cursors[uuid.UUID(chat_id)] = max(int(seq), 0)
+        except ValueError:
+            continue
+        if len(cursors) >= settings.WS_REPLAY_MAX_CHATS:
+            break
+    return cursors
+
+
+async def load_replay(db: AsyncSession, user_id: uuid.UUID, cursors: Dict[uuid.UUID, int]) -> dict:
+    """Collect events after each cursor for chats the user is a member of.
+
+    Chats with more than ``WS_REPLAY_LIMIT`` missing events, or whose log does
+    not reach back to the cursor, are listed in ``reset`` instead so the client
+    refetches them.
+    """
+    if not cursors:
+        return {"type": "replay", "events": [], "reset": []}
+
+    limit = settings.WS_REPLAY_LIMIT
+    rn = func.row_number().over(partition_by=ChatEvent.chat_id, order_by=ChatEvent.seq).label("rn")
+    numbered = (
+        select(ChatEvent.chat_id, ChatEvent.seq, ChatEvent.payload, rn)
+        .join(chat_members, and_(
+            chat_members.c.chat_id == ChatEvent.chat_id,
+            chat_members.c.user_id == user_id,
+        ))
+        .where(or_(*[
+            and_(ChatEvent.chat_id == chat_id, ChatEvent.seq > seq)
+            for chat_id, seq in cursors.items()
+        ]))
+        .subquery()
+    )
+    result = await db.execute(
+        select(numbered.c.chat_id, numbered.c.seq, numbered.c.payload)
+        .where(numbered.c.rn <= limit + 1)
+        .order_by(numbered.c.chat_id, numbered.c.seq)
+    )
+
+    by_chat: Dict[uuid.UUID, list] = {}
+    for chat_id, seq, payload in result.all():
+        by_chat.setdefault(chat_id, []).append((seq, payload))
+
+    events: list = []
+    reset: list = []
+    for chat_id, rows in by_chat.items():
+        if len(rows) > limit or rows[0][0] != cursors[chat_id] + 1:
+            reset.append(str(chat_id))
+            continue
+        events.extend(payload for _, payload in rows)
+    return {"type": "replay", "events": events, "reset": reset}
+
+
+# ---------- retention ----------
+
+async def prune_events(engine: AsyncEngine, retention_days: int = settings.EVENT_RETENTION_DAYS) -> Tuple[int, int]:
+    """Delete chat and user events older than ``retention_days``,
+    ``EVENT_PRUNE_BATCH`` rows per transaction.  Returns how many of each
+    were deleted.
+
+    Each chat keeps its newest ``WS_REPLAY_LIMIT`` events however old, so a
+    reconnect from an older cursor finds the log starting after it and gets
+    the chat in ``reset`` (see ``load_replay``).  The newest user event
+    deleted is kept in ``prune_horizons``; ``load_changes`` answers cursors
+    before it with a reset.
+    """
+    if retention_days <= 0:
+        return 0, 0
+    cutoff = func.now() - func.make_interval(0, 0, 0, retention_days)
+    batch = settings.EVENT_PRUNE_BATCH
+    chat_deleted = user_deleted = 0
+    while True:
+        old = (
+            select(ChatEvent.id)
+            .join(Chat, Chat.id == ChatEvent.chat_id)
+            .where(ChatEvent.created_at < cutoff, ChatEvent.seq <= Chat.last_seq - settings.WS_REPLAY_LIMIT)
+            .limit(batch)
+        )
+        async with engine.begin() as conn:
+            n = (await conn.execute(delete(ChatEvent).where(ChatEvent.id.in_(old)))).rowcount
+        chat_deleted += n
+        if n < batch:
+            break
+    while True:
+        old = select(UserEvent.id).where(UserEvent.created_at < cutoff).limit(batch)
+        async with engine.begin() as conn:
+            gone = (await conn.execute(
+                delete(UserEvent).where(UserEvent.id.in_(old)).returning(UserEvent.xid, UserEvent.id)
+            )).all()
+            if gone:
+                xid, event_id = max(tuple(row) for row in gone)
+                insert_horizon = pg_insert(PruneHorizon).values(name=_USER_EVENTS, xid=xid, id=event_id)
+                await conn.execute(insert_horizon.on_conflict_do_update(
+                    index_elements=[PruneHorizon.name],
+                    set_={"xid": xid, "id": event_id, "pruned_at": func.now()},
+                    where=tuple_(PruneHorizon.xid, PruneHorizon.id) < tuple_(xid, event_id),
+                ))
+        user_deleted += len(gone)
+        if len(gone) < batch:
+            return chat_deleted, user_deleted
+
+
+async def maintain_events(engine: AsyncEngine, interval: float = settings.EVENT_PRUNE_INTERVAL):
+    """Run ``prune_events`` now and then every ``interval`` seconds."""
+    while True:
+        try:
+            chat_deleted, user_deleted = await prune_events(engine)
+            if chat_deleted or user_deleted:
+                logger.info("pruned %d chat events and %d user events", chat_deleted, user_deleted)
+        except Exception:
+            logger.exception("pruning event logs failed")
+        await asyncio.sleep(interval)
+
+
+# ---------- per-user change feed ----------
+
+Audience = Union[Iterable[uuid.UUID], Select, CompoundSelect]
+
+
+def chat_audience(chat_id: uuid.UUID) -> Select:
+    """All members of a chat."""
+    return select(chat_members.c.user_id).where(chat_members.c.chat_id == chat_id)
+
+
+def feed_audience(chat_id: uuid.UUID) -> Select:
+    """Members whose change feed gets the chat's events: none in a large group
+    (see app.large_groups), where clients use the per-chat replay instead."""
+    return chat_audience(chat_id).where(small_chat(chat_id))
+
+
+def contacts_audience(user_id: uuid.UUID) -> CompoundSelect:
+    """The user plus everyone sharing a chat with them."""
+    my_chats = select(chat_members.c.chat_id).where(chat_members.c.user_id == user_id)
+    return union(
+        select(literal(user_id)),
+        select(chat_members.c.user_id).where(chat_members.c.chat_id.in_(my_chats)),
+    )
+
+
+async def record_user_events(db: AsyncSession, payload: dict, entity_key: str, audience: Audience) -> None:
+    """Append ``payload`` to the change feed of every user in ``audience``.
+
+    ``audience`` is either a list of user ids or a SELECT yielding them; the
+    latter is fanned out server-side in a single INSERT ... SELECT.
+    """
+    columns = ["user_id", "event_type", "entity_key", "payload"]
+    if isinstance(audience, (Select, CompoundSelect)):
+        audience = audience.subquery()
+        await db.execute(insert(UserEvent).from_select(columns, select(
+            audience.c[0],
+            literal(payload["type"]),
+            literal(entity_key),
+            literal(payload, JSONB),
+        )))
+        return
+    rows = [
+        {"user_id": uid, "event_type": payload["type"], "entity_key": entity_key, "payload": payload}
+        for uid in set(audience)
+    ]
+    if rows:
+        await db.execute(insert(UserEvent), rows)
+
+
+async def record_user_event_batch(db: AsyncSession, entries: List[Tuple[dict, str]], audience: Select) -> None:
+    """Append every ``(payload, entity_key)`` to the feed of every user in
+    ``audience``, in order, with a single INSERT ... SELECT."""
+    if not entries:
+        return
+    batch = values(
+        column("n", Integer), column("event_type", String), column("entity_key", String), column("payload", JSONB),
+        name="batch",
+    ).data([(n, payload["type"], entity_key, payload) for n, (payload, entity_key) in enumerate(entries)])
+    audience = audience.subquery()
+    await db.execute(insert(UserEvent).from_select(
+        ["user_id", "event_type", "entity_key", "payload"],
+        select(audience.c[0], batch.c.event_type, batch.c.entity_key, batch.c.payload)
+        .select_from(audience.join(batch, true()))
+        .order_by(batch.c.n),
+    ))
+
+
+Cursor = Tuple[int, int]
+
+_USER_EVENTS = "user_events"  # prune_horizons.name
+
+
+def parse_cursor(raw: str) -> Cursor:
+    xid, _, event_id = raw.partition("-")
+    return int(xid), int(event_id)
+
+
+def format_cursor(cursor: Cursor) -> str:
+    return f"{cursor[0]}-{cursor[1]}"
+
+
+def _merge(prev: dict, cur: dict) -> Optional[dict]:
+    """Fold two events for the same entity into one, or ``None`` if they cancel out."""
+    if prev["type"] == "new_message":
+        if cur["type"] == "message_deleted":
+            return None
+        if cur["type"] == "message_edited":
+            return {**cur, "type": "new_message"}
+    if prev["type"] == "chat_added":
+        # still news of the chat, carrying whatever the later change says
+        return {**prev, **cur, "type": "chat_added"}
+    return cur
+
+
+def compact_events(rows: Iterable[Tuple[str, dict]]) -> List[dict]:
+    """Collapse superseded events, keeping one per entity in order of last change."""
+    latest: Dict[str, dict] = {}
+    for entity_key, payload in rows:
+        prev = latest.pop(entity_key, None)
+        merged = payload if prev is None else _merge(prev, payload)
+        if merged is not None:
+            latest[entity_key] = merged
+    return list(latest.values())
+
+
+async def load_changes(
+    db: AsyncSession,
+    user_id: uuid.UUID,
+    since: Optional[Cursor],
+    limit: int,
+) -> Tuple[List[dict], Cursor, bool, bool]:
+    """Read a user's feed after ``since``.
+
+    Returns ``(events, next_cursor, has_more, reset)``.  Without ``since`` no
+    events are returned, only the current head cursor to start from after a
+    full load; the same with ``reset`` when ``since`` is older than the
+    retained feed (see ``prune_events``).
+    """
+    xmin, pruned_xid, pruned_id = (await db.execute(
+        text(
+            "SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint, h.xid, h.id "
+            "FROM (SELECT 1) one LEFT JOIN prune_horizons h ON h.name = :name"
+        ),
+        {"name": _USER_EVENTS},
+    )).one()
+    head: Cursor = (xmin, 0)
+    if since is None:
+        return [], head, False, False
+    if pruned_xid is not None and since < (pruned_xid, pruned_id):
+        return [], head, False, True
+
+    result = await db.execute(
+        select(UserEvent.xid, UserEvent.id, UserEvent.entity_key, UserEvent.payload)
+        .where(
+            UserEvent.user_id == user_id,
+            UserEvent.xid < xmin,
+            tuple_(UserEvent.xid, UserEvent.id) > tuple_(*since),
+        )
+        .order_by(UserEvent.xid, UserEvent.id)
+        .limit(limit + 1)
+    )
+    rows = result.all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if has_more:
+        next_cursor: Cursor = (rows[-1].xid, rows[-1].id)
+    else:
+        next_cursor = max(head, since)
+    events = compact_events((r.entity_key, r.payload) for r in rows)
+    return events, next_cursor, has_more, False
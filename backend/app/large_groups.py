@@ -0,0 +1,161 @@
+"""Large-group mode: delivery and message status for chats with thousands of members."""
+
+import asyncio
+import logging
+import uuid
+from typing import Awaitable, Callable, Collection, Dict, List, Optional, Tuple
+
+from sqlalchemy import BigInteger, ColumnElement, Integer, Select, and_, any_, column, literal, or_, select, update, values
+from sqlalchemy.dialects.postgresql import ARRAY, UUID
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from app.config import settings
+from app.models import Chat, Message, chat_members
+from app.recent import recent_messages
+
+logger = logging.getLogger(__name__)
+
+
+def is_large(member_count: Optional[int]) -> bool:
+    return member_count is not None and member_count >= settings.LARGE_GROUP_MIN_MEMBERS
+
+
+def small_chat(chat_id) -> ColumnElement:
+    """SQL condition: the chat is not a large group."""
+    return select(Chat.member_count).where(Chat.id == chat_id).scalar_subquery() < settings.LARGE_GROUP_MIN_MEMBERS
+
+
+def recipients_query(chat_id: uuid.UUID, online: Collection[uuid.UUID]) -> Select:
+    """Member ids to deliver a chat event to: every member of a small chat,
+    only those in ``online`` for a large one."""
+    return select(chat_members.c.user_id).where(
+        chat_members.c.chat_id == chat_id,
+        or_(small_chat(chat_id), chat_members.c.user_id == any_(uuid_array(online))),
+    )
+
+
+def uuid_array(ids: Collection[uuid.UUID]):
+    # one array parameter however many users are online (IN would need one each)
+    return literal(list(ids), ARRAY(UUID(as_uuid=True)))
+
+
+async def bump_status_version(db, chat_ids: Collection[uuid.UUID]) -> Dict[uuid.UUID, int]:
+    """Count a change to the status or counts of messages in ``chat_ids``
+    (``db`` is a session or connection); returns each chat's new version.
+
+    The chat row's update also bumps ``chats.version``, which its ETag is
+    built from.
+    """
+    if not chat_ids:
+        return {}
+    result = await db.execute(
+        update(Chat)
+        .where(Chat.id == any_(uuid_array(sorted(set(chat_ids)))))
+        .values(status_version=Chat.status_version + 1)
+        .returning(Chat.id, Chat.status_version)
+        .execution_options(synchronize_session=False)
+    )
+    return dict(result.all())
+
+
+async def advance_read_cursor(db: AsyncSession, chat_id: uuid.UUID, user_id: uuid.UUID, seq: int) -> bool:
+    """Move the member's read cursor up to ``seq`` and count the read; False if
+    it was already there (or they aren't a member)."""
+    old = (await db.execute(
+        select(chat_members.c.last_read_seq)
+        .where(chat_members.c.chat_id == chat_id, chat_members.c.user_id == user_id)
+        .with_for_update()
+    )).scalar_one_or_none()
+    if old is None or old >= seq:
+        return False
+    await db.execute(
+        update(chat_members)
+        .where(chat_members.c.chat_id == chat_id, chat_members.c.user_id == user_id)
+        .values(last_read_seq=seq)
+    )
+    status_counts.read(chat_id, old + 1, seq)
+    return True
+
+
+# ---------- aggregated counts ----------
+
+Notify = Callable[[uuid.UUID, dict], Awaitable[None]]
+
+
+class StatusCounts:
+    """Delivered/read increments per (chat_id, seq), waiting to be written."""
+
+    def __init__(self):
+        self._pending: Dict[Tuple[uuid.UUID, int], List[int]] = {}
+
+    def delivered(self, chat_id: uuid.UUID, seq: int, n: int) -> None:
+        if n > 0:
+            self._pending.setdefault((chat_id, seq), [0, 0])[0] += n
+
+    def read(self, chat_id: uuid.UUID, first: int, last: int) -> None:
+        for seq in range(max(first, last - settings.LARGE_GROUP_READ_WINDOW + 1), last + 1):
+            self._pending.setdefault((chat_id, seq), [0, 0])[1] += 1
+
+    async def flush(self, engine: AsyncEngine) -> List[Tuple[uuid.UUID, dict]]:
+        """Write pending increments; returns ``(sender_id, message_counts frame)`` pairs."""
+        pending, self._pending = self._pending, {}
+        if not pending:
+            return []
+        counts = values(
+            column("chat_id", UUID(as_uuid=True)), column("seq", BigInteger),
+            column("delivered", Integer), column("read", Integer),
+            name="counts",
+        ).data([(chat_id, seq, d, r) for (chat_id, seq), (d, r) in pending.items()])
+        messages = Message.__table__
+        try:
+            async with engine.begin() as conn:
+                rows = (await conn.execute(
+                    update(messages)
+                    .where(and_(messages.c.chat_id == counts.c.chat_id, messages.c.seq == counts.c.seq))
+                    .values(
+                        delivered_count=messages.c.delivered_count + counts.c.delivered,
+                        read_count=messages.c.read_count + counts.c.read,
+                    )
+                    .returning(
+                        messages.c.id, messages.c.chat_id, messages.c.seq, messages.c.sender_id,
+                        messages.c.delivered_count, messages.c.read_count,
+                    )
+                )).all()
+                versions = await bump_status_version(conn, {row.chat_id for row in rows})
+        except Exception:
+            for key, (d, r) in pending.items():  # keep them for the next try
+                entry = self._pending.setdefault(key, [0, 0])
+                entry[0] += d
+                entry[1] += r
+            raise
+        changes: Dict[uuid.UUID, Dict[uuid.UUID, dict]] = {}
+        for row in rows:
+            changes.setdefault(row.chat_id, {})[row.id] = {
+                "delivered_count": row.delivered_count, "read_count": row.read_count,
+            }
+        for chat_id, by_message in changes.items():
+            recent_messages.update(chat_id, versions[chat_id], by_message)
+        return [
+            (row.sender_id, {
+                "type": "message_counts",
+                "chat_id": str(row.chat_id),
+                "message_id": str(row.id),
+                "seq": row.seq,
+                "delivered": row.delivered_count,
+                "read": row.read_count,
+            })
+            for row in rows if row.sender_id is not None
+        ]
+
+    async def run(self, engine: AsyncEngine, notify: Notify, interval: float = settings.STATUS_FLUSH_INTERVAL):
+        """Flush every ``interval`` seconds and tell senders; runs for the app's lifetime."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                for sender_id, frame in await self.flush(engine):
+                    await notify(sender_id, frame)
+            except Exception:
+                logger.exception("flushing message status counts failed")
+
+
+status_counts = StatusCounts()
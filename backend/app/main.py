@@ -1,20 +1,63 @@
 """FastAPI application entry point."""
 
+import asyncio
+import logging
 import os
+from contextlib import asynccontextmanager
 from pathlib import Path
 
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 
+from app import metrics
+from app.compression import CompressionMiddleware
 from app.config import settings
-from app.routers import auth, chats, users, ws
+from app.database import engine, replicas
+from app.diagnostics import watchdog
+from app.events import maintain_events
+from app.large_groups import status_counts
+from app.outbox import dispatcher
+from app.partitions import maintain_partitions
+from app.query_budget import QueryBudgetMiddleware
+from app.ratelimit import admission
+from app.routers import admin, auth, chats, sync, users, ws
+
+logging.basicConfig(level=settings.LOG_LEVEL, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    tasks = []
+    if settings.METRICS_ENABLED:
+        tasks.append(asyncio.create_task(metrics.monitor_event_loop()))
+    if settings.PARTITION_MAINTENANCE_ENABLED:
+        tasks.append(asyncio.create_task(maintain_partitions(engine)))
+    if settings.EVENT_RETENTION_DAYS > 0:
+        tasks.append(asyncio.create_task(maintain_events(engine)))
+    if replicas.replicas:
+        tasks.append(asyncio.create_task(replicas.monitor()))
+    tasks.append(asyncio.create_task(status_counts.run(engine, ws.manager.send_to_user)))
+    tasks.append(asyncio.create_task(dispatcher.run(engine, ws.manager)))
+    if settings.LOOP_WATCHDOG_ENABLED:
+        watchdog.start()
+    yield
+    await watchdog.stop()
+    for task in tasks:
+        task.cancel()
+    # let a flush or dispatch in progress unwind before the last flush below
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await status_counts.flush(engine)  # keep counts not yet written
+    await replicas.dispose()
+
 
 app = FastAPI(
     title="Messenger API",
     version="1.0.0",
     docs_url="/docs",
     redoc_url="/redoc",
+    lifespan=lifespan,
+    dependencies=[Depends(admission)],
 )
 
 # CORS — разрешаем фронтенд
@@ -39,6 +82,14 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if settings.COMPRESSION_ENABLED:
+    app.add_middleware(CompressionMiddleware, minimum_size=settings.COMPRESSION_MIN_SIZE)
+
+app.add_middleware(QueryBudgetMiddleware)
+
+if settings.METRICS_ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware)
+
 # Static files for uploads
 uploads = Path(settings.UPLOAD_DIR)
 uploads.mkdir(parents=True, exist_ok=True)
@@ -48,9 +99,18 @@ app.mount("/uploads", StaticFiles(directory=str(uploads)), name="uploads")
 app.include_router(auth.router)
 app.include_router(chats.router)
 app.include_router(users.router)
+app.include_router(sync.router)
+app.include_router(admin.router)
 app.include_router(ws.router)
 
 
 @app.get("/health")
 async def health():
     return {"status": "ok"}
+
+
+if settings.METRICS_ENABLED:
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics_endpoint():
+        body, content_type = metrics.render()
+        return Response(body, media_type=content_type)
@@ -0,0 +1,118 @@
+"""Creating messages: the one write path behind every way of sending."""
+
+import uuid
+from typing import List, Optional, Sequence, Tuple
+
+from sqlalchemy import insert, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import outbox
+from app.events import next_chat_seq, record_chat_event
+from app.ids import uuid7
+from app.models import Message
+from app.serializers import MESSAGE_RECORD_FIELDS, to_json, user_from_row, user_rows_query
+
+_messages = Message.__table__
+_RETURNING = [_messages.c[f] for f in MESSAGE_RECORD_FIELDS]
+
+
+async def insert_messages(
+    db: AsyncSession,
+    chat_id: uuid.UUID,
+    sender: dict,
+    items: Sequence[dict],
+) -> List[dict]:
+    """Insert messages from ``sender`` (a ``UserOut``-shaped dict) into a chat.
+
+    Each item has ``content`` and optionally ``image_url`` and
+    ``forwarded_from`` (the original author, also a user dict).  Returns the
+    messages in ``MessageOut`` shape, in order, with the next seqs of the chat.
+    """
+    last = await next_chat_seq(db, chat_id, count=len(items))
+    first = last - len(items) + 1
+    result = await db.execute(
+        insert(_messages).returning(*_RETURNING, sort_by_parameter_order=True),
+        [
+            {
+                "id": uuid7(),
+                "chat_id": chat_id,
+                "sender_id": sender["id"],
+                "content": item.get("content"),
+                "image_url": item.get("image_url"),
+                "forwarded_from_id": item["forwarded_from"]["id"] if item.get("forwarded_from") else None,
+                "status": "sent",
+                "seq": first + n,
+            }
+            for n, item in enumerate(items)
+        ],
+    )
+    messages = []
+    for item, row in zip(items, result.all()):
+        message = dict(zip(MESSAGE_RECORD_FIELDS, row))
+        message["sender"] = sender
+        message["forwarded_from"] = item.get("forwarded_from")
+        messages.append(message)
+    return messages
+
+
+async def set_message_content(
+    db: AsyncSession,
+    chat_id: uuid.UUID,
+    message_id: uuid.UUID,
+    sender: dict,
+    content: str,
+) -> Optional[dict]:
+    """Replace the content of ``sender``'s message with ``UPDATE ... RETURNING``.
+
+    Returns the edited message in ``MessageOut`` shape, or ``None`` if the chat
+    has no such message from ``sender``.
+    """
+    result = await db.execute(
+        update(_messages)
+        .where(_messages.c.id == message_id, _messages.c.chat_id == chat_id, _messages.c.sender_id == sender["id"])
+        .values(content=content, is_edited=True)
+        .returning(*_RETURNING)
+    )
+    row = result.first()
+    if row is None:
+        return None
+    message = dict(zip(MESSAGE_RECORD_FIELDS, row))
+    message["sender"] = sender
+    message["forwarded_from"] = None
+    if message["forwarded_from_id"] is not None:
+        author = (await db.execute(user_rows_query([message["forwarded_from_id"]]))).first()
+        message["forwarded_from"] = user_from_row(author) if author is not None else None
+    return message
+
+
+def new_message_event(message: dict) -> dict:
+    return {"type": "new_message", "message": to_json(message)}
+
+
+async def create_message(
+    db: AsyncSession,
+    chat_id: uuid.UUID,
+    sender: dict,
+    content: Optional[str] = None,
+    image_url: Optional[str] = None,
+    forwarded_from: Optional[dict] = None,
+) -> Tuple[dict, dict]:
+    """Insert one message and record its ``new_message`` event.
+
+    Returns ``(message, payload)``: the ``MessageOut``-shaped message and the
+    stamped event to send to members once the caller commits.
+    """
+    [message] = await insert_messages(db, chat_id, sender, [{
+        "content": content, "image_url": image_url, "forwarded_from": forwarded_from,
+    }])
+    payload = await record_chat_event(
+        db, chat_id, new_message_event(message), seq=message["seq"], message_id=message["id"],
+    )
+    return message, payload
+
+
+async def post_message(db: AsyncSession, chat_id: uuid.UUID, sender: dict, **fields) -> dict:
+    """``create_message`` plus its notification to members through the outbox."""
+    message, payload = await create_message(db, chat_id, sender, **fields)
+    outbox.enqueue(db, payload, chat_id=chat_id)
+    return message
@@ -0,0 +1,218 @@
+"""Prometheus metrics: ``GET /metrics``."""
+
+import asyncio
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional, Tuple
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.core import GaugeMetricFamily, REGISTRY
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.config import settings
+from app.database import engine, pool_waits, replicas
+
+WS_FRAME_TYPES = ("message", "typing", "read", "batch", "resolve_users")
+_QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+HTTP_REQUESTS = Counter(
+    "http_requests_total", "HTTP requests", ["method", "route", "status"],
+)
+HTTP_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency", ["method", "route"],
+)
+HTTP_QUERIES = Histogram(
+    "http_request_db_queries", "SQL statements per HTTP request", ["method", "route"], buckets=_QUERY_BUCKETS,
+)
+HTTP_DB_TIME = Histogram(
+    "http_request_db_seconds", "Time spent in SQL per HTTP request", ["method", "route"],
+)
+WS_LATENCY = Histogram(
+    "ws_frame_duration_seconds", "Time to handle an incoming WebSocket frame", ["type"],
+)
+WS_QUERIES = Histogram(
+    "ws_frame_db_queries", "SQL statements per incoming WebSocket frame", ["type"], buckets=_QUERY_BUCKETS,
+)
+WS_DB_TIME = Histogram(
+    "ws_frame_db_seconds", "Time spent in SQL per incoming WebSocket frame", ["type"],
+)
+QUERY_BUDGET_OVERRUNS = Counter(
+    "query_budget_overruns_total", "Requests and frames that issued more SQL statements than their budget", ["route"],
+)
+WS_PENDING_SENDS = Gauge(
+    "ws_outbound_pending_sends", "Outbound WebSocket sends awaiting the transport",
+)
+SHED_REQUESTS = Counter(
+    "shed_requests_total", "Requests and frames refused before reaching the database", ["transport", "reason"],
+)
+MESSAGE_CACHE_LOOKUPS = Counter(
+    "message_cache_lookups_total", "First history pages looked up in the recent-message cache", ["result"],
+)
+OUTBOX_EVENTS = Counter(
+    "outbox_events_total", "Outbox notifications sent to this worker's sockets",
+)
+OUTBOX_LAG = Histogram(
+    "outbox_dispatch_lag_seconds", "Time from an outbox row's transaction start to its send",
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+LOOP_LAG = Gauge(
+    "event_loop_lag_seconds", "Most recent event-loop scheduling delay",
+)
+LOOP_STALLS = Counter(
+    "event_loop_stalls_total", "Times the loop was held past LOOP_WATCHDOG_THRESHOLD",
+)
+LOOP_LAG_HIST = Histogram(
+    "event_loop_lag_distribution_seconds", "Event-loop scheduling delay",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+
+
+# ---------- SQL statement accounting ----------
+
+class QueryStats:
+    __slots__ = ("count", "seconds")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+
+# Every open track_queries() scope, innermost last; a statement counts toward all of them.
+_active: ContextVar[Tuple[QueryStats, ...]] = ContextVar("query_stats", default=())
+
+
+@contextmanager
+def track_queries() -> Iterator[QueryStats]:
+    """Count SQL statements issued inside the block (including awaited calls)."""
+    stats = QueryStats()
+    token = _active.set(_active.get() + (stats,))
+    try:
+        yield stats
+    finally:
+        _active.reset(token)
+
+
+# on every engine: the primary and any read replicas
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _active.get():
+        conn.info["query_start"] = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    scopes = _active.get()
+    if scopes:
+        elapsed = time.perf_counter() - conn.info.pop("query_start", time.perf_counter())
+        for stats in scopes:
+            stats.count += 1
+            stats.seconds += elapsed
+
+
+# ---------- HTTP ----------
+
+class MetricsMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        with track_queries() as stats:
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                elapsed = time.perf_counter() - start
+                # label by route template, not raw path, to keep cardinality bounded
+                route = getattr(scope.get("route"), "path", "unmatched")
+                method = scope["method"]
+                HTTP_REQUESTS.labels(method, route, str(status)).inc()
+                HTTP_LATENCY.labels(method, route).observe(elapsed)
+                HTTP_QUERIES.labels(method, route).observe(stats.count)
+                HTTP_DB_TIME.labels(method, route).observe(stats.seconds)
+
+
+# ---------- WebSocket ----------
+
+@contextmanager
+def observe_ws_frame(frame_type: Optional[str]) -> Iterator[QueryStats]:
+    label = frame_type if frame_type in WS_FRAME_TYPES else "other"
+    start = time.perf_counter()
+    with track_queries() as stats:
+        try:
+            yield stats
+        finally:
+            WS_LATENCY.labels(label).observe(time.perf_counter() - start)
+            WS_QUERIES.labels(label).observe(stats.count)
+            WS_DB_TIME.labels(label).observe(stats.seconds)
+
+
+# ---------- scrape-time gauges ----------
+
+class _RuntimeCollector:
+    def describe(self):
+        # no names to check at registration, so collect() (and its imports)
+        # doesn't run while this module is still being imported
+        return []
+
+    def collect(self):
+        from app.recent import recent_messages
+        from app.routers.ws import manager
+
+        pool = engine.pool
+        yield GaugeMetricFamily("db_pool_size", "Configured DB pool size", value=pool.size())
+        yield GaugeMetricFamily("db_pool_checked_out", "DB connections checked out", value=pool.checkedout())
+        yield GaugeMetricFamily("db_pool_overflow", "DB connections open beyond pool_size", value=max(pool.overflow(), 0))
+        yield GaugeMetricFamily(
+            "db_pool_wait_seconds", "Average DB pool checkout wait over OVERLOAD_WINDOW", value=pool_waits.average(),
+        )
+        if replicas.replicas:
+            healthy = GaugeMetricFamily("db_replica_healthy", "Replica passed its last health check", labels=["replica"])
+            lag = GaugeMetricFamily("db_replica_lag_seconds", "Replica replay lag at the last check", labels=["replica"])
+            checked_out = GaugeMetricFamily("db_replica_pool_checked_out", "Replica connections checked out", labels=["replica"])
+            for r in replicas.replicas:
+                healthy.add_metric([r.name], 1 if r.healthy else 0)
+                lag.add_metric([r.name], r.lag if r.lag is not None else float("nan"))
+                checked_out.add_metric([r.name], r.engine.pool.checkedout())
+            yield healthy
+            yield lag
+            yield checked_out
+        yield GaugeMetricFamily("message_cache_chats", "Chats in the recent-message cache", value=len(recent_messages))
+        yield GaugeMetricFamily("message_cache_bytes", "Encoded size of the recent-message cache", value=recent_messages.bytes)
+        yield GaugeMetricFamily("ws_connected_users", "Users with at least one open socket", value=len(manager.active))
+        yield GaugeMetricFamily(
+            "ws_active_sockets", "Open WebSocket connections",
+            value=sum(len(conns) for conns in manager.active.values()),
+        )
+
+
+REGISTRY.register(_RuntimeCollector())
+
+
+async def monitor_event_loop(interval: float = settings.METRICS_LOOP_LAG_INTERVAL):
+    """Measure how late ``asyncio.sleep`` wakes up; runs for the app's lifetime."""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(loop.time() - start - interval, 0.0)
+        LOOP_LAG.set(lag)
+        LOOP_LAG_HIST.observe(lag)
+
+
+def render() -> tuple[bytes, str]:
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -2,18 +2,18 @@
 Database models for the messenger application.
 """
 
-import uuid
 from datetime import datetime
 from enum import Enum as PyEnum
 
 from sqlalchemy import (
     Column, String, Text, Boolean, DateTime, ForeignKey,
-    Table, Enum, Integer, func, UniqueConstraint,
+    Table, Enum, Integer, BigInteger, Index, func, text, UniqueConstraint,
 )
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.dialects.postgresql import ARRAY, UUID, JSONB
 from sqlalchemy.orm import relationship
 
 from app.base import Base
+from app.ids import uuid7
 
 
 # ---------- enums ----------
@@ -37,6 +37,8 @@ chat_members = Table(
     Column("chat_id", UUID(as_uuid=True), ForeignKey("chats.id", ondelete="CASCADE"), primary_key=True),
     Column("user_id", UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), primary_key=True),
     Column("joined_at", DateTime(timezone=True), server_default=func.now()),
+    # Highest seq the member has read; only maintained in large groups (see app.large_groups)
+    Column("last_read_seq", BigInteger, nullable=False, server_default="0"),
 )
 
 
@@ -45,7 +47,7 @@ chat_members = Table(
 class User(Base):
     __tablename__ = "users"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
     phone = Column(String(20), unique=True, nullable=False, index=True)
     username = Column(String(50), unique=True, nullable=True, index=True)
     display_name = Column(String(100), nullable=True)
@@ -55,43 +57,78 @@ class User(Base):
     is_active = Column(Boolean, default=True)
     last_seen = Column(DateTime(timezone=True), server_default=func.now())
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Bumped by a trigger when a UserOut field changes (see app.etags)
+    version = Column(BigInteger, nullable=False, server_default="0")
 
-    messages = relationship("Message", back_populates="sender", lazy="selectin")
-    chats = relationship("Chat", secondary=chat_members, back_populates="members", lazy="selectin")
+    # Unbounded collections: query them explicitly instead of loading them with every user
+    messages = relationship("Message", back_populates="sender", foreign_keys="Message.sender_id", lazy="raise")
+    chats = relationship("Chat", secondary=chat_members, back_populates="members", lazy="raise")
 
 
 class Chat(Base):
     __tablename__ = "chats"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
     chat_type = Column(Enum("private", "group", name="chattype", create_type=False), nullable=False, default="private")
     title = Column(String(200), nullable=True)  # for group chats
     avatar_url = Column(String(512), nullable=True)
     created_by = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=True)
+    # Last per-chat event sequence number handed out (see app.events)
+    last_seq = Column(BigInteger, nullable=False, default=0, server_default="0")
+    # Last seq moved into segment files, 0 if none (see app.segments)
+    compacted_seq = Column(BigInteger, nullable=False, server_default="0")
+    # Maintained by triggers on chat_members (migration 0008)
+    member_count = Column(Integer, nullable=False, server_default="0")
+    # Bumped with every change to the status or counts of the chat's messages (see app.large_groups)
+    status_version = Column(BigInteger, nullable=False, server_default="0")
+    # Bumped by triggers on any change to the row or to a member's profile (see app.etags)
+    version = Column(BigInteger, nullable=False, server_default="0")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
-    members = relationship("User", secondary=chat_members, back_populates="chats", lazy="selectin")
-    messages = relationship("Message", back_populates="chat", lazy="selectin", order_by="Message.created_at")
+    # Can be huge in a large group: preview or page members with explicit queries
+    members = relationship("User", secondary=chat_members, back_populates="chats", lazy="raise")
+    messages = relationship("Message", back_populates="chat", lazy="raise", order_by="Message.created_at")
 
 
 class Message(Base):
+    """Range-partitioned by month on ``created_at`` (see app.partitions)."""
     __tablename__ = "messages"
+    __table_args__ = (
+        Index("ix_messages_chat_id_created_at", "chat_id", "created_at"),
+        Index("ix_messages_chat_id_seq", "chat_id", "seq"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+    # The table's primary key is (id, created_at) because it must include the
+    # partition key; id alone is unique and is what the ORM keys objects by.
+    __mapper_args__ = {"primary_key": ["id"]}
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    chat_id = Column(UUID(as_uuid=True), ForeignKey("chats.id", ondelete="CASCADE"), nullable=False, index=True)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
+    chat_id = Column(UUID(as_uuid=True), ForeignKey("chats.id", ondelete="CASCADE"), nullable=False)
+    seq = Column(BigInteger, nullable=True)  # per-chat sequence number assigned on insert
     sender_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="SET NULL"), nullable=True, index=True)
     content = Column(Text, nullable=True)
     image_url = Column(String(512), nullable=True)
     is_edited = Column(Boolean, default=False, nullable=False)
     forwarded_from_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
     status = Column(Enum("sent", "delivered", "read", name="messagestatus", create_type=False), default="sent", nullable=False)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Aggregated status in large groups, where `status` isn't per recipient (see app.large_groups)
+    delivered_count = Column(Integer, nullable=False, default=0, server_default="0")
+    read_count = Column(Integer, nullable=False, default=0, server_default="0")
+    created_at = Column(DateTime(timezone=True), primary_key=True, server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
     chat = relationship("Chat", back_populates="messages")
     sender = relationship("User", back_populates="messages", foreign_keys=[sender_id])
     forwarded_from = relationship("User", foreign_keys=[forwarded_from_id], lazy="selectin")
-    read_receipts = relationship("ReadReceipt", back_populates="message", lazy="selectin", cascade="all, delete-orphan")
+    # No FK to a partitioned table's id alone, so the join is spelled out and the
+    # ORM cascade stands in for ON DELETE CASCADE
+    read_receipts = relationship(
+        "ReadReceipt",
+        primaryjoin="Message.id == foreign(ReadReceipt.message_id)",
+        back_populates="message",
+        lazy="selectin",
+        cascade="all, delete-orphan",
+    )
 
 
 class ReadReceipt(Base):
@@ -101,14 +138,91 @@ class ReadReceipt(Base):
     )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    message_id = Column(UUID(as_uuid=True), ForeignKey("messages.id", ondelete="CASCADE"), nullable=False, index=True)
+    message_id = Column(UUID(as_uuid=True), nullable=False, index=True)
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
     read_at = Column(DateTime(timezone=True), server_default=func.now())
 
-    message = relationship("Message", back_populates="read_receipts")
+    message = relationship("Message", primaryjoin="foreign(ReadReceipt.message_id) == Message.id", back_populates="read_receipts")
     user = relationship("User")
 
 
+class ChatEvent(Base):
+    """Append-only log of events fanned out to a chat, keyed by per-chat sequence."""
+    __tablename__ = "chat_events"
+    __table_args__ = (
+        UniqueConstraint("chat_id", "seq", name="uq_chat_event_seq"),
+        Index("ix_chat_events_created_at", "created_at"),
+    )
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    chat_id = Column(UUID(as_uuid=True), ForeignKey("chats.id", ondelete="CASCADE"), nullable=False)
+    seq = Column(BigInteger, nullable=False)
+    event_type = Column(String(32), nullable=False)
+    message_id = Column(UUID(as_uuid=True), nullable=True)  # no FK: must outlive deleted messages
+    payload = Column(JSONB, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class UserEvent(Base):
+    """Per-user change feed read by ``GET /api/sync``.
+
+    ``xid`` is the writing transaction's id; readers only consume rows from
+    transactions older than every in-flight one, so the cursor never skips
+    an event that commits late.
+    """
+    __tablename__ = "user_events"
+    __table_args__ = (
+        Index("ix_user_events_user_xid_id", "user_id", "xid", "id"),
+        Index("ix_user_events_created_at", "created_at"),
+    )
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    xid = Column(BigInteger, nullable=False, server_default=text("pg_current_xact_id()::text::bigint"))
+    event_type = Column(String(32), nullable=False)
+    entity_key = Column(String(80), nullable=False)  # "message:<id>", "chat:<id>", "user:<id>"
+    payload = Column(JSONB, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class MessageTombstone(Base):
+    """A message deleted after it was compacted; segment readers skip it (see ``app.segments``)."""
+    __tablename__ = "message_tombstones"
+
+    chat_id = Column(UUID(as_uuid=True), ForeignKey("chats.id", ondelete="CASCADE"), primary_key=True)
+    seq = Column(BigInteger, primary_key=True)
+    deleted_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+
+class PruneHorizon(Base):
+    """Newest ``(xid, id)`` deleted from an event log (see ``app.events.prune_events``)."""
+    __tablename__ = "prune_horizons"
+
+    name = Column(String(32), primary_key=True)
+    xid = Column(BigInteger, nullable=False)
+    id = Column(BigInteger, nullable=False)
+    pruned_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+
+class OutboxEvent(Base):
+    """A socket notification waiting to be sent (see ``app.outbox``).
+
+    Goes to ``user_ids`` if set, otherwise to the members of ``chat_id``.
+    """
+    __tablename__ = "outbox"
+    __table_args__ = (
+        Index("ix_outbox_xid_id", "xid", "id"),
+        Index("ix_outbox_created_at", "created_at"),
+    )
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    xid = Column(BigInteger, nullable=False, server_default=text("pg_current_xact_id()::text::bigint"))
+    chat_id = Column(UUID(as_uuid=True), nullable=True)  # no FK: a notification may outlive its chat
+    user_ids = Column(ARRAY(UUID(as_uuid=True)), nullable=True)
+    payload = Column(JSONB, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+
 class SMSCode(Base):
     """Simulated SMS OTP codes for authentication."""
     __tablename__ = "sms_codes"
@@ -0,0 +1,192 @@
+"""Transactional outbox for socket notifications sent by REST handlers."""
+
+import asyncio
+import logging
+import time
+import uuid
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import and_, any_, delete, event, func, or_, select, text, tuple_
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.large_groups import is_large, status_counts, uuid_array
+from app.metrics import OUTBOX_EVENTS, OUTBOX_LAG
+from app.models import Chat, OutboxEvent, chat_members
+from app.wire import Frame
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue(
+    db: AsyncSession,
+    payload: dict,
+    chat_id: Optional[uuid.UUID] = None,
+    user_ids: Optional[Iterable[uuid.UUID]] = None,
+) -> None:
+    """Send ``payload`` to ``user_ids``, or else to the members of ``chat_id``,
+    once ``db`` commits."""
+    db.add(OutboxEvent(chat_id=chat_id, user_ids=None if user_ids is None else list(user_ids), payload=payload))
+    db.info["outbox"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(session):
+    if session.info.pop("outbox", False):
+        dispatcher.wake()
+
+
+@event.listens_for(Session, "after_rollback")
+def _after_rollback(session):
+    session.info.pop("outbox", None)
+
+
+class Dispatcher:
+    """Tails ``outbox`` and sends each row to this worker's sockets; rows are
+    deleted after ``OUTBOX_RETENTION`` seconds."""
+
+    def __init__(self):
+        self._wake: Optional[asyncio.Event] = None
+        # rows still to send: every row after ``_after`` in (xid, id) order,
+        # plus those of the transactions in ``_open`` after the id read last
+        self._after: Tuple[int, int] = (0, 0)
+        self._open: Dict[int, int] = {}
+        self._pruned = 0.0
+
+    def wake(self) -> None:
+        if self._wake is not None:
+            self._wake.set()
+
+    async def run(self, engine: AsyncEngine, manager, interval: float = settings.OUTBOX_POLL_INTERVAL):
+        """Send outbox rows through ``manager`` (the ``ConnectionManager``)
+        as they commit; runs for the app's lifetime."""
+        self._wake = asyncio.Event()
+        async with engine.connect() as conn:
+            xmax, in_flight = await _snapshot(conn)
+        self._after, self._open = (xmax, 0), dict.fromkeys(in_flight, 0)
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                while await self.dispatch(engine, manager) == settings.OUTBOX_BATCH_SIZE:
+                    pass
+                if time.monotonic() - self._pruned > settings.OUTBOX_RETENTION / 2:
+                    await self.prune(engine)
+            except Exception:
+                logger.exception("dispatching outbox notifications failed")
+
+    async def dispatch(self, engine: AsyncEngine, manager) -> int:
+        """Send the next batch of committed rows; returns how many were read."""
+        online = list(manager.active)
+        outbox = OutboxEvent.__table__
+        async with engine.connect() as conn:
+            # one snapshot for both queries: the rows read are exactly those of
+            # the transactions it sees as committed
+            conn = await conn.execution_options(isolation_level="REPEATABLE READ")
+            xmax, in_flight = await _snapshot(conn)
+            pending = [tuple_(outbox.c.xid, outbox.c.id) > tuple_(*self._after)]
+            pending += [and_(outbox.c.xid == xid, outbox.c.id > last_id) for xid, last_id in self._open.items()]
+            rows = (await conn.execute(
+                select(outbox).where(or_(*pending)).order_by(outbox.c.xid, outbox.c.id).limit(settings.OUTBOX_BATCH_SIZE)
+            )).all()
+            chats = {row.chat_id for row in rows if row.user_ids is None and row.chat_id is not None}
+            members: Dict[uuid.UUID, List[uuid.UUID]] = {}
+            sizes: Dict[uuid.UUID, int] = {}
+            if chats and online:
+                result = await conn.execute(
+                    select(chat_members.c.chat_id, chat_members.c.user_id, Chat.member_count)
+                    .join(Chat, Chat.id == chat_members.c.chat_id)
+                    .where(
+                        chat_members.c.chat_id == any_(uuid_array(chats)),
+                        chat_members.c.user_id == any_(uuid_array(online)),
+                    )
+                )
+                for chat_id, user_id, member_count in result.all():
+                    members.setdefault(chat_id, []).append(user_id)
+                    sizes[chat_id] = member_count
+
+        now = time.time()
+        for row in rows:
+            if row.user_ids is not None:
+                await manager.send_to_users(row.user_ids, row.payload)
+            else:
+                await _send_to_chat(manager, row.chat_id, members.get(row.chat_id, []), sizes.get(row.chat_id), row.payload)
+            OUTBOX_LAG.observe(max(now - row.created_at.timestamp(), 0.0))
+        OUTBOX_EVENTS.inc(len(rows))
+
+        self._after, self._open = _advance(
+            self._after, self._open, [(row.xid, row.id) for row in rows], xmax, in_flight, settings.OUTBOX_BATCH_SIZE
+        )
+        return len(rows)
+
+    async def prune(self, engine: AsyncEngine) -> None:
+        async with engine.begin() as conn:
+            await conn.execute(
+                delete(OutboxEvent).where(
+                    OutboxEvent.created_at < func.now() - func.make_interval(0, 0, 0, 0, 0, 0, settings.OUTBOX_RETENTION)
+                )
+            )
+        self._pruned = time.monotonic()
+
+
+async def _send_to_chat(manager, chat_id: uuid.UUID, recipients: List[uuid.UUID], member_count: Optional[int],
+                        payload: dict) -> None:
+    message = payload.get("message") if payload.get("type") == "new_message" else None
+    if message is None or not is_large(member_count):
+        await manager.send_to_users(recipients, payload)
+        return
+    # a new message in a large group: count deliveries like the socket path
+    # does, the sender's own devices excluded
+    frame = Frame(payload)
+    sender_id = uuid.UUID(message["sender_id"])
+    if sender_id in recipients:
+        await manager.send_to_user(sender_id, frame)
+    delivered = await manager.send_to_users(recipients, frame, exclude=sender_id)
+    status_counts.delivered(chat_id, message["seq"], delivered)
+
+
+def _advance(
+    after: Tuple[int, int],
+    open_: Dict[int, int],
+    keys: List[Tuple[int, int]],
+    xmax: int,
+    in_flight: List[int],
+    batch_size: int,
+) -> Tuple[Tuple[int, int], Dict[int, int]]:
+    """The ``(after, open)`` cursors following a read of ``keys`` (``(xid, id)``
+    in order) in a snapshot with ``xmax`` and ``in_flight``.
+
+    ``after`` only moves forward: rows of the open transactions (all below it)
+    come first, so a full batch can end among them without rewinding it.
+    Continue after the last row read, or after everything the snapshot saw;
+    transactions in flight below that point are read by xid.
+    """
+    open_ = dict(open_)
+    for xid, event_id in keys:
+        if xid in open_:
+            open_[xid] = event_id
+    last = keys[-1] if len(keys) == batch_size else (xmax, 0)
+    running = set(in_flight)
+    # an open transaction is done once it has committed and the read got past it
+    open_ = {xid: event_id for xid, event_id in open_.items() if xid in running or xid >= last[0]}
+    new_after = max(after, last)
+    for xid in in_flight:
+        if after[0] <= xid < new_after[0]:
+            open_.setdefault(xid, 0)
+    return new_after, open_
+
+
+async def _snapshot(conn) -> Tuple[int, List[int]]:
+    """``(xmax, in-flight xids)`` of the connection's current snapshot."""
+    row = (await conn.execute(text(
+        "SELECT pg_snapshot_xmax(s)::text::bigint, ARRAY(SELECT pg_snapshot_xip(s)::text::bigint) "
+        "FROM pg_current_snapshot() s"
+    ))).one()
+    return row[0], list(row[1])
+
+
+dispatcher = Dispatcher()
@@ -0,0 +1,153 @@
+"""Monthly range partitions of ``messages`` on ``created_at``."""
+
+import asyncio
+import logging
+import re
+import sys
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+_NAME = re.compile(r"^messages_p(\d{4})_(\d{2})$")
+_LOCK_KEY = 0x6D736770  # advisory lock serializing partition DDL across workers
+
+
+def month_start(dt: datetime) -> datetime:
+    dt = dt.astimezone(timezone.utc)
+    return datetime(dt.year, dt.month, 1, tzinfo=timezone.utc)
+
+
+def add_months(month: datetime, n: int) -> datetime:
+    index = month.year * 12 + month.month - 1 + n
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+def partition_name(month: datetime) -> str:
+    return f"messages_p{month.year:04d}_{month.month:02d}"
+
+
+async def list_partitions(conn: AsyncConnection) -> List[Tuple[str, datetime]]:
+    """Attached partitions as ``(name, month)``, oldest first."""
+    result = await conn.execute(text(
+        """
+        SELECT c.relname FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname = 'messages' AND p.relnamespace = 'public'::regnamespace
+        """
+    ))
+    partitions = []
+    for name in result.scalars():
+        match = _NAME.match(name)
+        if match:
+            partitions.append((name, datetime(int(match[1]), int(match[2]), 1, tzinfo=timezone.utc)))
+    return sorted(partitions, key=lambda p: p[1])
+
+
+async def ensure_partitions(
+    conn: AsyncConnection,
+    start: Optional[datetime] = None,
+    ahead: int = settings.MESSAGE_PARTITIONS_AHEAD,
+) -> List[str]:
+    """Create missing partitions from ``start``'s month (default: this month)
+    through ``ahead`` months from now.  Returns the names created."""
+    await conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": _LOCK_KEY})
+    existing = {name for name, _ in await list_partitions(conn)}
+    now = month_start(datetime.now(timezone.utc))
+    month = month_start(start) if start is not None else now
+    last = add_months(now, ahead)
+    created = []
+    while month <= last:
+        name = partition_name(month)
+        if name not in existing:
+            await conn.execute(text(
+                f'CREATE TABLE "{name}" PARTITION OF messages '
+                f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+            ))
+            created.append(name)
+        month = add_months(month, 1)
+    return created
+
+
+async def archive_partitions(
+    engine: AsyncEngine,
+    retention_months: int = settings.MESSAGE_RETENTION_MONTHS,
+) -> List[str]:
+    """Detach partitions whose whole month is older than ``retention_months``
+    and move them to the archive schema.  Returns the names archived.
+
+    Uses ``DETACH PARTITION ... CONCURRENTLY`` (Postgres 14+), so it runs
+    outside a transaction and doesn't block reads or inserts.  Months holding
+    messages past their chat's ``compacted_seq`` are skipped.  Read receipts
+    of archived messages are deleted; the messages keep their ``status``.
+    """
+    if retention_months <= 0:
+        return []
+    cutoff = add_months(month_start(datetime.now(timezone.utc)), -retention_months)
+    schema = settings.MESSAGE_ARCHIVE_SCHEMA
+    archived = []
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        for name, month in await list_partitions(conn):
+            if add_months(month, 1) > cutoff:
+                break
+            hot = (await conn.execute(text(
+                f'SELECT EXISTS (SELECT 1 FROM "{name}" m JOIN chats c ON c.id = m.chat_id '
+                f"WHERE c.compacted_seq IS NULL OR m.seq IS NULL OR m.seq > c.compacted_seq)"
+            ))).scalar_one()
+            if hot:
+                logger.warning(
+                    "not archiving partition %s: it has messages not compacted into segments yet "
+                    "(python -m app.segments compact)", name,
+                )
+                continue
+            await conn.execute(text(f'DELETE FROM read_receipts WHERE message_id IN (SELECT id FROM "{name}")'))
+            await conn.execute(text(f'ALTER TABLE messages DETACH PARTITION "{name}" CONCURRENTLY'))
+            await conn.execute(text(f'CREATE SCHEMA IF NOT EXISTS "{schema}"'))
+            await conn.execute(text(f'ALTER TABLE "{name}" SET SCHEMA "{schema}"'))
+            archived.append(name)
+            logger.info("archived partition %s to schema %s", name, schema)
+    return archived
+
+
+async def run_maintenance(engine: AsyncEngine) -> None:
+    async with engine.begin() as conn:
+        created = await ensure_partitions(conn)
+    if created:
+        logger.info("created partitions %s", ", ".join(created))
+    await archive_partitions(engine)
+
+
+async def maintain_partitions(engine: AsyncEngine, interval: float = settings.PARTITION_MAINTENANCE_INTERVAL):
+    """Run partition maintenance now and then every ``interval`` seconds."""
+    while True:
+        try:
+            await run_maintenance(engine)
+        except Exception:
+            logger.exception("partition maintenance failed")
+        await asyncio.sleep(interval)
+
+
+async def _main(command: str) -> None:
+    from app.database import engine
+
+    if command == "ensure":
+        async with engine.begin() as conn:
+            print("\n".join(await ensure_partitions(conn)) or "nothing to create")
+    elif command == "archive":
+        print("\n".join(await archive_partitions(engine)) or "nothing to archive")
+    else:
+        async with engine.connect() as conn:
+            for name, month in await list_partitions(conn):
+                print(f"{name}  {month:%Y-%m}")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main(sys.argv[1] if len(sys.argv) > 1 else "list"))
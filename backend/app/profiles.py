@@ -0,0 +1,69 @@
+"""Bulk profile lookup with a small in-process cache."""
+
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.serializers import user_from_row, user_rows_query
+
+
+def parse_ids(raw: Iterable[str]) -> List[uuid.UUID]:
+    """Unique user ids, in order, from ``"a,b"`` strings or a list of ids;
+    raises ``ValueError`` on a bad one or more than ``USER_LOOKUP_MAX``."""
+    ids: Dict[uuid.UUID, None] = {}
+    for part in raw:
+        for item in str(part).split(","):
+            if item.strip():
+                ids[uuid.UUID(item.strip())] = None
+    if len(ids) > settings.USER_LOOKUP_MAX:
+        raise ValueError(f"at most {settings.USER_LOOKUP_MAX} ids")
+    return list(ids)
+
+
+class ProfileCache:
+    """``UserOut``-shaped dicts by user id, each kept ``ttl`` seconds."""
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[uuid.UUID, Tuple[float, dict]]" = OrderedDict()
+
+    def get(self, user_id: uuid.UUID) -> Optional[dict]:
+        entry = self._entries.get(user_id)
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        self._entries.move_to_end(user_id)
+        return entry[1]
+
+    def put(self, profile: dict) -> None:
+        self._entries[profile["id"]] = (time.monotonic() + self.ttl, profile)
+        self._entries.move_to_end(profile["id"])
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: uuid.UUID) -> None:
+        self._entries.pop(user_id, None)
+
+    async def lookup(self, db: AsyncSession, ids: List[uuid.UUID]) -> Dict[str, dict]:
+        """Profiles of ``ids`` keyed by ``str(id)``; unknown ids are left out."""
+        found: Dict[str, dict] = {}
+        missing = []
+        for user_id in ids:
+            profile = self.get(user_id)
+            if profile is None:
+                missing.append(user_id)
+            else:
+                found[str(user_id)] = profile
+        if missing:
+            for row in (await db.execute(user_rows_query(missing))).all():
+                profile = user_from_row(row)
+                self.put(profile)
+                found[str(profile["id"])] = profile
+        return found
+
+
+profiles = ProfileCache(settings.PROFILE_CACHE_TTL, settings.PROFILE_CACHE_SIZE)
@@ -0,0 +1,89 @@
+"""Per-endpoint SQL statement budgets, to catch N+1 regressions."""
+
+import logging
+from typing import Awaitable, Callable, Optional
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.config import settings
+from app.metrics import QUERY_BUDGET_OVERRUNS, QueryStats, track_queries
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(RuntimeError):
+    pass
+
+
+def query_budget(max_queries: int):
+    """Attach a statement budget to an endpoint function."""
+    def decorator(func):
+        func.__query_budget__ = max_queries
+        return func
+    return decorator
+
+
+def check_budget(name: str, budget: Optional[int], stats: QueryStats, strict: Optional[bool] = None) -> bool:
+    """Count and log an overrun, raising instead when ``strict`` (by default
+    ``QUERY_BUDGET_STRICT``).  Returns whether the budget was exceeded."""
+    if budget is None or stats.count <= budget:
+        return False
+    message = f"{name} issued {stats.count} SQL statements, budget is {budget}"
+    QUERY_BUDGET_OVERRUNS.labels(name).inc()
+    if settings.QUERY_BUDGET_STRICT if strict is None else strict:
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
+    return True
+
+
+class QueryBudgetMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        checked = False
+
+        def check(strict: Optional[bool] = None) -> None:
+            nonlocal checked
+            route = scope.get("route")
+            budget = getattr(getattr(route, "endpoint", None), "__query_budget__", None)
+            if budget is not None and not checked:
+                checked = check_budget(f"{scope['method']} {route.path}", budget, stats, strict)
+
+        async def send_checked(message: Message) -> None:
+            # strict mode can still turn the response into a 500 until it starts
+            if message["type"] == "http.response.start":
+                check()
+            await send(message)
+
+        with track_queries() as stats:
+            await self.app(scope, receive, send_checked)
+        # statements a streaming body issued after the response started
+        check(strict=False)
+
+
+async def assert_constant_queries(
+    call: Callable[[], Awaitable],
+    grow: Callable[[], Awaitable],
+    rounds: int = 3,
+) -> int:
+    """Run ``call`` ``rounds`` times, awaiting ``grow`` (which adds rows the call
+    will see) between runs, and fail unless every run issued the same number of
+    statements.  Returns that number.
+
+    ``call`` must run the app in the current task, e.g. through
+    ``httpx.AsyncClient(transport=httpx.ASGITransport(app))``.
+    """
+    counts = []
+    for i in range(rounds):
+        if i:
+            await grow()
+        with track_queries() as stats:
+            await call()
+        counts.append(stats.count)
+    if len(set(counts)) != 1:
+        raise AssertionError(f"SQL statement count grows with data: {counts}")
+    return counts[0]
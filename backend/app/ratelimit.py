@@ -0,0 +1,158 @@
+"""Per-user admission control and load shedding."""
+
+import math
+import time
+from collections import Counter, OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+
+from fastapi import HTTPException, status
+from starlette.requests import HTTPConnection
+
+from app.config import settings
+from app.database import pool_waits
+from app.metrics import SHED_REQUESTS
+from app.security import token_subject
+
+# never limited or shed: scrapes and the admin tools you'd use to investigate
+EXEMPT_PREFIXES = ("/metrics", "/health", "/api/admin")
+
+
+def parse_limit(spec: str) -> Tuple[float, float]:
+    """``"5/20"`` -> (5 tokens per second, burst of 20)."""
+    rate, _, burst = spec.partition("/")
+    rate_f = float(rate)
+    burst_f = float(burst) if burst else max(rate_f, 1.0)
+    if rate_f <= 0 or burst_f < 1:
+        raise ValueError(f"rate limit {spec!r}: the rate must be positive and the burst at least 1")
+    return rate_f, burst_f
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "stamp")
+
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = now
+
+    def wait(self, now: float, n: int = 1) -> float:
+        """Seconds until ``n`` tokens are available (0 if they are now, inf if
+        ``n`` is more than the burst); spends nothing."""
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        if self.tokens >= n:
+            return 0.0
+        if n > self.burst:
+            return math.inf
+        return (n - self.tokens) / self.rate
+
+    def take(self, now: float, n: int = 1) -> float:
+        """Spend ``n`` tokens together; returns 0, or ``wait`` without spending any."""
+        wait = self.wait(now, n)
+        if not wait:
+            self.tokens -= n
+        return wait
+
+
+class RateLimiter:
+    """Token buckets keyed by (limit name, subject), least recently used dropped first."""
+
+    def __init__(self, limits: Dict[str, str], max_buckets: int = 100_000):
+        self.limits = {name: parse_limit(spec) for name, spec in limits.items()}
+        self.max_buckets = max_buckets
+        self._buckets: "OrderedDict[Tuple[str, str], TokenBucket]" = OrderedDict()
+
+    def check(self, costs: Dict[str, int], subject: str) -> float:
+        """0 if ``subject`` may spend ``costs`` (tokens per limit name; unknown
+        names are free), and then they are spent; otherwise the seconds to
+        wait, and nothing is spent."""
+        now = time.monotonic()
+        charges = [(self._bucket(name, subject, now), n) for name, n in costs.items() if name in self.limits]
+        wait = max((bucket.wait(now, n) for bucket, n in charges), default=0.0)
+        if not wait:
+            for bucket, n in charges:
+                bucket.take(now, n)
+        return wait
+
+    def burst(self, name: str) -> float:
+        """Most tokens limit ``name`` allows at once (inf if there is no such limit)."""
+        limit = self.limits.get(name)
+        return math.inf if limit is None else limit[1]
+
+    def _bucket(self, name: str, subject: str, now: float) -> TokenBucket:
+        key = (name, subject)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(*self.limits[name], now)
+            if len(self._buckets) > self.max_buckets:
+                # an evicted bucket has usually refilled anyway
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket
+
+
+limiter = RateLimiter(settings.RATE_LIMITS)
+
+
+def overloaded() -> bool:
+    return settings.OVERLOAD_SHEDDING_ENABLED and pool_waits.average() > settings.OVERLOAD_POOL_WAIT
+
+
+def rate_limited(names: Iterable[str], subject: str) -> float:
+    """Seconds to wait if any of the limits ``names`` is exhausted for ``subject``, else 0.
+
+    A name listed n times costs n tokens of that limit.  Tokens are only
+    spent when every limit has enough, so a rejected request costs nothing.
+    """
+    if not settings.RATE_LIMIT_ENABLED:
+        return 0.0
+    return limiter.check(Counter(names), subject)
+
+
+def retry_after_header(seconds: float) -> Dict[str, str]:
+    return {"Retry-After": str(max(1, math.ceil(seconds)))}
+
+
+def _subject(request: HTTPConnection) -> str:
+    token: Optional[str] = None
+    scheme, _, credentials = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() == "bearer":
+        token = credentials
+    user_id = token_subject(token)
+    if user_id is not None:
+        return user_id
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+
+async def admission(request: HTTPConnection) -> None:
+    """App-wide dependency: runs before any endpoint dependency opens a session.
+
+    Sockets are checked in ``app.routers.ws`` instead, per frame.
+    """
+    if request.scope["type"] != "http":
+        return
+    route = request.scope.get("route")
+    path = getattr(route, "path", request.url.path)
+    if path.startswith(EXEMPT_PREFIXES):
+        return
+    if overloaded():
+        SHED_REQUESTS.labels("http", "overloaded").inc()
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server is overloaded, try again later",
+            headers=retry_after_header(settings.OVERLOAD_RETRY_AFTER),
+        )
+    wait = rate_limited(("http", f"http:{getattr(route, 'name', '')}"), _subject(request))
+    if wait:
+        SHED_REQUESTS.labels("http", "rate_limited").inc()
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many requests",
+            headers=retry_after_header(wait),
+        )
+
+
+def ws_error(code: str, op: Optional[str], retry_after: float) -> dict:
+    return {"type": "error", "code": code, "op": op, "retry_after": round(retry_after, 2)}
@@ -0,0 +1,162 @@
+"""Newest messages of active chats, kept in memory for the first history page."""
+
+import uuid
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.metrics import MESSAGE_CACHE_LOOKUPS
+from app.serializers import dumps
+
+
+class _Ring:
+    __slots__ = ("seq", "status_version", "messages", "sizes", "whole")
+
+    def __init__(self, seq: int, status_version: int, messages: List[dict], whole: bool):
+        self.seq = seq
+        self.status_version = status_version  # chats.status_version of the statuses held
+        self.messages = messages  # oldest first
+        self.sizes = [len(dumps(m)) for m in messages]
+        self.whole = whole  # holds the chat's entire history
+
+    @property
+    def size(self) -> int:
+        return sum(self.sizes)
+
+    def index(self, message_id: str) -> Optional[int]:
+        for i, m in enumerate(self.messages):
+            if str(m["id"]) == message_id:
+                return i
+        return None
+
+
+class RecentMessages:
+    def __init__(self, per_chat: int, max_bytes: int):
+        self.per_chat = per_chat
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._rings: "OrderedDict[uuid.UUID, _Ring]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._rings)
+
+    def page(self, chat_id: uuid.UUID, last_seq: int, status_version: int, limit: int) -> Optional[List[dict]]:
+        """The newest ``limit`` messages, oldest first, or ``None`` on a miss
+        (including when another process changed a status since)."""
+        ring = self._rings.get(chat_id)
+        if (
+            ring is None
+            or ring.seq < last_seq
+            or ring.status_version < status_version
+            or (len(ring.messages) < limit and not ring.whole)
+        ):
+            MESSAGE_CACHE_LOOKUPS.labels("miss").inc()
+            return None
+        MESSAGE_CACHE_LOOKUPS.labels("hit").inc()
+        self._rings.move_to_end(chat_id)
+        # copies: the compact shape pops the embedded users out of them
+        return [dict(m) for m in ring.messages[-limit:]]
+
+    def fill(self, chat_id: uuid.UUID, last_seq: int, status_version: int, messages: List[dict], whole: bool) -> None:
+        """Store a first page read at ``last_seq`` and ``status_version``
+        (oldest first) unless a ring at least as new is held."""
+        if self.per_chat <= 0:
+            return
+        ring = self._rings.get(chat_id)
+        if ring is not None and ring.seq >= last_seq and ring.status_version >= status_version:
+            return
+        messages = [dict(m) for m in messages[-self.per_chat:]]
+        self._put(chat_id, _Ring(last_seq, status_version, messages, whole))
+
+    def apply(self, payload: dict) -> None:
+        """Apply a committed chat event (see ``app.events``)."""
+        chat_id = uuid.UUID(payload["chat_id"])
+        ring = self._rings.get(chat_id)
+        if ring is None or payload["seq"] <= ring.seq:
+            return
+        if payload["seq"] != ring.seq + 1:  # missed one
+            self.invalidate(chat_id)
+            return
+        ring.seq = payload["seq"]
+        kind = payload["type"]
+        if kind == "new_message":
+            message = payload["message"]
+            if ring.index(str(message["id"])) is None:
+                ring.messages.append(message)
+                ring.sizes.append(len(dumps(message)))
+                self.bytes += ring.sizes[-1]
+                if len(ring.messages) > self.per_chat:
+                    ring.messages.pop(0)
+                    self.bytes -= ring.sizes.pop(0)
+                    ring.whole = False
+        elif kind == "message_edited":
+            message = payload["message"]
+            i = ring.index(str(message["id"]))
+            if i is not None:
+                ring.messages[i] = message
+                size = len(dumps(message))
+                self.bytes += size - ring.sizes[i]
+                ring.sizes[i] = size
+        elif kind == "message_deleted":
+            i = ring.index(payload["message_id"])
+            if i is not None:
+                del ring.messages[i]
+                self.bytes -= ring.sizes.pop(i)
+        self._evict()
+
+    def update(self, chat_id: uuid.UUID, status_version: int, changes: Dict[uuid.UUID, dict]) -> None:
+        """Apply a committed status change: ``changes`` maps message ids to
+        the fields (``status``, ``delivered_count``, ...) it set, and
+        ``status_version`` is the chat's version after it."""
+        ring = self._rings.get(chat_id)
+        if ring is None or status_version <= ring.status_version:
+            return
+        if status_version != ring.status_version + 1:  # missed one
+            self.invalidate(chat_id)
+            return
+        ring.status_version = status_version
+        for message_id, fields in changes.items():
+            i = ring.index(str(message_id))
+            if i is not None:
+                ring.messages[i] = {**ring.messages[i], **fields}
+
+    def invalidate(self, chat_id: uuid.UUID) -> None:
+        ring = self._rings.pop(chat_id, None)
+        if ring is not None:
+            self.bytes -= ring.size
+
+    def _put(self, chat_id: uuid.UUID, ring: _Ring) -> None:
+        self.invalidate(chat_id)
+        self._rings[chat_id] = ring
+        self.bytes += ring.size
+        self._evict()
+
+    def _evict(self) -> None:
+        while self.bytes > self.max_bytes and self._rings:
+            _, ring = self._rings.popitem(last=False)
+            self.bytes -= ring.size
+
+
+recent_messages = RecentMessages(settings.MESSAGE_CACHE_PER_CHAT, settings.MESSAGE_CACHE_MAX_BYTES)
+
+
+# ---------- applying committed events ----------
+
+def stage(db: AsyncSession, payloads: Iterable[dict]) -> None:
+    """Apply chat event ``payloads`` to the cache once ``db`` commits."""
+    db.info.setdefault("recent_events", []).extend(payloads)
+
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(session):
+    for payload in session.info.pop("recent_events", ()):
+        recent_messages.apply(payload)
+
+
+@event.listens_for(Session, "after_rollback")
+def _after_rollback(session):
+    session.info.pop("recent_events", None)
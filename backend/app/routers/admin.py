@@ -0,0 +1,43 @@
+"""Admin diagnostics router: loop stalls and on-demand profiling of this worker."""
+
+import threading
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse
+
+from app.config import settings
+from app.diagnostics import ProfilerBusy, sample_stacks, watchdog
+from app.models import User
+from app.security import get_admin_user
+
+router = APIRouter(prefix="/api/admin", tags=["admin"])
+
+
+@router.get("/loop-stalls")
+async def loop_stalls(_: User = Depends(get_admin_user)):
+    """Most recent event-loop stalls seen by the watchdog, oldest first.
+
+    ``duration`` is ``None`` while the stall is still in progress.
+    """
+    stalls = [{k: v for k, v in s.items() if k != "beat"} for s in watchdog.stalls]
+    return {"threshold": watchdog.threshold, "stalls": stalls}
+
+
+@router.get("/profile", response_class=PlainTextResponse)
+async def profile(
+    seconds: float = Query(10, gt=0, le=settings.PROFILE_MAX_SECONDS),
+    interval_ms: float = Query(5, ge=1, le=1000),
+    all_threads: bool = Query(False, description="Sample every thread, not just the event loop"),
+    _: User = Depends(get_admin_user),
+):
+    """Sample this worker's stacks for ``seconds`` and return them collapsed
+    (``frame;frame;frame count`` per line), ready for flamegraph.pl or speedscope.
+
+    With several workers, each request profiles whichever worker served it.
+    """
+    thread_id = None if all_threads else threading.get_ident()
+    try:
+        return await run_in_threadpool(sample_stacks, thread_id, seconds, interval_ms / 1000)
+    except ProfilerBusy:
+        raise HTTPException(409, "A profile is already running")
@@ -1,10 +1,12 @@
 """Auth router: register, login (password), SMS OTP flow."""
 
+import logging
 import random
 import string
 from datetime import datetime, timedelta, timezone
 
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
@@ -17,6 +19,7 @@ from app.schemas import (
 from app.security import hash_password, verify_password, create_access_token, get_current_user
 
 router = APIRouter(prefix="/api/auth", tags=["auth"])
+logger = logging.getLogger(__name__)
 
 
 @router.post("/register", response_model=TokenResponse, status_code=status.HTTP_201_CREATED)
@@ -25,10 +28,11 @@ async def register(body: RegisterRequest, db: AsyncSession = Depends(get_db)):
     if existing.scalar_one_or_none():
         raise HTTPException(status_code=400, detail="Phone already registered")
 
+    # bcrypt is deliberately slow; keep it off the event loop
     user = User(
         phone=body.phone,
         display_name=body.display_name or body.phone,
-        password_hash=hash_password(body.password) if body.password else None,
+        password_hash=await run_in_threadpool(hash_password, body.password) if body.password else None,
     )
     db.add(user)
     await db.commit()
@@ -44,7 +48,7 @@ async def login_password(body: LoginPasswordRequest, db: AsyncSession = Depends(
     user = result.scalar_one_or_none()
     if not user or not user.password_hash:
         raise HTTPException(status_code=401, detail="Invalid credentials")
-    if not verify_password(body.password, user.password_hash):
+    if not await run_in_threadpool(verify_password, body.password, user.password_hash):
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
     token = create_access_token({"sub": str(user.id)})
@@ -53,7 +57,7 @@ async def login_password(body: LoginPasswordRequest, db: AsyncSession = Depends(
 
 @router.post("/sms/request")
 async def request_sms_code(body: RequestSMSCode, db: AsyncSession = Depends(get_db)):
-    """Simulate sending an SMS code (prints to console)."""
+    """Simulate sending an SMS code (logged)."""
     code = "".join(random.choices(string.digits, k=6))
     sms = SMSCode(
         phone=body.phone,
@@ -63,7 +67,7 @@ async def request_sms_code(body: RequestSMSCode, db: AsyncSession = Depends(get_
     db.add(sms)
     await db.commit()
     # In production this would go through an SMS gateway
-    print(f"[SMS] Code for {body.phone}: {code}")
+    logger.info("[SMS] Code sent to %s", body.phone)  # the code itself stays out of the logs
     return {"detail": "SMS code sent", "code_for_dev": code}
 
 
@@ -1,19 +1,33 @@
 """Chat & message CRUD router."""
 
-import os
 import uuid
 from pathlib import Path
-from typing import List
+from typing import Dict, List, Optional, Tuple, Union
 
-from fastapi import APIRouter, Depends, HTTPException, status, Query, UploadFile, File
-from sqlalchemy import select, func, and_
+import aiofiles
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status, Query, UploadFile, File
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select, func, and_, any_, exists, literal, not_, true, union_all
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
 
-from app.database import get_db
-from app.models import Chat, Message, User, chat_members, ReadReceipt
-from app.schemas import ChatCreate, ChatOut, MessageCreate, MessageOut, MessageStatusUpdate, MessageEdit, ForwardMessageRequest, UserOut
-from app.security import get_current_user
+from app.chat_io import ImportFailed, export_chat, import_chat, iter_lines
+from app.database import engine, get_db, get_read_db, read_engine
+from app.etags import collection_etag, etag, matches, not_modified, set_etag
+from app.config import settings
+from app.events import chat_audience, record_chat_event, record_user_events
+from app.large_groups import bump_status_version, uuid_array
+from app.messages import post_message, set_message_content
+from app.models import Chat, Message, MessageTombstone, User, chat_members, ReadReceipt
+from app import outbox
+from app.query_budget import query_budget
+from app.recent import recent_messages
+from app.schemas import ChatCreate, ChatOut, ChatListCompact, MemberPage, MessageCreate, MessageOut, MessagePageCompact, MessageStatusUpdate, MessageEdit, ForwardMessageRequest
+from app.security import get_admin_user, get_current_user, get_read_user
+from app.segments import find_message, older_messages, tombstone_seqs
+from app.serializers import (
+    ORJSONResponse, chat_dict, member_rows_query, message_rows_query, message_from_row, user_dict, user_from_row,
+    compact_chats, compact_messages, to_json,
+)
 from app.routers.ws import manager
 
 router = APIRouter(prefix="/api/chats", tags=["chats"])
@@ -21,30 +35,71 @@ router = APIRouter(prefix="/api/chats", tags=["chats"])
 
 # ---------- helpers ----------
 
-async def _build_chat_out(chat: Chat, db: AsyncSession) -> dict:
-    """Build ChatOut dict with last_message."""
-    last_msg_result = await db.execute(
-        select(Message)
-        .where(Message.chat_id == chat.id)
-        .order_by(Message.created_at.desc())
+async def _build_chat_outs(chats: List[Chat], db: AsyncSession) -> List[dict]:
+    """Build ChatOut dicts, fetching every chat's member preview in one query
+    and its last message in another."""
+    if not chats:
+        return []
+    chat_ids = select(Chat.id).where(Chat.id.in_([c.id for c in chats])).subquery()
+    # walks the (chat_id, user_id) primary key, however big the chat
+    preview = (
+        member_rows_query()
+        .where(chat_members.c.chat_id == chat_ids.c.id)
+        .order_by(chat_members.c.user_id)
+        .limit(settings.CHAT_MEMBER_PREVIEW)
+        .lateral()
+    )
+    result = await db.execute(select(*preview.c).select_from(chat_ids.join(preview, true())))
+    members: Dict[uuid.UUID, List[dict]] = {}
+    for row in result.all():
+        members.setdefault(row[0], []).append(user_from_row(row[1:]))
+
+    last = (
+        message_rows_query()
+        .where(Message.chat_id == chat_ids.c.id)
+        .order_by(Message.created_at.desc(), Message.seq.desc())
         .limit(1)
+        .lateral()
     )
-    last_msg = last_msg_result.scalar_one_or_none()
-    data = {
-        "id": chat.id,
-        "chat_type": chat.chat_type,
-        "title": chat.title,
-        "avatar_url": chat.avatar_url,
-        "created_at": chat.created_at,
-        "members": [UserOut.model_validate(m) for m in chat.members],
-        "last_message": MessageOut.model_validate(last_msg) if last_msg else None,
-    }
-    return data
+    result = await db.execute(select(*last.c).select_from(chat_ids.join(last, true())))
+    last_messages = {m["chat_id"]: m for m in map(message_from_row, result.all())}
+    return [chat_dict(c, members.get(c.id, []), last_messages.get(c.id)) for c in chats]
+
+
+async def _build_chat_out(chat: Chat, db: AsyncSession) -> dict:
+    return (await _build_chat_outs([chat], db))[0]
+
+
+async def _load_chat(db: AsyncSession, chat_id: uuid.UUID, user_id: uuid.UUID) -> Tuple[Chat, bool]:
+    """The chat (404 if missing) and whether ``user_id`` is a member, in one query."""
+    is_member = exists().where(chat_members.c.chat_id == Chat.id, chat_members.c.user_id == user_id)
+    row = (await db.execute(
+        select(Chat, is_member).where(Chat.id == chat_id).execution_options(populate_existing=True)
+    )).first()
+    if row is None:
+        raise HTTPException(404, "Chat not found")
+    return row[0], row[1]
+
+
+async def _compacted_message(db: AsyncSession, chat_id: uuid.UUID, message_id: uuid.UUID) -> Optional[dict]:
+    """A message of the chat that was moved into segments, if there is one."""
+    row = (await db.execute(select(Chat.compacted_seq, tombstone_seqs(Chat.id)).where(Chat.id == chat_id))).first()
+    if row is None or not row.compacted_seq:
+        return None
+    return await find_message(db, chat_id, message_id, row[1])
+
+
+def _parse_member_cursor(raw: str) -> Tuple[bool, uuid.UUID]:
+    online, _, user_id = raw.partition("-")
+    if online not in ("0", "1"):
+        raise ValueError(raw)
+    return online == "1", uuid.UUID(user_id)
 
 
 # ---------- endpoints ----------
 
 @router.post("", response_model=ChatOut, status_code=status.HTTP_201_CREATED)
+@query_budget(10)
 async def create_chat(body: ChatCreate, db: AsyncSession = Depends(get_db), user: User = Depends(get_current_user)):
     chat = Chat(
         chat_type=body.chat_type,
@@ -58,71 +113,125 @@ async def create_chat(body: ChatCreate, db: AsyncSession = Depends(get_db), user
     await db.execute(chat_members.insert().values(chat_id=chat.id, user_id=user.id))
 
     # Add other members
+    requested = {mid for mid in body.member_ids if mid != user.id}
     added_member_ids = []
-    for mid in body.member_ids:
-        if mid != user.id:
-            member = await db.execute(select(User).where(User.id == mid))
-            if member.scalar_one_or_none():
-                await db.execute(chat_members.insert().values(chat_id=chat.id, user_id=mid))
-                added_member_ids.append(mid)
-
-    await db.commit()
+    if requested:
+        existing = await db.execute(select(User.id).where(User.id.in_(requested)))
+        added_member_ids = list(existing.scalars().all())
+    if added_member_ids:
+        await db.execute(chat_members.insert(), [{"chat_id": chat.id, "user_id": mid} for mid in added_member_ids])
 
+    await record_user_events(db, {"type": "chat_added", "chat_id": str(chat.id)}, f"chat:{chat.id}", [user.id, *added_member_ids])
     # Notify all added members via WebSocket
-    for mid in added_member_ids:
-        await manager.send_to_user(mid, {
-            "type": "chat_added",
-            "chat_id": str(chat.id),
-        })
+    if added_member_ids:
+        outbox.enqueue(db, {"type": "chat_added", "chat_id": str(chat.id)}, user_ids=added_member_ids)
+    await db.commit()
 
-    # Reload with members
-    result = await db.execute(
-        select(Chat).options(selectinload(Chat.members)).where(Chat.id == chat.id)
-    )
+    # Reload for the trigger-maintained member_count
+    result = await db.execute(select(Chat).where(Chat.id == chat.id).execution_options(populate_existing=True))
     chat = result.scalar_one()
     return await _build_chat_out(chat, db)
 
 
-@router.get("", response_model=List[ChatOut])
-async def list_chats(db: AsyncSession = Depends(get_db), user: User = Depends(get_current_user)):
+@router.get("", response_model=Union[List[ChatOut], ChatListCompact])
+@query_budget(4)
+async def list_chats(
+    request: Request,
+    compact: bool = Query(False, description="Return each user once in a top-level `users` map"),
+    db: AsyncSession = Depends(get_read_db),
+    user: User = Depends(get_read_user),
+):
     result = await db.execute(
         select(Chat)
         .join(chat_members, chat_members.c.chat_id == Chat.id)
         .where(chat_members.c.user_id == user.id)
-        .options(selectinload(Chat.members))
         .order_by(Chat.created_at.desc())
     )
     chats = result.scalars().unique().all()
-    out = []
-    for c in chats:
-        out.append(await _build_chat_out(c, db))
-    return out
+    tag = collection_etag("chats", ((c.id, c.version) for c in chats), compact)
+    if matches(request, tag):
+        return not_modified(tag)
+    out = await _build_chat_outs(chats, db)
+    response = ORJSONResponse(compact_chats(out) if compact else out)
+    set_etag(response, tag)
+    return response
 
 
 @router.get("/{chat_id}", response_model=ChatOut)
-async def get_chat(chat_id: uuid.UUID, db: AsyncSession = Depends(get_db), user: User = Depends(get_current_user)):
-    result = await db.execute(
-        select(Chat).options(selectinload(Chat.members)).where(Chat.id == chat_id)
-    )
-    chat = result.scalar_one_or_none()
-    if not chat:
-        raise HTTPException(404, "Chat not found")
-    if user.id not in [m.id for m in chat.members]:
+@query_budget(4)
+async def get_chat(
+    chat_id: uuid.UUID,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_read_db),
+    user: User = Depends(get_read_user),
+):
+    chat, is_member = await _load_chat(db, chat_id, user.id)
+    if not is_member:
         raise HTTPException(403, "Not a member of this chat")
+    tag = etag("chat", chat.id, chat.version)
+    if matches(request, tag):
+        return not_modified(tag)
+    set_etag(response, tag)
     return await _build_chat_out(chat, db)
 
 
+@router.get("/{chat_id}/members", response_model=MemberPage)
+@query_budget(3)
+async def list_members(
+    chat_id: uuid.UUID,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = Query(None, description="`next_cursor` of the previous page"),
+    db: AsyncSession = Depends(get_read_db),
+    user: User = Depends(get_read_user),
+):
+    """Members a page at a time: those online (on this server) first, then the
+    rest, each by user id.  Someone who connects or leaves between pages may
+    be listed twice or skipped."""
+    after_online, after_id = True, None
+    if cursor:
+        try:
+            after_online, after_id = _parse_member_cursor(cursor)
+        except ValueError:
+            raise HTTPException(400, "Invalid cursor")
+    _, is_member = await _load_chat(db, chat_id, user.id)
+    if not is_member:
+        raise HTTPException(403, "Not a member of this chat")
+
+    online = chat_members.c.user_id == any_(uuid_array(manager.active))
+    in_chat = chat_members.c.chat_id == chat_id
+    online_page = member_rows_query().where(in_chat, online)
+    offline_page = member_rows_query().where(in_chat, not_(online))
+    if after_id is not None:
+        if after_online:
+            online_page = online_page.where(chat_members.c.user_id > after_id)
+        else:
+            offline_page = offline_page.where(chat_members.c.user_id > after_id)
+    # each half walks the primary key; past the online members only the offline one runs
+    pages = [offline_page.add_columns(literal(False).label("online"))]
+    if after_online:
+        pages.insert(0, online_page.add_columns(literal(True).label("online")))
+    parts = [p.order_by(chat_members.c.user_id).limit(limit + 1).subquery().select() for p in pages]
+    combined = union_all(*parts).subquery()
+    rows = (await db.execute(
+        select(combined).order_by(combined.c.online.desc(), combined.c.id).limit(limit + 1)
+    )).all()
+
+    members = [{**user_from_row(row[1:-1]), "online": row[-1]} for row in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        last = members[-1]
+        next_cursor = f"{int(last['online'])}-{last['id']}"
+    return ORJSONResponse({"members": members, "next_cursor": next_cursor})
+
+
 @router.post("/{chat_id}/members")
+@query_budget(8)
 async def add_member(chat_id: uuid.UUID, member_id: uuid.UUID = Query(...), db: AsyncSession = Depends(get_db), user: User = Depends(get_current_user)):
-    result = await db.execute(
-        select(Chat).options(selectinload(Chat.members)).where(Chat.id == chat_id)
-    )
-    chat = result.scalar_one_or_none()
-    if not chat:
-        raise HTTPException(404, "Chat not found")
+    chat, is_member = await _load_chat(db, chat_id, user.id)
     if chat.chat_type != "group":
         raise HTTPException(400, "Cannot add members to a private chat")
-    if user.id not in [m.id for m in chat.members]:
+    if not is_member:
         raise HTTPException(403, "Not a member")
 
     target = await db.execute(select(User).where(User.id == member_id))
@@ -138,28 +247,89 @@ async def add_member(chat_id: uuid.UUID, member_id: uuid.UUID = Query(...), db:
         raise HTTPException(400, "User already a member")
 
     await db.execute(chat_members.insert().values(chat_id=chat_id, user_id=member_id))
-    await db.commit()
-
-    # Notify the added user via WebSocket so they refresh their chat list
-    await manager.send_to_user(member_id, {
-        "type": "chat_added",
+    await record_user_events(db, {"type": "chat_added", "chat_id": str(chat_id)}, f"chat:{chat_id}", [member_id])
+    await record_user_events(db, {
+        "type": "chat_members_changed",
         "chat_id": str(chat_id),
-    })
+        "user_id": str(member_id),
+    }, f"chat:{chat_id}", chat_audience(chat_id).where(chat_members.c.user_id != member_id))
+    # Notify the added user via WebSocket so they refresh their chat list
+    outbox.enqueue(db, {"type": "chat_added", "chat_id": str(chat_id)}, user_ids=[member_id])
+    await db.commit()
 
     return {"detail": "Member added"}
 
 
 # ---------- messages ----------
 
-@router.get("/{chat_id}/messages", response_model=List[MessageOut])
+@router.get("/{chat_id}/messages", response_model=Union[List[MessageOut], MessagePageCompact])
+@query_budget(5)
 async def list_messages(
     chat_id: uuid.UUID,
     limit: int = Query(50, le=200),
     offset: int = Query(0),
-    db: AsyncSession = Depends(get_db),
-    user: User = Depends(get_current_user),
+    before: Optional[int] = Query(None, description="Only messages with `seq` below this; pages into compacted history"),
+    compact: bool = Query(False, description="Return each user once in a top-level `users` map"),
+    db: AsyncSession = Depends(get_read_db),
+    user: User = Depends(get_read_user),
 ):
-    # Check membership
+    # Check membership, how far the chat's event log goes, whether it has segments
+    # and which compacted messages were deleted since
+    membership = await db.execute(
+        select(Chat.last_seq, Chat.status_version, Chat.compacted_seq, tombstone_seqs(Chat.id))
+        .join(chat_members, chat_members.c.chat_id == Chat.id)
+        .where(Chat.id == chat_id, chat_members.c.user_id == user.id)
+    )
+    row = membership.first()
+    if row is None:
+        raise HTTPException(403, "Not a member of this chat")
+    last_seq, status_version, compacted_seq, deleted = row
+
+    first_page = before is None and offset == 0
+    if first_page:
+        cached = recent_messages.page(chat_id, last_seq, status_version, limit)
+        if cached is not None:
+            return ORJSONResponse(compact_messages(cached) if compact else cached)
+
+    # newest first by seq on both sides of the boundary with the segments,
+    # whose rows are left out here even if a crashed compaction left them behind
+    query = message_rows_query().where(Message.chat_id == chat_id).order_by(Message.seq.desc())
+    if compacted_seq:
+        query = query.where(Message.seq > compacted_seq)
+    if before is not None:
+        query = query.where(Message.seq < before)
+    else:
+        query = query.offset(offset)
+    result = await db.execute(query.limit(limit))
+    messages = [message_from_row(r) for r in result.all()]
+
+    # Past the oldest row still in Postgres: continue in the compacted segments
+    if len(messages) < limit and compacted_seq:
+        if messages:
+            messages += await older_messages(db, chat_id, messages[-1]["seq"], limit - len(messages), deleted=deleted)
+        elif before is not None or offset == 0:
+            messages = await older_messages(db, chat_id, before, limit, deleted=deleted)
+        else:
+            # the offset is past every hot row: the rest of it skips into the segments
+            hot = (await db.execute(
+                select(func.count()).select_from(Message)
+                .where(Message.chat_id == chat_id, Message.seq > compacted_seq)
+            )).scalar_one()
+            messages = await older_messages(db, chat_id, None, limit, skip=max(offset - hot, 0), deleted=deleted)
+    messages.reverse()
+    if first_page:
+        recent_messages.fill(chat_id, last_seq, status_version, messages, whole=len(messages) < limit)
+    return ORJSONResponse(compact_messages(messages) if compact else messages)
+
+
+@router.get("/{chat_id}/export")
+async def export_messages(
+    chat_id: uuid.UUID,
+    gzip: bool = Query(False, description="Send a .ndjson.gz file instead of plain NDJSON"),
+    db: AsyncSession = Depends(get_read_db),
+    user: User = Depends(get_read_user),
+):
+    """Stream the whole chat as NDJSON: a chat header line, then every message oldest first."""
     membership = await db.execute(
         select(chat_members).where(
             and_(chat_members.c.chat_id == chat_id, chat_members.c.user_id == user.id)
@@ -167,20 +337,43 @@ async def list_messages(
     )
     if not membership.first():
         raise HTTPException(403, "Not a member of this chat")
+    await db.commit()  # the export reads on its own connection
 
-    result = await db.execute(
-        select(Message)
-        .options(selectinload(Message.sender), selectinload(Message.forwarded_from))
-        .where(Message.chat_id == chat_id)
-        .order_by(Message.created_at.desc())
-        .limit(limit)
-        .offset(offset)
+    filename = f"chat-{chat_id}.ndjson" + (".gz" if gzip else "")
+    return StreamingResponse(
+        export_chat(read_engine(user.id), chat_id, gzip=gzip),
+        media_type="application/gzip" if gzip else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
     )
-    messages = result.scalars().all()
-    return [MessageOut.model_validate(m) for m in reversed(messages)]
+
+
+@router.post("/{chat_id}/import")
+async def import_messages(
+    chat_id: uuid.UUID,
+    file: UploadFile = File(..., description="NDJSON in the export format, optionally gzipped"),
+    db: AsyncSession = Depends(get_db),
+    _: User = Depends(get_admin_user),
+):
+    """Bulk-load messages into a chat with COPY (admin only: senders are taken from the file)."""
+    chat = await db.get(Chat, chat_id)
+    if not chat:
+        raise HTTPException(404, "Chat not found")
+    if chat.last_seq:
+        raise HTTPException(409, "The chat already has messages; import into a new chat")
+    await db.commit()  # batches commit on their own connections
+
+    async def chunks():
+        while chunk := await file.read(1024 * 1024):
+            yield chunk
+
+    try:
+        return await import_chat(engine, chat_id, iter_lines(chunks()))
+    except ImportFailed as exc:
+        raise HTTPException(400, str(exc))
 
 
 @router.post("/{chat_id}/messages", response_model=MessageOut, status_code=status.HTTP_201_CREATED)
+@query_budget(8)
 async def send_message(
     chat_id: uuid.UUID,
     body: MessageCreate,
@@ -195,11 +388,9 @@ async def send_message(
     if not membership.first():
         raise HTTPException(403, "Not a member of this chat")
 
-    msg = Message(chat_id=chat_id, sender_id=user.id, content=body.content, status="sent")
-    db.add(msg)
+    message = await post_message(db, chat_id, user_dict(user), content=body.content)
     await db.commit()
-    await db.refresh(msg)
-    return MessageOut.model_validate(msg)
+    return ORJSONResponse(message, status_code=status.HTTP_201_CREATED)
 
 
 ALLOWED_IMAGE_TYPES = {"image/jpeg", "image/png", "image/gif", "image/webp"}
@@ -207,6 +398,7 @@ MAX_IMAGE_SIZE = 10 * 1024 * 1024  # 10 MB
 
 
 @router.post("/{chat_id}/messages/image", response_model=MessageOut, status_code=status.HTTP_201_CREATED)
+@query_budget(10)
 async def send_image_message(
     chat_id: uuid.UUID,
     file: UploadFile = File(...),
@@ -234,46 +426,22 @@ async def send_image_message(
     ext = file.filename.rsplit(".", 1)[-1] if "." in file.filename else "jpg"
     filename = f"{uuid.uuid4().hex}.{ext}"
 
-    from app.config import settings
     upload_dir = Path(settings.UPLOAD_DIR) / "chat_images"
     upload_dir.mkdir(parents=True, exist_ok=True)
 
     filepath = upload_dir / filename
-    with open(filepath, "wb") as f:
-        f.write(data)
+    async with aiofiles.open(filepath, "wb") as f:
+        await f.write(data)
 
     image_url = f"/uploads/chat_images/{filename}"
 
-    msg = Message(chat_id=chat_id, sender_id=user.id, content=caption.strip() or None, image_url=image_url, status="sent")
-    db.add(msg)
+    message = await post_message(db, chat_id, user_dict(user), content=caption.strip() or None, image_url=image_url)
     await db.commit()
-    await db.refresh(msg)
-
-    # Load sender relationship
-    result = await db.execute(
-        select(Message).options(selectinload(Message.sender)).where(Message.id == msg.id)
-    )
-    msg = result.scalar_one()
-
-    msg_out = MessageOut.model_validate(msg)
-
-    # Notify chat members via WebSocket
-    members_result = await db.execute(
-        select(chat_members.c.user_id).where(chat_members.c.chat_id == chat_id)
-    )
-    member_ids = [row[0] for row in members_result.fetchall()]
-
-    payload = {
-        "type": "new_message",
-        "message": msg_out.model_dump(mode="json"),
-    }
-    for uid in member_ids:
-        await manager.send_to_user(uid, payload)
-
-    return msg_out
+    return ORJSONResponse(message, status_code=status.HTTP_201_CREATED)
 
 
 @router.patch("/{chat_id}/messages/{message_id}/status", response_model=MessageOut)
+@query_budget(8)
 async def update_message_status(
     chat_id: uuid.UUID,
     message_id: uuid.UUID,
@@ -295,12 +463,15 @@ async def update_message_status(
         if not existing.scalar_one_or_none():
             db.add(ReadReceipt(message_id=message_id, user_id=user.id))
 
+    versions = await bump_status_version(db, [chat_id])
     await db.commit()
-    await db.refresh(msg)
-    return MessageOut.model_validate(msg)
+    recent_messages.update(chat_id, versions[chat_id], {message_id: {"status": body.status}})
+    result = await db.execute(message_rows_query().where(Message.id == message_id, Message.chat_id == chat_id))
+    return ORJSONResponse(message_from_row(result.one()))
 
 
 @router.get("/private/{user_id}", response_model=ChatOut)
+@query_budget(10)
 async def get_or_create_private_chat(
     user_id: uuid.UUID,
     db: AsyncSession = Depends(get_db),
@@ -308,31 +479,18 @@ async def get_or_create_private_chat(
 ):
     """Get existing private chat with a user, or create one."""
     # Find existing private chat with exactly these two users
-    my_chats = await db.execute(
-        select(chat_members.c.chat_id).where(chat_members.c.user_id == user.id)
+    my_chats = select(chat_members.c.chat_id).where(chat_members.c.user_id == user.id)
+    their_chats = select(chat_members.c.chat_id).where(chat_members.c.user_id == user_id)
+    chat_result = await db.execute(
+        select(Chat).where(
+            Chat.chat_type == "private",
+            Chat.id.in_(my_chats),
+            Chat.id.in_(their_chats),
+        ).limit(1)
     )
-    my_chat_ids = [row[0] for row in my_chats.fetchall()]
-
-    if my_chat_ids:
-        their_chats = await db.execute(
-            select(chat_members.c.chat_id).where(
-                and_(
-                    chat_members.c.user_id == user_id,
-                    chat_members.c.chat_id.in_(my_chat_ids),
-                )
-            )
-        )
-        common_chat_ids = [row[0] for row in their_chats.fetchall()]
-
-        for cid in common_chat_ids:
-            chat_result = await db.execute(
-                select(Chat).options(selectinload(Chat.members)).where(
-                    Chat.id == cid, Chat.chat_type == "private"
-                )
-            )
-            chat = chat_result.scalar_one_or_none()
-            if chat:
-                return await _build_chat_out(chat, db)
+    chat = chat_result.scalar_one_or_none()
+    if chat:
+        return await _build_chat_out(chat, db)
 
     # Create new private chat
     target = await db.execute(select(User).where(User.id == user_id))
@@ -344,11 +502,10 @@ async def get_or_create_private_chat(
     await db.flush()
     await db.execute(chat_members.insert().values(chat_id=chat.id, user_id=user.id))
     await db.execute(chat_members.insert().values(chat_id=chat.id, user_id=user_id))
+    await record_user_events(db, {"type": "chat_added", "chat_id": str(chat.id)}, f"chat:{chat.id}", [user.id, user_id])
     await db.commit()
 
-    result = await db.execute(
-        select(Chat).options(selectinload(Chat.members)).where(Chat.id == chat.id)
-    )
+    result = await db.execute(select(Chat).where(Chat.id == chat.id).execution_options(populate_existing=True))
     chat = result.scalar_one()
     return await _build_chat_out(chat, db)
 
@@ -356,6 +513,7 @@ async def get_or_create_private_chat(
 # ---------- edit / delete messages ----------
 
 @router.put("/{chat_id}/messages/{message_id}", response_model=MessageOut)
+@query_budget(11)
 async def edit_message(
     chat_id: uuid.UUID,
     message_id: uuid.UUID,
@@ -363,40 +521,30 @@ async def edit_message(
     db: AsyncSession = Depends(get_db),
     user: User = Depends(get_current_user),
 ):
-    result = await db.execute(
-        select(Message).options(selectinload(Message.sender)).where(
-            Message.id == message_id, Message.chat_id == chat_id
+    message = await set_message_content(db, chat_id, message_id, user_dict(user), body.content)
+    if message is None:
+        result = await db.execute(
+            select(Message.sender_id).where(Message.id == message_id, Message.chat_id == chat_id)
         )
-    )
-    msg = result.scalar_one_or_none()
-    if not msg:
+        if result.first() is not None:
+            raise HTTPException(403, "You can only edit your own messages")
+        if await _compacted_message(db, chat_id, message_id) is not None:
+            raise HTTPException(409, "The message is in compacted history and can no longer be edited")
         raise HTTPException(404, "Message not found")
-    if msg.sender_id != user.id:
-        raise HTTPException(403, "You can only edit your own messages")
-
-    msg.content = body.content
-    msg.is_edited = True
-    await db.commit()
-    await db.refresh(msg)
 
-    msg_out = MessageOut.model_validate(msg)
-
-    # Notify chat members
-    members_result = await db.execute(
-        select(chat_members.c.user_id).where(chat_members.c.chat_id == chat_id)
-    )
-    member_ids = [row[0] for row in members_result.fetchall()]
-    payload = {
+    payload = await record_chat_event(db, chat_id, {
         "type": "message_edited",
-        "message": msg_out.model_dump(mode="json"),
-    }
-    for uid in member_ids:
-        await manager.send_to_user(uid, payload)
+        "message": to_json(message),
+    }, message_id=message_id)
+    # Notify chat members
+    outbox.enqueue(db, payload, chat_id=chat_id)
+    await db.commit()
 
-    return msg_out
+    return ORJSONResponse(message)
 
 
 @router.delete("/{chat_id}/messages/{message_id}", status_code=status.HTTP_204_NO_CONTENT)
+@query_budget(9)
 async def delete_message(
     chat_id: uuid.UUID,
     message_id: uuid.UUID,
@@ -408,95 +556,68 @@ async def delete_message(
     )
     msg = result.scalar_one_or_none()
     if not msg:
-        raise HTTPException(404, "Message not found")
-    if msg.sender_id != user.id:
+        # compacted: segments can't be rewritten, so leave a tombstone their readers skip
+        compacted = await _compacted_message(db, chat_id, message_id)
+        if compacted is None:
+            raise HTTPException(404, "Message not found")
+        sender_id = compacted["sender_id"] and uuid.UUID(compacted["sender_id"])
+    else:
+        sender_id = msg.sender_id
+    if sender_id != user.id:
         raise HTTPException(403, "You can only delete your own messages")
 
-    await db.delete(msg)
-    await db.commit()
-
-    # Notify chat members
-    members_result = await db.execute(
-        select(chat_members.c.user_id).where(chat_members.c.chat_id == chat_id)
-    )
-    member_ids = [row[0] for row in members_result.fetchall()]
-    payload = {
+    payload = await record_chat_event(db, chat_id, {
         "type": "message_deleted",
         "message_id": str(message_id),
-        "chat_id": str(chat_id),
-    }
-    for uid in member_ids:
-        await manager.send_to_user(uid, payload)
+    }, message_id=message_id)
+    if msg:
+        await db.delete(msg)
+    else:
+        db.add(MessageTombstone(chat_id=chat_id, seq=compacted["seq"]))
+    # Notify chat members
+    outbox.enqueue(db, payload, chat_id=chat_id)
+    await db.commit()
 
 
 # ---------- forward ----------
 
 @router.post("/forward", response_model=MessageOut, status_code=status.HTTP_201_CREATED)
+@query_budget(15)
 async def forward_message(
     body: ForwardMessageRequest,
     db: AsyncSession = Depends(get_db),
     user: User = Depends(get_current_user),
 ):
     """Forward an existing message to another chat."""
-    # Load the original message
-    result = await db.execute(
-        select(Message).options(selectinload(Message.sender)).where(Message.id == body.message_id)
-    )
-    original = result.scalar_one_or_none()
-    if not original:
+    # Load the original message with its author
+    row = (await db.execute(message_rows_query().where(Message.id == body.message_id))).first()
+    if row:
+        original = message_from_row(row)
+        source_id = original["chat_id"]
+    elif body.from_chat_id is not None:
+        original = await _compacted_message(db, body.from_chat_id, body.message_id)
+        source_id = body.from_chat_id
+    else:
+        original = None
+    if original is None:
         raise HTTPException(404, "Original message not found")
 
-    # Check user is a member of the source chat
-    src_membership = await db.execute(
-        select(chat_members).where(
-            and_(chat_members.c.chat_id == original.chat_id, chat_members.c.user_id == user.id)
+    # Check user is a member of both the source and the target chat
+    memberships = await db.execute(
+        select(chat_members.c.chat_id).where(
+            chat_members.c.user_id == user.id,
+            chat_members.c.chat_id.in_({source_id, body.to_chat_id}),
         )
     )
-    if not src_membership.first():
+    member_of = set(memberships.scalars().all())
+    if source_id not in member_of:
         raise HTTPException(403, "Not a member of the source chat")
-
-    # Check user is a member of the target chat
-    dst_membership = await db.execute(
-        select(chat_members).where(
-            and_(chat_members.c.chat_id == body.to_chat_id, chat_members.c.user_id == user.id)
-        )
-    )
-    if not dst_membership.first():
+    if body.to_chat_id not in member_of:
         raise HTTPException(403, "Not a member of the target chat")
 
-    # Create forwarded message
-    forwarded_from_id = original.sender_id
-    msg = Message(
-        chat_id=body.to_chat_id,
-        sender_id=user.id,
-        content=original.content,
-        image_url=original.image_url,
-        forwarded_from_id=forwarded_from_id,
-        status="sent",
+    message = await post_message(
+        db, body.to_chat_id, user_dict(user),
+        content=original["content"], image_url=original["image_url"], forwarded_from=original["sender"],
     )
-    db.add(msg)
     await db.commit()
-    await db.refresh(msg)
-
-    # Load relationships
-    result = await db.execute(
-        select(Message)
-        .options(selectinload(Message.sender), selectinload(Message.forwarded_from))
-        .where(Message.id == msg.id)
-    )
-    msg = result.scalar_one()
-    msg_out = MessageOut.model_validate(msg)
-
-    # Notify target chat members via WebSocket
-    members_result = await db.execute(
-        select(chat_members.c.user_id).where(chat_members.c.chat_id == body.to_chat_id)
-    )
-    member_ids = [row[0] for row in members_result.fetchall()]
-    payload = {
-        "type": "new_message",
-        "message": msg_out.model_dump(mode="json"),
-    }
-    for uid in member_ids:
-        await manager.send_to_user(uid, payload)
-
-    return msg_out
+    return ORJSONResponse(message, status_code=status.HTTP_201_CREATED)
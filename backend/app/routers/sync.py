@@ -0,0 +1,47 @@
+"""Change-feed router: everything that changed for the user since a cursor."""
+
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import get_read_db
+from app.events import load_changes, parse_cursor, format_cursor
+from app.models import User
+from app.query_budget import query_budget
+from app.schemas import SyncOut
+from app.security import get_read_user
+from app.serializers import hoist_users
+
+router = APIRouter(prefix="/api/sync", tags=["sync"])
+
+
+@router.get("", response_model=SyncOut)
+@query_budget(3)
+async def sync(
+    since: Optional[str] = Query(None),
+    limit: int = Query(1000, ge=1, le=5000),
+    compact: bool = Query(False, description="Return each user once in a top-level `users` map"),
+    db: AsyncSession = Depends(get_read_db),
+    user: User = Depends(get_read_user),
+):
+    """Return the compacted delta since ``since``.
+
+    Call without ``since`` before a full load to get the starting cursor;
+    keep calling with the returned cursor while ``has_more`` is true.  With
+    ``reset`` the cursor is older than the retained feed: reload everything
+    and continue from the returned cursor.
+    """
+    cursor = None
+    if since:
+        try:
+            cursor = parse_cursor(since)
+        except ValueError:
+            raise HTTPException(400, "Invalid cursor")
+
+    events, next_cursor, has_more, reset = await load_changes(db, user.id, cursor, limit)
+    users = None
+    if compact:
+        users = {}
+        hoist_users((e["message"] for e in events if "message" in e), users)
+    return SyncOut(cursor=format_cursor(next_cursor), has_more=has_more, reset=reset, events=events, users=users)
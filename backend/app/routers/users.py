@@ -3,26 +3,43 @@
 import os
 import uuid
 from pathlib import Path
+from typing import Dict, List
 
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Query
+import aiofiles
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, UploadFile, File, Query
 from sqlalchemy import select, or_
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.config import settings
-from app.database import get_db
-from app.models import User, chat_members
+from app.database import get_db, get_read_db
+from app.etags import etag, matches, not_modified, set_etag
+from app.events import record_user_events, contacts_audience
+from app.models import User
+from app import outbox
+from app.profiles import parse_ids, profiles
+from app.query_budget import query_budget
 from app.schemas import UserOut, UserUpdate
-from app.security import get_current_user
-from app.routers.ws import manager
+from app.security import get_current_user, get_read_user
+from app.serializers import ORJSONResponse
+from app.routers.ws import contact_ids
 
 router = APIRouter(prefix="/api/users", tags=["users"])
 
 
+async def _record_profile_change(db: AsyncSession, user: User):
+    """Append the updated profile to the change feed of the user and their contacts."""
+    await record_user_events(db, {
+        "type": "user_updated",
+        "user": UserOut.model_validate(user).model_dump(mode="json"),
+    }, f"user:{user.id}", contacts_audience(user.id))
+
+
 @router.get("/search", response_model=list[UserOut])
+@query_budget(2)
 async def search_users(
     q: str = Query(..., min_length=1),
-    db: AsyncSession = Depends(get_db),
-    user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_read_db),
+    user: User = Depends(get_read_user),
 ):
     result = await db.execute(
         select(User).where(
@@ -37,16 +54,43 @@ async def search_users(
     return [UserOut.model_validate(u) for u in users]
 
 
+@router.get("", response_model=Dict[str, UserOut])
+@query_budget(2)
+async def lookup_users(
+    ids: List[str] = Query(..., description=f"User ids, comma-separated or repeated; at most {settings.USER_LOOKUP_MAX}"),
+    db: AsyncSession = Depends(get_read_db),
+    _: User = Depends(get_read_user),
+):
+    """Profiles keyed by id; unknown ids are left out."""
+    try:
+        user_ids = parse_ids(ids)
+    except ValueError as exc:
+        raise HTTPException(400, f"Invalid ids: {exc}")
+    return ORJSONResponse(await profiles.lookup(db, user_ids))
+
+
 @router.get("/{user_id}", response_model=UserOut)
-async def get_user(user_id: uuid.UUID, db: AsyncSession = Depends(get_db), _: User = Depends(get_current_user)):
+@query_budget(2)
+async def get_user(
+    user_id: uuid.UUID,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_read_db),
+    _: User = Depends(get_read_user),
+):
     result = await db.execute(select(User).where(User.id == user_id))
     user = result.scalar_one_or_none()
     if not user:
         raise HTTPException(404, "User not found")
+    tag = etag("user", user.id, user.version)
+    if matches(request, tag):
+        return not_modified(tag)
+    set_etag(response, tag)
     return UserOut.model_validate(user)
 
 
 @router.patch("/me", response_model=UserOut)
+@query_budget(4)
 async def update_profile(
     body: UserUpdate,
     db: AsyncSession = Depends(get_db),
@@ -62,12 +106,16 @@ async def update_profile(
     if body.bio is not None:
         user.bio = body.bio
 
+    await db.flush()
+    await _record_profile_change(db, user)
     await db.commit()
+    profiles.invalidate(user.id)
     await db.refresh(user)
     return UserOut.model_validate(user)
 
 
 @router.post("/me/avatar", response_model=UserOut)
+@query_budget(6)
 async def upload_avatar(
     file: UploadFile = File(...),
     db: AsyncSession = Depends(get_db),
@@ -86,29 +134,20 @@ async def upload_avatar(
     filepath = upload_dir / filename
 
     content = await file.read()
-    with open(filepath, "wb") as f:
-        f.write(content)
+    async with aiofiles.open(filepath, "wb") as f:
+        await f.write(content)
 
     user.avatar_url = f"/uploads/avatars/{filename}"
+    await db.flush()
+    await _record_profile_change(db, user)
+    # Notify all chat partners to refresh (so they see the new avatar)
+    outbox.enqueue(db, {
+        "type": "avatar_updated",
+        "user_id": str(user.id),
+        "avatar_url": user.avatar_url,
+    }, user_ids=await contact_ids(user.id, db))
     await db.commit()
+    profiles.invalidate(user.id)
     await db.refresh(user)
 
-    # Notify all chat partners to refresh (so they see the new avatar)
-    result = await db.execute(select(chat_members.c.chat_id).where(chat_members.c.user_id == user.id))
-    chat_ids = [row[0] for row in result.fetchall()]
-    notified: set = set()
-    for cid in chat_ids:
-        members_result = await db.execute(
-            select(chat_members.c.user_id).where(chat_members.c.chat_id == cid)
-        )
-        for row in members_result.fetchall():
-            uid = row[0]
-            if uid != user.id and uid not in notified:
-                notified.add(uid)
-                await manager.send_to_user(uid, {
-                    "type": "avatar_updated",
-                    "user_id": str(user.id),
-                    "avatar_url": user.avatar_url,
-                })
-
     return UserOut.model_validate(user)
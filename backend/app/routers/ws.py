@@ -1,21 +1,39 @@
 """WebSocket manager for real-time messaging."""
 
-import json
+import asyncio
+import math
 import uuid
-from typing import Dict, Set
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Union
 
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends
-from sqlalchemy import select, and_
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from sqlalchemy import any_, or_, select, tuple_, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
 
-from app.database import get_db, async_session
+from app.config import settings
+from app.database import async_session
+from app.large_groups import (
+    advance_read_cursor, bump_status_version, is_large, recipients_query, status_counts, uuid_array,
+)
+from app.events import (
+    record_chat_events, parse_since, load_replay, contacts_audience,
+)
+from app.profiles import parse_ids, profiles
+from app.messages import create_message, insert_messages, new_message_event
+from app.recent import recent_messages
+from app.metrics import SHED_REQUESTS, WS_PENDING_SENDS, observe_ws_frame
+from app.query_budget import check_budget
+from app.ratelimit import limiter, overloaded, rate_limited, ws_error
 from app.models import Message, Chat, chat_members, ReadReceipt, User
-from app.schemas import MessageOut, UserOut
-from app.security import get_ws_user
+from app.security import get_ws_user, token_subject
+from app.serializers import user_dict
+from app.wire import JSON, Frame, as_frame, decode, negotiate
 
 router = APIRouter()
 
+# Max SQL statements per incoming frame (see app.query_budget)
+WS_QUERY_BUDGETS = {"message": 9, "typing": 1, "read": 5, "resolve_users": 1}
+
 
 class ConnectionManager:
     """Manages active WebSocket connections per user."""
@@ -23,34 +41,67 @@ class ConnectionManager:
     def __init__(self):
         # user_id -> set of WebSocket connections (supports multiple devices)
         self.active: Dict[uuid.UUID, Set[WebSocket]] = {}
+        # each socket's negotiated encoding (see app.wire)
+        self.wire: Dict[WebSocket, str] = {}
 
-    async def connect(self, user_id: uuid.UUID, ws: WebSocket):
-        await ws.accept()
+    async def connect(self, user_id: uuid.UUID, ws: WebSocket, subprotocol: Optional[str] = None):
+        await ws.accept(subprotocol=subprotocol)
+        self.wire[ws] = subprotocol or JSON
         if user_id not in self.active:
             self.active[user_id] = set()
         self.active[user_id].add(ws)
 
     def disconnect(self, user_id: uuid.UUID, ws: WebSocket):
+        self.wire.pop(ws, None)
         if user_id in self.active:
             self.active[user_id].discard(ws)
             if not self.active[user_id]:
                 del self.active[user_id]
 
-    async def send_to_user(self, user_id: uuid.UUID, data: dict):
+    async def send(self, ws: WebSocket, data: Union[dict, Frame]) -> None:
+        """Send to one socket in its own encoding."""
+        await ws.send(as_frame(data).message(self.wire.get(ws, JSON)))
+
+    async def send_to_user(self, user_id: uuid.UUID, data: Union[dict, Frame]):
+        frame = as_frame(data)
         conns = self.active.get(user_id, set())
         dead = []
         for ws in list(conns):
+            WS_PENDING_SENDS.inc()
             try:
-                await ws.send_json(data)
+                await self.send(ws, frame)
             except Exception:
                 dead.append(ws)
+            finally:
+                WS_PENDING_SENDS.dec()
         for ws in dead:
             conns.discard(ws)
+            self.wire.pop(ws, None)
+
+    async def send_to_users(
+        self, user_ids: Iterable[uuid.UUID], data: Union[dict, Frame], exclude: uuid.UUID = None,
+    ) -> int:
+        """Fan one payload out to whichever of ``user_ids`` are connected here,
+        encoding it once per wire format rather than per socket.  Large
+        audiences go out as concurrent shards of ``WS_FANOUT_SHARD_SIZE`` so
+        one slow socket doesn't hold up everyone after it.  Returns how many
+        users it went to.
+        """
+        frame = as_frame(data)
+        online = [uid for uid in user_ids if uid != exclude and uid in self.active]
+        size = settings.WS_FANOUT_SHARD_SIZE
+        if len(online) <= size:
+            await self._send_shard(online, frame)
+        else:
+            await asyncio.gather(*(self._send_shard(online[i:i + size], frame) for i in range(0, len(online), size)))
+        return len(online)
+
+    async def _send_shard(self, user_ids: List[uuid.UUID], frame: Frame) -> None:
+        for uid in user_ids:
+            await self.send_to_user(uid, frame)
 
     async def broadcast_to_chat(self, chat_member_ids: list[uuid.UUID], data: dict, exclude: uuid.UUID = None):
-        for uid in chat_member_ids:
-            if uid != exclude:
-                await self.send_to_user(uid, data)
+        await self.send_to_users(chat_member_ids, data, exclude=exclude)
 
     def is_online(self, user_id: uuid.UUID) -> bool:
         return user_id in self.active and len(self.active[user_id]) > 0
@@ -61,21 +112,66 @@ manager = ConnectionManager()
 
 @router.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
+    # Refused before authentication so a reconnect storm costs no queries.
+    # Closing needs an accepted socket for the client to see the code (1013,
+    # "try again later") and the retry hint in the reason.
+    subprotocol = negotiate(websocket)
+    subject = token_subject(websocket.query_params.get("token"))
+    if subject is None:
+        subject = f"ip:{websocket.client.host if websocket.client else 'unknown'}"
+    if overloaded():
+        reason, wait = "overloaded", settings.OVERLOAD_RETRY_AFTER
+    else:
+        reason, wait = "rate_limited", rate_limited(("ws:connect",), subject)
+    if wait:
+        SHED_REQUESTS.labels("ws", reason).inc()
+        await websocket.accept(subprotocol=subprotocol)
+        await websocket.close(code=1013, reason=f"retry after {math.ceil(wait)}s")
+        return
+
     async with async_session() as db:
         user = await get_ws_user(websocket, db)
         if not user:
             await websocket.close(code=4001, reason="Unauthorized")
             return
 
-        await manager.connect(user.id, websocket)
+        await manager.connect(user.id, websocket, subprotocol)
+        wire = manager.wire[websocket]
         # Notify contacts that user is online
         await _broadcast_presence(user.id, True, db)
 
+        # Replay events missed since the client's last-seen sequence per chat.
+        # Anything committed after connect() is also delivered live; clients
+        # drop duplicates by (chat_id, seq).
+        cursors = parse_since(websocket.query_params.get("since"))
+        if cursors:
+            await manager.send(websocket, await load_replay(db, user.id, cursors))
+        # End the transaction so the socket doesn't pin a pooled connection
+        # while it sits idle; the session checks one out again per frame.
+        await db.commit()
+
         try:
             while True:
-                raw = await websocket.receive_text()
-                data = json.loads(raw)
-                await _handle_ws_message(user, data, db)
+                data = decode(await websocket.receive(), wire)
+                frame_type = data.get("type")
+                shed = _shed_frame(user.id, data)
+                if shed is not None:
+                    await manager.send(websocket, shed)
+                    continue
+                with observe_ws_frame(frame_type) as stats:
+                    if frame_type == "batch":
+                        ops = _batch_ops(data)
+                        budget = _batch_budget(ops)
+                        await manager.send(websocket, await _handle_batch(user, data.get("id"), ops, db))
+                    elif frame_type == "resolve_users":
+                        budget = WS_QUERY_BUDGETS[frame_type]
+                        await manager.send(websocket, await _resolve_users(data, db))
+                        await db.commit()
+                    else:
+                        budget = WS_QUERY_BUDGETS.get(frame_type)
+                        await _handle_ws_message(user, data, db)
+                        await db.commit()
+                check_budget(f"ws {frame_type}", budget, stats)
         except WebSocketDisconnect:
             manager.disconnect(user.id, websocket)
             # Update last_seen
@@ -85,17 +181,51 @@ async def websocket_endpoint(websocket: WebSocket):
                 from datetime import datetime, timezone as tz
                 u.last_seen = datetime.now(tz.utc)
                 await db.commit()
+                profiles.invalidate(user.id)
             await _broadcast_presence(user.id, False, db)
         except Exception:
             manager.disconnect(user.id, websocket)
 
 
+def _shed_frame(user_id: uuid.UUID, data: dict) -> Optional[dict]:
+    """An error frame to answer with instead of handling the frame, or ``None``.
+
+    A batch costs one ``ws:batch`` token plus one ``ws:message`` token per
+    message in it, charged together; its reads and typing are cheap however
+    many there are.  A batch with more messages than the ``ws:message`` burst
+    could never be admitted and is refused with ``batch_too_large``.
+    """
+    frame_type = data.get("type")
+    if overloaded():
+        SHED_REQUESTS.labels("ws", "overloaded").inc()
+        return ws_error("overloaded", frame_type, settings.OVERLOAD_RETRY_AFTER)
+    limits: Tuple[str, ...] = (f"ws:{frame_type}",)
+    if frame_type == "batch":
+        messages = sum(1 for op in _batch_ops(data) if op.get("type") == "message")
+        max_messages = limiter.burst("ws:message")
+        if settings.RATE_LIMIT_ENABLED and messages > max_messages:
+            return {"type": "error", "code": "batch_too_large", "op": frame_type, "id": data.get("id"),
+                    "max_messages": int(max_messages)}
+        limits += ("ws:message",) * messages
+    wait = rate_limited(limits, str(user_id))
+    if wait:
+        SHED_REQUESTS.labels("ws", "rate_limited").inc()
+        return ws_error("rate_limited", frame_type, wait)
+    return None
+
+
 async def _handle_ws_message(user: User, data: dict, db: AsyncSession):
     """
     Incoming WebSocket messages:
       { "type": "message", "chat_id": "...", "content": "..." }
       { "type": "typing",  "chat_id": "..." }
       { "type": "read",    "chat_id": "...", "message_id": "..." }
+
+    Frames over their ``ws:<type>`` rate limit, or any frame while the server
+    is overloaded, are answered instead with
+      { "type": "error", "code": "rate_limited" | "overloaded", "op": "...", "retry_after": 1.5 }
+    and batches with more messages than the ``ws:message`` burst with
+      { "type": "error", "code": "batch_too_large", "op": "batch", "id": "...", "max_messages": 20 }
     """
     msg_type = data.get("type")
 
@@ -107,65 +237,51 @@ async def _handle_ws_message(user: User, data: dict, db: AsyncSession):
 
         # Verify membership
         membership = await db.execute(
-            select(chat_members).where(
-                and_(chat_members.c.chat_id == chat_id, chat_members.c.user_id == user.id)
-            )
+            select(Chat.member_count)
+            .join(chat_members, chat_members.c.chat_id == Chat.id)
+            .where(Chat.id == chat_id, chat_members.c.user_id == user.id)
         )
-        if not membership.first():
+        member_count = membership.scalar_one_or_none()
+        if member_count is None:
             return
 
         # Save message
-        msg = Message(chat_id=chat_id, sender_id=user.id, content=content, status="sent")
-        db.add(msg)
-        await db.commit()
-        await db.refresh(msg)
+        message, payload = await create_message(db, chat_id, user_dict(user), content=content)
 
-        # Get chat members
-        members_result = await db.execute(
-            select(chat_members.c.user_id).where(chat_members.c.chat_id == chat_id)
-        )
+        # Get chat members (only the online ones in a large group)
+        members_result = await db.execute(recipients_query(chat_id, manager.active))
         member_ids = [row[0] for row in members_result.fetchall()]
-
-        sender_out = UserOut.model_validate(user)
-        msg_out = MessageOut(
-            id=msg.id,
-            chat_id=msg.chat_id,
-            sender_id=msg.sender_id,
-            sender=sender_out,
-            content=msg.content,
-            image_url=msg.image_url,
-            is_edited=msg.is_edited,
-            status=msg.status if isinstance(msg.status, str) else msg.status.value,
-            created_at=msg.created_at,
-        )
-
-        payload = {
-            "type": "new_message",
-            "message": msg_out.model_dump(mode="json"),
-        }
+        await db.commit()
 
         # Send to all members including sender (for multi-device sync)
-        for uid in member_ids:
-            await manager.send_to_user(uid, payload)
+        frame = Frame(payload)
+        await manager.send_to_user(user.id, frame)
+        delivered = await manager.send_to_users(member_ids, frame, exclude=user.id)
+        if is_large(member_count):
+            status_counts.delivered(chat_id, message["seq"], delivered)
+            return
 
         # Mark as delivered for online members
-        for uid in member_ids:
-            if uid != user.id and manager.is_online(uid):
-                msg.status = "delivered"
-                await db.commit()
-                await manager.send_to_user(user.id, {
-                    "type": "status_update",
-                    "message_id": str(msg.id),
-                    "chat_id": str(chat_id),
-                    "status": "delivered",
-                })
-                break
+        if delivered:
+            await db.execute(
+                update(Message)
+                .where(Message.id == message["id"], Message.created_at == message["created_at"])
+                .values(status="delivered")
+                .execution_options(synchronize_session=False)
+            )
+            versions = await bump_status_version(db, [chat_id])
+            await db.commit()
+            recent_messages.update(chat_id, versions[chat_id], {message["id"]: {"status": "delivered"}})
+            await manager.send_to_user(user.id, {
+                "type": "status_update",
+                "message_id": str(message["id"]),
+                "chat_id": str(chat_id),
+                "status": "delivered",
+            })
 
     elif msg_type == "typing":
         chat_id = uuid.UUID(data["chat_id"])
-        members_result = await db.execute(
-            select(chat_members.c.user_id).where(chat_members.c.chat_id == chat_id)
-        )
+        members_result = await db.execute(recipients_query(chat_id, manager.active))
         member_ids = [row[0] for row in members_result.fetchall()]
         await manager.broadcast_to_chat(member_ids, {
             "type": "typing",
@@ -178,10 +294,18 @@ async def _handle_ws_message(user: User, data: dict, db: AsyncSession):
         message_id = uuid.UUID(data["message_id"])
 
         result = await db.execute(
-            select(Message).where(Message.id == message_id, Message.chat_id == chat_id)
+            select(Message, Chat.member_count)
+            .join(Chat, Chat.id == Message.chat_id)
+            .where(Message.id == message_id, Message.chat_id == chat_id)
         )
-        msg = result.scalar_one_or_none()
-        if not msg:
+        row = result.first()
+        if not row:
+            return
+        msg, member_count = row
+        if is_large(member_count):
+            # no receipt per member: move the read cursor, counts reach the sender later
+            await advance_read_cursor(db, chat_id, user.id, msg.seq or 0)
+            await db.commit()
             return
 
         # Add read receipt
@@ -192,7 +316,9 @@ async def _handle_ws_message(user: User, data: dict, db: AsyncSession):
             db.add(ReadReceipt(message_id=message_id, user_id=user.id))
 
         msg.status = "read"
+        versions = await bump_status_version(db, [chat_id])
         await db.commit()
+        recent_messages.update(chat_id, versions[chat_id], {message_id: {"status": "read"}})
 
         # Notify sender
         if msg.sender_id:
@@ -204,24 +330,215 @@ async def _handle_ws_message(user: User, data: dict, db: AsyncSession):
             })
 
 
+async def _resolve_users(data: dict, db: AsyncSession) -> dict:
+    """{ "type": "resolve_users", "id": "...", "user_ids": [...] } ->
+    { "type": "users", "id": "...", "users": {"<user_id>": {...}} }, unknown ids left out."""
+    try:
+        user_ids = parse_ids(data.get("user_ids") or [])
+    except (ValueError, TypeError):
+        return {"type": "error", "code": "invalid", "op": "resolve_users", "id": data.get("id")}
+    return {"type": "users", "id": data.get("id"), "users": await profiles.lookup(db, user_ids)}
+
+
+def _batch_ops(data: dict) -> List[dict]:
+    ops = data.get("ops")
+    if not isinstance(ops, list):
+        return []
+    return [op if isinstance(op, dict) else {} for op in ops[:settings.WS_BATCH_MAX_OPS]]
+
+
+def _batch_budget(ops: List[dict]) -> int:
+    """Statements a batch may issue: membership, the read statements and the
+    delivered update, plus four per chat it posts messages to and two per
+    chat it reads in (read cursors, for large groups)."""
+    posts = {op.get("chat_id") for op in ops if op.get("type") == "message"}
+    reads = {op.get("chat_id") for op in ops if op.get("type") == "read"}
+    return 5 + 4 * len(posts) + 2 * len(reads)
+
+
+async def _handle_batch(user: User, batch_id, ops: List[dict], db: AsyncSession) -> dict:
+    """
+    Several ops in one frame, applied in one transaction with set-based
+    statements (see ``_batch_budget``):
+      { "type": "batch", "id": "<echoed>", "ops": [
+          { "type": "read", "chat_id": "...", "message_id": "..." },
+          { "type": "message", "chat_id": "...", "content": "..." }, ... ] }
+
+    Answered with one frame holding a result per op, in order:
+      { "type": "batch_ack", "id": "<echoed>", "results": [
+          { "ok": true }, { "ok": true, "message_id": "...", "seq": 42 },
+          { "ok": false, "error": "not_member" }, ... ] }
+
+    Other members get the same frames as for single ops, after commit.
+    Ops past ``WS_BATCH_MAX_OPS`` are dropped.
+    """
+    results: List[Optional[dict]] = [None] * len(ops)
+    reads: List[Tuple[int, uuid.UUID, uuid.UUID]] = []
+    posts: Dict[uuid.UUID, List[Tuple[int, str]]] = {}
+    typing: Dict[uuid.UUID, List[int]] = {}
+    for i, op in enumerate(ops):
+        try:
+            op_type = op.get("type")
+            chat_id = uuid.UUID(op["chat_id"])
+            if op_type == "read":
+                reads.append((i, chat_id, uuid.UUID(op["message_id"])))
+            elif op_type == "message":
+                content = (op.get("content") or "").strip()
+                if content:
+                    posts.setdefault(chat_id, []).append((i, content))
+                else:
+                    results[i] = {"ok": False, "error": "empty"}
+            elif op_type == "typing":
+                typing.setdefault(chat_id, []).append(i)
+            else:
+                results[i] = {"ok": False, "error": "unsupported"}
+        except (KeyError, TypeError, ValueError, AttributeError):
+            results[i] = {"ok": False, "error": "invalid"}
+
+    # after commit: (recipients, frame, (chat_id, seq) to count deliveries of in a large group)
+    outgoing: List[Tuple[List[uuid.UUID], dict, Optional[Tuple[uuid.UUID, int]]]] = []
+    # chat_id -> message_id -> fields, for the recent-message cache after commit
+    statuses: Dict[uuid.UUID, Dict[uuid.UUID, dict]] = {}
+    my_chats = select(chat_members.c.chat_id).where(chat_members.c.user_id == user.id)
+    small_chats = select(Chat.id).where(Chat.member_count < settings.LARGE_GROUP_MIN_MEMBERS)
+
+    # members of every chat the batch posts or types in, for chats the user
+    # is in; of a large group only the online ones
+    members: Dict[uuid.UUID, List[uuid.UUID]] = {}
+    large: Set[uuid.UUID] = set()
+    if posts or typing:
+        rows = await db.execute(
+            select(chat_members.c.chat_id, chat_members.c.user_id, Chat.member_count)
+            .join(Chat, Chat.id == chat_members.c.chat_id)
+            .where(
+                chat_members.c.chat_id.in_(set(posts) | set(typing)),
+                chat_members.c.chat_id.in_(my_chats),
+                or_(
+                    Chat.member_count < settings.LARGE_GROUP_MIN_MEMBERS,
+                    chat_members.c.user_id == any_(uuid_array({user.id, *manager.active})),
+                ),
+            )
+        )
+        for chat_id, uid, member_count in rows:
+            members.setdefault(chat_id, []).append(uid)
+            if is_large(member_count):
+                large.add(chat_id)
+
+    for chat_id, indexes in typing.items():
+        for i in indexes:
+            results[i] = {"ok": True} if chat_id in members else {"ok": False, "error": "not_member"}
+        if chat_id in members:
+            outgoing.append((
+                [uid for uid in members[chat_id] if uid != user.id],
+                {"type": "typing", "chat_id": str(chat_id), "user_id": str(user.id)},
+                None,
+            ))
+
+    delivered: List[Tuple[uuid.UUID, uuid.UUID]] = []
+    sender = user_dict(user)
+    for chat_id, items in posts.items():
+        if chat_id not in members:
+            for i, _ in items:
+                results[i] = {"ok": False, "error": "not_member"}
+            continue
+        inserted = await insert_messages(db, chat_id, sender, [{"content": content} for _, content in items])
+        events = []
+        for (i, _), message in zip(items, inserted):
+            events.append((new_message_event(message), message["seq"], message["id"]))
+            results[i] = {"ok": True, "message_id": str(message["id"]), "seq": message["seq"]}
+        for payload in await record_chat_events(db, chat_id, events):
+            if chat_id in large:
+                outgoing.append(([user.id], payload, None))
+                others = [uid for uid in members[chat_id] if uid != user.id]
+                outgoing.append((others, payload, (chat_id, payload["seq"])))
+            else:
+                outgoing.append((members[chat_id], payload, None))
+        if chat_id not in large and any(uid != user.id and manager.is_online(uid) for uid in members[chat_id]):
+            delivered.extend((chat_id, message_id) for _, _, message_id in events)
+
+    if delivered:
+        await db.execute(
+            update(Message)
+            .where(tuple_(Message.chat_id, Message.id).in_(delivered))
+            .values(status="delivered")
+            .execution_options(synchronize_session=False)
+        )
+        for chat_id, message_id in delivered:
+            statuses.setdefault(chat_id, {})[message_id] = {"status": "delivered"}
+            outgoing.append(([user.id], {
+                "type": "status_update", "message_id": str(message_id), "chat_id": str(chat_id), "status": "delivered",
+            }, None))
+
+    if reads:
+        marked = await db.execute(
+            update(Message)
+            .where(
+                tuple_(Message.id, Message.chat_id).in_([(message_id, chat_id) for _, chat_id, message_id in reads]),
+                Message.chat_id.in_(my_chats),
+                Message.chat_id.in_(small_chats),
+            )
+            .values(status="read")
+            .returning(Message.id, Message.sender_id)
+            .execution_options(synchronize_session=False)
+        )
+        senders = dict(marked.all())
+        read_ids = set(senders)
+        if senders:
+            await db.execute(
+                pg_insert(ReadReceipt)
+                .values([{"message_id": message_id, "user_id": user.id} for message_id in senders])
+                .on_conflict_do_nothing(constraint="uq_read_receipt")
+            )
+        # the rest may be in large groups: move the read cursor to the newest one read per chat
+        cursors: Dict[uuid.UUID, int] = {}
+        rest = [(message_id, chat_id) for _, chat_id, message_id in reads if message_id not in senders]
+        if rest:
+            found = await db.execute(
+                select(Message.id, Message.chat_id, Message.seq).where(
+                    tuple_(Message.id, Message.chat_id).in_(rest),
+                    Message.chat_id.in_(my_chats),
+                    Message.chat_id.not_in(small_chats),
+                )
+            )
+            for message_id, chat_id, seq in found:
+                senders[message_id] = None
+                cursors[chat_id] = max(cursors.get(chat_id, 0), seq or 0)
+        for chat_id, seq in cursors.items():
+            await advance_read_cursor(db, chat_id, user.id, seq)
+
+        for i, chat_id, message_id in reads:
+            if message_id not in senders:
+                results[i] = {"ok": False, "error": "not_found"}
+                continue
+            results[i] = {"ok": True}
+            if message_id in read_ids:
+                statuses.setdefault(chat_id, {})[message_id] = {"status": "read"}
+            if senders[message_id]:
+                outgoing.append(([senders[message_id]], {
+                    "type": "status_update", "message_id": str(message_id), "chat_id": str(chat_id), "status": "read",
+                }, None))
+
+    versions = await bump_status_version(db, statuses)
+    await db.commit()
+    for chat_id, changes in statuses.items():
+        recent_messages.update(chat_id, versions[chat_id], changes)
+    for recipients, frame, counted in outgoing:
+        sent = await manager.send_to_users(recipients, frame)
+        if counted is not None:
+            status_counts.delivered(*counted, sent)
+    return {"type": "batch_ack", "id": batch_id, "results": results}
+
+
+async def contact_ids(user_id: uuid.UUID, db: AsyncSession) -> Set[uuid.UUID]:
+    """Everyone sharing a chat with the user, in one query."""
+    result = await db.execute(contacts_audience(user_id))
+    return set(result.scalars().all()) - {user_id}
+
+
 async def _broadcast_presence(user_id: uuid.UUID, online: bool, db: AsyncSession):
     """Notify all chat partners about presence change."""
-    result = await db.execute(
-        select(chat_members.c.chat_id).where(chat_members.c.user_id == user_id)
-    )
-    chat_ids = [row[0] for row in result.fetchall()]
-
-    notified: set[uuid.UUID] = set()
-    for cid in chat_ids:
-        members_result = await db.execute(
-            select(chat_members.c.user_id).where(chat_members.c.chat_id == cid)
-        )
-        for row in members_result.fetchall():
-            uid = row[0]
-            if uid != user_id and uid not in notified:
-                notified.add(uid)
-                await manager.send_to_user(uid, {
-                    "type": "presence",
-                    "user_id": str(user_id),
-                    "online": online,
-                })
+    await manager.send_to_users(await contact_ids(user_id, db), {
+        "type": "presence",
+        "user_id": str(user_id),
+        "online": online,
+    })
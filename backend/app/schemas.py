@@ -4,7 +4,7 @@ from __future__ import annotations
 
 import uuid
 from datetime import datetime
-from typing import Optional, List
+from typing import Dict, Optional, List
 
 from pydantic import BaseModel, Field
 
@@ -71,13 +71,39 @@ class ChatOut(BaseModel):
     title: Optional[str] = None
     avatar_url: Optional[str] = None
     created_at: datetime
-    members: List[UserOut] = []
+    member_count: int = 0
+    members: List[UserOut] = []  # the first CHAT_MEMBER_PREVIEW; page through GET /api/chats/{id}/members
     last_message: Optional[MessageOut] = None
 
     class Config:
         from_attributes = True
 
 
+class ChatCompactOut(BaseModel):
+    id: uuid.UUID
+    chat_type: str
+    title: Optional[str] = None
+    avatar_url: Optional[str] = None
+    created_at: datetime
+    member_count: int = 0
+    member_ids: List[uuid.UUID] = []  # preview only, as in ChatOut.members
+    last_message: Optional[MessageCompactOut] = None
+
+
+class ChatListCompact(BaseModel):
+    users: Dict[str, UserOut] = {}
+    chats: List[ChatCompactOut] = []
+
+
+class MemberOut(UserOut):
+    online: bool = False
+
+
+class MemberPage(BaseModel):
+    members: List[MemberOut] = []
+    next_cursor: Optional[str] = None  # pass as ?cursor= for the next page; null on the last one
+
+
 # ---------- Message ----------
 
 class MessageCreate(BaseModel):
@@ -87,6 +113,7 @@ class MessageCreate(BaseModel):
 class MessageOut(BaseModel):
     id: uuid.UUID
     chat_id: uuid.UUID
+    seq: Optional[int] = None
     sender_id: Optional[uuid.UUID] = None
     sender: Optional[UserOut] = None
     content: Optional[str] = None
@@ -96,11 +123,33 @@ class MessageOut(BaseModel):
     forwarded_from: Optional[UserOut] = None
     status: str
     created_at: datetime
+    # large groups only: recipients reached / readers so far
+    delivered_count: Optional[int] = 0
+    read_count: Optional[int] = 0
 
     class Config:
         from_attributes = True
 
 
+class MessageCompactOut(BaseModel):
+    """MessageOut without embedded users; see the ``users`` map of the page."""
+    id: uuid.UUID
+    chat_id: uuid.UUID
+    seq: Optional[int] = None
+    sender_id: Optional[uuid.UUID] = None
+    content: Optional[str] = None
+    image_url: Optional[str] = None
+    is_edited: bool = False
+    forwarded_from_id: Optional[uuid.UUID] = None
+    status: str
+    created_at: datetime
+
+
+class MessagePageCompact(BaseModel):
+    users: Dict[str, UserOut] = {}
+    messages: List[MessageCompactOut] = []
+
+
 class MessageStatusUpdate(BaseModel):
     status: str  # "delivered" | "read"
 
@@ -112,8 +161,21 @@ class MessageEdit(BaseModel):
 class ForwardMessageRequest(BaseModel):
     message_id: uuid.UUID
     to_chat_id: uuid.UUID
+    from_chat_id: Optional[uuid.UUID] = None  # needed to forward from compacted history
+
+
+# ---------- Sync ----------
+
+class SyncOut(BaseModel):
+    cursor: str
+    has_more: bool = False
+    reset: bool = False  # the cursor is older than the retained feed: reload everything
+    events: List[dict] = []
+    users: Optional[Dict[str, UserOut]] = None  # only with ?compact=true
 
 
 # ---------- resolve forward refs ----------
 
 ChatOut.model_rebuild()
+ChatCompactOut.model_rebuild()
+ChatListCompact.model_rebuild()
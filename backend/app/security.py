@@ -13,7 +13,7 @@ from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.config import settings
-from app.database import get_db
+from app.database import get_db, get_read_db, on_replica, replicas, use_primary
 from app.models import User
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login", auto_error=False)
@@ -34,26 +34,32 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     return jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
 
 
+def token_subject(token: Optional[str]) -> Optional[str]:
+    """The user id (``sub``) of a valid access token, checked without the database."""
+    if not token:
+        return None
+    try:
+        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+    except JWTError:
+        return None
+    return payload.get("sub")
+
+
 async def _get_user_from_token(token: Optional[str], db: AsyncSession) -> User:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    if token is None:
-        raise credentials_exception
-    try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        user_id: str = payload.get("sub")
-        if user_id is None:
-            raise credentials_exception
-    except JWTError:
+    user_id = token_subject(token)
+    if user_id is None:
         raise credentials_exception
 
     result = await db.execute(select(User).where(User.id == uuid.UUID(user_id)))
     user = result.scalar_one_or_none()
     if user is None:
         raise credentials_exception
+    db.info["user_id"] = user.id  # lets the session mark this user's writes (app.database)
     return user
 
 
@@ -64,6 +70,34 @@ async def get_current_user(
     return await _get_user_from_token(token, db)
 
 
+async def get_read_user(
+    token: Optional[str] = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_read_db),
+) -> User:
+    """``get_current_user`` for endpoints on ``get_read_db``.
+
+    Pins the session to the primary if the user wrote recently, or if the
+    replica doesn't know the account yet (just registered).
+    """
+    try:
+        user = await _get_user_from_token(token, db)
+    except HTTPException:
+        if not on_replica(db):
+            raise
+        use_primary(db)
+        user = await _get_user_from_token(token, db)
+    if replicas.wrote_recently(user.id):
+        use_primary(db)
+    return user
+
+
+async def get_admin_user(user: User = Depends(get_current_user)) -> User:
+    admin_ids = {uid.strip() for uid in settings.ADMIN_USER_IDS.split(",") if uid.strip()}
+    if str(user.id) not in admin_ids:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
+    return user
+
+
 async def get_ws_user(websocket: WebSocket, db: AsyncSession) -> Optional[User]:
     """Extract user from WebSocket query param `token`."""
     token = websocket.query_params.get("token")
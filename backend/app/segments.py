@@ -0,0 +1,352 @@
+"""Compressed, immutable per-chat segment files for cold message history."""
+
+import asyncio
+import logging
+import mmap
+import os
+import struct
+import sys
+import threading
+import uuid
+import zlib
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Collection, Dict, List, Optional, Sequence, Tuple
+
+import orjson
+from sqlalchemy import and_, delete, func, select, update
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, AsyncSession
+from starlette.concurrency import run_in_threadpool
+
+from app.config import settings
+from app.models import Chat, Message, MessageTombstone, ReadReceipt
+from app.serializers import (
+    MESSAGE_RECORD_FIELDS,
+    dumps,
+    message_from_record,
+    message_records_query,
+    user_from_row,
+    user_rows_query,
+)
+
+logger = logging.getLogger(__name__)
+
+# SEGMENT_DIR/<chat_id>/<first_seq>-<last_seq>.seg, never rewritten:
+#   header  b"MSEG" u16 version u32 n + n bytes of JSON field names
+#   blocks  zlib(orjson([[field, ...], ...])), SEGMENT_BLOCK_MESSAGES each, seq ascending
+#   index   per block: i64 first_seq, i64 last_seq, u64 offset, u32 length
+#   footer  u64 index offset, u32 block count, b"MSEG"
+MAGIC = b"MSEG"
+VERSION = 1
+_HEADER = struct.Struct("<4sHI")
+_ENTRY = struct.Struct("<qqQI")
+_FOOTER = struct.Struct("<QI4s")
+
+
+def chat_dir(chat_id) -> Path:
+    return Path(settings.SEGMENT_DIR) / str(chat_id)
+
+
+def segment_paths(chat_id) -> List[Tuple[int, int, Path]]:
+    """``(first_seq, last_seq, path)`` of a chat's segments, oldest first."""
+    try:
+        names = os.listdir(chat_dir(chat_id))
+    except FileNotFoundError:
+        return []
+    segments = []
+    for name in names:
+        if not name.endswith(".seg"):
+            continue
+        first, _, last = name[:-4].partition("-")
+        segments.append((int(first), int(last), chat_dir(chat_id) / name))
+    return sorted(segments)
+
+
+# ---------- writing ----------
+
+class SegmentWriter:
+    """Appends records (seq ascending) as compressed blocks; ``close`` publishes the file."""
+
+    def __init__(self, chat_id, block_size: int = settings.SEGMENT_BLOCK_MESSAGES):
+        self.chat_id = chat_id
+        self.block_size = block_size
+        self.first_seq: Optional[int] = None
+        self.last_seq: Optional[int] = None
+        self.count = 0
+        self._block: List[Sequence] = []
+        self._index: List[Tuple[int, int, int, int]] = []
+        chat_dir(chat_id).mkdir(parents=True, exist_ok=True)
+        self._tmp = chat_dir(chat_id) / f".{uuid.uuid4().hex}.tmp"
+        self._file = open(self._tmp, "wb")
+        fields = orjson.dumps(list(MESSAGE_RECORD_FIELDS))
+        self._file.write(_HEADER.pack(MAGIC, VERSION, len(fields)) + fields)
+
+    def add(self, record: Sequence) -> None:
+        self._block.append(record)
+        self.count += 1
+        if len(self._block) >= self.block_size:
+            self._flush()
+
+    def _flush(self) -> None:
+        if not self._block:
+            return
+        seq = MESSAGE_RECORD_FIELDS.index("seq")
+        first, last = self._block[0][seq], self._block[-1][seq]
+        data = zlib.compress(dumps(self._block), 6)
+        self._index.append((first, last, self._file.tell(), len(data)))
+        self._file.write(data)
+        if self.first_seq is None:
+            self.first_seq = first
+        self.last_seq = last
+        self._block = []
+
+    def close(self) -> Optional[Path]:
+        """Finish the file and rename it into place; ``None`` if nothing was written."""
+        self._flush()
+        if not self._index:
+            self.abort()
+            return None
+        index_offset = self._file.tell()
+        for entry in self._index:
+            self._file.write(_ENTRY.pack(*entry))
+        self._file.write(_FOOTER.pack(index_offset, len(self._index), MAGIC))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        path = chat_dir(self.chat_id) / f"{self.first_seq:020d}-{self.last_seq:020d}.seg"
+        os.replace(self._tmp, path)
+        return path
+
+    def abort(self) -> None:
+        self._file.close()
+        self._tmp.unlink(missing_ok=True)
+
+
+# ---------- reading ----------
+
+class Segment:
+    def __init__(self, path: Path):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, n = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path}: not a v{VERSION} message segment")
+        self.fields = orjson.loads(self._mm[_HEADER.size:_HEADER.size + n])
+        self._index_offset, self.blocks, magic = _FOOTER.unpack_from(self._mm, len(self._mm) - _FOOTER.size)
+        if magic != MAGIC:
+            raise ValueError(f"{path}: truncated segment")
+        self._seq = self.fields.index("seq")
+
+    def _entry(self, i: int) -> Tuple[int, int, int, int]:
+        return _ENTRY.unpack_from(self._mm, self._index_offset + i * _ENTRY.size)
+
+    def block(self, i: int) -> List[list]:
+        _, _, offset, length = self._entry(i)
+        return orjson.loads(zlib.decompress(self._mm[offset:offset + length]))
+
+    def older(self, before: Optional[int], limit: int, exclude: Collection[int] = ()) -> List[list]:
+        """Up to ``limit`` records with seq below ``before`` and not in
+        ``exclude``, newest first."""
+        # last block whose first_seq < before
+        lo, hi = 0, self.blocks
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if before is None or self._entry(mid)[0] < before:
+                lo = mid + 1
+            else:
+                hi = mid
+        records: List[list] = []
+        for i in range(lo - 1, -1, -1):
+            for record in reversed(self.block(i)):
+                if (before is None or record[self._seq] < before) and record[self._seq] not in exclude:
+                    records.append(record)
+                    if len(records) >= limit:
+                        return records
+        return records
+
+
+_open: "OrderedDict[Path, Segment]" = OrderedDict()
+_open_lock = threading.Lock()
+
+
+def _segment(path: Path) -> Segment:
+    with _open_lock:
+        segment = _open.get(path)
+        if segment is not None:
+            _open.move_to_end(path)
+            return segment
+    segment = Segment(path)
+    with _open_lock:
+        _open[path] = segment
+        # evicted maps are unmapped when the last reader drops them
+        while len(_open) > settings.SEGMENT_OPEN_FILES:
+            _open.popitem(last=False)
+    return segment
+
+
+def read_older(
+    chat_id, before: Optional[int], limit: int, skip: int = 0, exclude: Collection[int] = (),
+) -> Tuple[List[str], List[list]]:
+    """Blocking read of up to ``limit`` compacted records below ``before``,
+    newest first, after skipping the ``skip`` newest of them; seqs in
+    ``exclude`` (deleted since) are left out.
+
+    Returns ``(fields, records)``; ``fields`` names the record columns.
+    """
+    fields: List[str] = list(MESSAGE_RECORD_FIELDS)
+    records: List[list] = []
+    for first, last, path in reversed(segment_paths(chat_id)):
+        if before is not None and first >= before:
+            continue
+        segment = _segment(path)
+        fields = segment.fields
+        records += segment.older(before, skip + limit - len(records), exclude)
+        if len(records) >= skip + limit:
+            break
+        before = first
+    return fields, records[skip:]
+
+
+def find_record(chat_id, message_id) -> Tuple[List[str], Optional[list]]:
+    """Blocking scan of the chat's segments, newest first, for a message by id."""
+    message_id = str(message_id)
+    for _, _, path in reversed(segment_paths(chat_id)):
+        segment = _segment(path)
+        key = segment.fields.index("id")
+        for i in range(segment.blocks - 1, -1, -1):
+            for record in segment.block(i):
+                if record[key] == message_id:
+                    return segment.fields, record
+    return list(MESSAGE_RECORD_FIELDS), None
+
+
+def tombstone_seqs(chat_id):
+    """Column expression: array of the seqs of the chat's compacted messages
+    deleted since, to select alongside another lookup."""
+    return func.array(
+        select(MessageTombstone.seq).where(MessageTombstone.chat_id == chat_id).scalar_subquery()
+    )
+
+
+async def older_messages(
+    db: AsyncSession, chat_id, before: Optional[int], limit: int, skip: int = 0, deleted: Collection[int] = (),
+) -> List[dict]:
+    """Message dicts (newest first) from the chat's segments with seq below
+    ``before``, skipping the ``skip`` newest; ``deleted`` is the chat's
+    :func:`tombstone_seqs`."""
+    if limit <= 0:
+        return []
+    fields, records = await run_in_threadpool(read_older, chat_id, before, limit, skip, set(deleted))
+    return await _messages(db, fields, records)
+
+
+async def find_message(db: AsyncSession, chat_id, message_id, deleted: Collection[int] = ()) -> Optional[dict]:
+    """A compacted message of the chat by id, ``None`` if there is none or its
+    seq is in ``deleted``.  Reads every block in the worst case."""
+    fields, record = await run_in_threadpool(find_record, chat_id, message_id)
+    if record is None or record[fields.index("seq")] in deleted:
+        return None
+    return (await _messages(db, fields, [record]))[0]
+
+
+async def _messages(db: AsyncSession, fields: List[str], records: List[list]) -> List[dict]:
+    if not records:
+        return []
+    user_ids = set()
+    for key in ("sender_id", "forwarded_from_id"):
+        if key in fields:
+            i = fields.index(key)
+            user_ids.update(uuid.UUID(r[i]) for r in records if r[i])
+    users: Dict[str, dict] = {}
+    if user_ids:
+        result = await db.execute(user_rows_query(user_ids))
+        users = {str(row[0]): user_from_row(row) for row in result.all()}
+    return [message_from_record(fields, r, users) for r in records]
+
+
+# ---------- compaction ----------
+
+async def compact_chat(conn: AsyncConnection, chat_id, through_seq: int) -> int:
+    """Move the chat's messages up to ``through_seq`` into a new segment.
+
+    Runs in ``conn``'s transaction; the caller commits.  Rows already on
+    disk (a previous run that wrote its segment but didn't commit) are
+    deleted too, and ``chats.compacted_seq`` is moved up to match.  Returns
+    the number of messages written.
+    """
+    segments = segment_paths(chat_id)
+    after = segments[-1][1] if segments else 0
+    count = 0
+    if through_seq > after:
+        new = and_(Message.chat_id == chat_id, Message.seq > after, Message.seq <= through_seq)
+        writer = SegmentWriter(chat_id)
+        try:
+            result = await conn.stream(message_records_query().where(new).order_by(Message.seq))
+            async for row in result:
+                writer.add(list(row))
+            if writer.count < settings.SEGMENT_MIN_MESSAGES:
+                writer.abort()
+                return 0
+            path = await run_in_threadpool(writer.close)
+        except BaseException:
+            writer.abort()
+            raise
+        count = writer.count
+        logger.info("compacted %d messages of chat %s into %s", count, chat_id, path.name)
+        after = through_seq
+
+    if after:
+        await conn.execute(
+            update(Chat).where(Chat.id == chat_id, Chat.compacted_seq < after).values(compacted_seq=after)
+        )
+    on_disk = and_(Message.chat_id == chat_id, Message.seq <= after)
+    await conn.execute(delete(ReadReceipt).where(ReadReceipt.message_id.in_(select(Message.id).where(on_disk))))
+    await conn.execute(delete(Message).where(on_disk))
+    return count
+
+
+async def compact(engine: AsyncEngine, hot_days: int = settings.MESSAGE_HOT_DAYS) -> int:
+    """Compact every chat's messages older than ``hot_days``.  Returns messages moved.
+
+    Segments hold a seq range, so a chat is compacted up to its first message
+    newer than the cutoff even if later seqs carry older dates.
+    """
+    if hot_days <= 0:
+        return 0
+    cutoff = datetime.now(timezone.utc) - timedelta(days=hot_days)
+    async with engine.connect() as conn:
+        candidates = (await conn.execute(
+            select(Message.chat_id, func.max(Message.seq))
+            .where(Message.created_at < cutoff, Message.seq.isnot(None))
+            .group_by(Message.chat_id)
+        )).all()
+    moved = 0
+    for chat_id, through_seq in candidates:
+        async with engine.begin() as conn:
+            newer = (await conn.execute(
+                select(func.min(Message.seq)).where(Message.chat_id == chat_id, Message.created_at >= cutoff)
+            )).scalar_one()
+            if newer is not None:
+                through_seq = min(through_seq, newer - 1)
+            moved += await compact_chat(conn, chat_id, through_seq)
+    return moved
+
+
+async def _main(argv: List[str]) -> None:
+    from app.database import engine
+
+    command = argv[0] if argv else "compact"
+    if command == "compact":
+        print(f"compacted {await compact(engine)} messages")
+    elif command == "show" and len(argv) > 1:
+        for first, last, path in segment_paths(argv[1]):
+            segment = Segment(path)
+            print(f"{path.name}  {segment.blocks} blocks  {path.stat().st_size} bytes")
+    else:
+        print("usage: python -m app.segments [compact | show <chat_id>]")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main(sys.argv[1:]))
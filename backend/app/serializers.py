@@ -0,0 +1,167 @@
+"""Fast row -> dict projection for hot read endpoints."""
+
+import uuid
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import orjson
+from fastapi.responses import Response
+from sqlalchemy import Select, select
+
+from app.models import Chat, Message, User, chat_members
+from app.schemas import MessageOut, UserOut
+
+_USER_FIELDS = tuple(UserOut.model_fields)
+_MESSAGE_FIELDS = tuple(f for f in MessageOut.model_fields if f not in ("sender", "forwarded_from"))
+
+_messages = Message.__table__
+_sender = User.__table__.alias("sender")
+_forwarded_from = User.__table__.alias("forwarded_from")
+_N_MSG = len(_MESSAGE_FIELDS)
+_N_USER = len(_USER_FIELDS)
+
+
+def _default(obj: Any) -> Any:
+    # asyncpg returns its own uuid.UUID subclass, which orjson doesn't take natively
+    if isinstance(obj, uuid.UUID):
+        return str(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(content, default=_default, option=orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS)
+
+
+def to_json(content: Any) -> Any:
+    """``content`` with UUIDs and datetimes as strings, as Pydantic's JSON mode
+    would produce; for JSONB columns and event payloads."""
+    return orjson.loads(dumps(content))
+
+
+class ORJSONResponse(Response):
+    """JSON response rendered with orjson; output matches Pydantic's JSON mode."""
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def user_dict(user: Optional[User]) -> Optional[dict]:
+    if user is None:
+        return None
+    return {f: getattr(user, f) for f in _USER_FIELDS}
+
+
+def message_dict(msg: Message) -> dict:
+    """Project a message; ``sender`` and ``forwarded_from`` must already be loaded."""
+    data = {f: getattr(msg, f) for f in _MESSAGE_FIELDS}
+    data["sender"] = user_dict(msg.sender)
+    data["forwarded_from"] = user_dict(msg.forwarded_from)
+    return data
+
+
+def chat_dict(chat: Chat, members: List[dict], last_message: Optional[dict]) -> dict:
+    """Project a chat; ``members`` (the preview) and ``last_message`` are already dicts."""
+    return {
+        "id": chat.id,
+        "chat_type": chat.chat_type,
+        "title": chat.title,
+        "avatar_url": chat.avatar_url,
+        "created_at": chat.created_at,
+        "member_count": chat.member_count,
+        "members": members,
+        "last_message": last_message,
+    }
+
+
+def message_rows_query() -> Select:
+    """SELECT producing rows for :func:`message_from_row`; add WHERE/ORDER BY/LIMIT."""
+    return select(
+        *[_messages.c[f] for f in _MESSAGE_FIELDS],
+        *[_sender.c[f] for f in _USER_FIELDS],
+        *[_forwarded_from.c[f] for f in _USER_FIELDS],
+    ).select_from(
+        _messages
+        .outerjoin(_sender, _sender.c.id == _messages.c.sender_id)
+        .outerjoin(_forwarded_from, _forwarded_from.c.id == _messages.c.forwarded_from_id)
+    )
+
+
+def message_from_row(row: Sequence) -> dict:
+    data = dict(zip(_MESSAGE_FIELDS, row[:_N_MSG]))
+    sender = row[_N_MSG:_N_MSG + _N_USER]
+    forwarded_from = row[_N_MSG + _N_USER:]
+    data["sender"] = dict(zip(_USER_FIELDS, sender)) if sender[0] is not None else None
+    data["forwarded_from"] = dict(zip(_USER_FIELDS, forwarded_from)) if forwarded_from[0] is not None else None
+    return data
+
+
+# ---------- records (cold storage) ----------
+
+MESSAGE_RECORD_FIELDS = _MESSAGE_FIELDS
+
+
+def message_records_query() -> Select:
+    """SELECT of the message columns only, in ``MESSAGE_RECORD_FIELDS`` order.
+
+    Users are not embedded: records outlive profile changes, so they are
+    joined back in at read time by :func:`message_from_record`.
+    """
+    return select(*[_messages.c[f] for f in _MESSAGE_FIELDS])
+
+
+def member_rows_query() -> Select:
+    """SELECT of ``chat_members.chat_id`` plus the member's user columns, for
+    :func:`user_from_row` on ``row[1:]``; add WHERE/ORDER BY/LIMIT."""
+    users = User.__table__
+    return select(chat_members.c.chat_id, *[users.c[f] for f in _USER_FIELDS]).select_from(
+        chat_members.join(users, users.c.id == chat_members.c.user_id)
+    )
+
+
+def user_rows_query(ids: Iterable[Any]) -> Select:
+    return select(*[User.__table__.c[f] for f in _USER_FIELDS]).where(User.id.in_(ids))
+
+
+def user_from_row(row: Sequence) -> dict:
+    return dict(zip(_USER_FIELDS, row))
+
+
+def message_from_record(fields: Sequence[str], record: Sequence, users: Dict[str, dict]) -> dict:
+    """Rebuild a message dict from a stored record and ``users`` keyed by ``str(id)``."""
+    data = {f: None for f in _MESSAGE_FIELDS}
+    data.update(zip(fields, record))
+    data["sender"] = users.get(str(data["sender_id"])) if data["sender_id"] else None
+    data["forwarded_from"] = users.get(str(data["forwarded_from_id"])) if data["forwarded_from_id"] else None
+    return data
+
+
+# ---------- compact (normalized) shape ----------
+
+def hoist_users(messages: Iterable[dict], users: Dict[str, dict]) -> None:
+    """Move each message's embedded ``sender``/``forwarded_from`` into ``users``.
+
+    The ``sender_id``/``forwarded_from_id`` fields stay on the message.
+    """
+    for msg in messages:
+        for key in ("sender", "forwarded_from"):
+            user = msg.pop(key, None)
+            if user is not None:
+                users[str(user["id"])] = user
+
+
+def compact_messages(messages: List[dict]) -> dict:
+    users: Dict[str, dict] = {}
+    hoist_users(messages, users)
+    return {"users": users, "messages": messages}
+
+
+def compact_chats(chats: List[dict]) -> dict:
+    users: Dict[str, dict] = {}
+    for chat in chats:
+        members = chat.pop("members")
+        chat["member_ids"] = [m["id"] for m in members]
+        users.update((str(m["id"]), m) for m in members)
+        if chat["last_message"] is not None:
+            hoist_users([chat["last_message"]], users)
+    return {"users": users, "chats": chats}
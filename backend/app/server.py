@@ -0,0 +1,24 @@
+"""Production entry point: ``python -m app.server``."""
+
+import os
+
+import uvicorn
+
+from app.compression import DeflateWebSocketProtocol
+from app.config import settings
+
+
+def main():
+    uvicorn.run(
+        "app.main:app",
+        host=os.getenv("HOST", "0.0.0.0"),
+        port=int(os.getenv("PORT", "8000")),
+        workers=int(os.getenv("WEB_CONCURRENCY", "1")),
+        ws=DeflateWebSocketProtocol,
+        ws_per_message_deflate=settings.WS_DEFLATE_ENABLED,
+        proxy_headers=True,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""WebSocket wire formats: JSON text frames, or MessagePack binary frames."""
+
+import uuid
+from datetime import datetime
+from typing import Any, Dict, Optional, Union
+
+import orjson
+from starlette.types import Message
+from starlette.websockets import WebSocket, WebSocketDisconnect
+
+from app.serializers import dumps
+
+try:
+    import msgpack
+except ImportError:  # optional dependency
+    msgpack = None
+
+JSON = "json"
+MSGPACK = "msgpack"
+
+UUID_KEYS = frozenset({"id", "chat_id", "user_id", "message_id", "sender_id", "forwarded_from_id", "created_by"})
+UUID_LIST_KEYS = frozenset({"user_ids"})
+TIME_KEYS = frozenset({"created_at", "updated_at", "last_seen", "read_at"})
+
+
+def available_formats() -> tuple:
+    return (MSGPACK, JSON) if msgpack is not None else (JSON,)
+
+
+def negotiate(websocket: WebSocket) -> Optional[str]:
+    """The subprotocol to accept: the client's first offer we support, if any."""
+    supported = available_formats()
+    for offered in websocket.scope.get("subprotocols", []):
+        if offered in supported:
+            return offered
+    return None
+
+
+# ---------- MessagePack conversion ----------
+
+def _native(obj: dict, top: bool = False) -> dict:
+    out = {}
+    for key, value in obj.items():
+        cls = value.__class__
+        if cls is dict:
+            value = _native(value)
+        elif cls is list:
+            value = [_native(v) if v.__class__ is dict else v for v in value]
+        elif key in UUID_KEYS:
+            if cls is str and len(value) == 36 and not (top and key == "id"):  # a top-level "id" is the client's own
+                try:
+                    value = bytes.fromhex(value.replace("-", ""))  # much cheaper than uuid.UUID(value).bytes
+                except ValueError:
+                    pass
+        elif key in TIME_KEYS and cls is str:
+            try:
+                value = datetime.fromisoformat(value)
+            except ValueError:
+                pass
+        out[key] = value
+    return out
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, uuid.UUID):
+        return obj.bytes
+    raise TypeError(f"Type is not MessagePack serializable: {type(obj).__name__}")
+
+
+def pack(data: dict) -> bytes:
+    return msgpack.packb(_native(data, top=True), default=_default, datetime=True, use_bin_type=True)
+
+
+def _uuid_str(value: Any) -> Any:
+    if value.__class__ is bytes and len(value) == 16:
+        return str(uuid.UUID(bytes=value))
+    return value
+
+
+def _from_native(obj: dict, top: bool = False) -> dict:
+    out = {}
+    for key, value in obj.items():
+        cls = value.__class__
+        if cls is dict:
+            value = _from_native(value)
+        elif cls is list:
+            if key in UUID_LIST_KEYS:
+                value = [_uuid_str(v) for v in value]
+            else:
+                value = [_from_native(v) if v.__class__ is dict else v for v in value]
+        elif key in UUID_KEYS and not (top and key == "id"):
+            value = _uuid_str(value)
+        out[key] = value
+    return out
+
+
+def unpack(raw: bytes) -> Any:
+    """Decode a client frame into the same shape ``json.loads`` would give."""
+    data = msgpack.unpackb(raw, raw=False, timestamp=3)
+    return _from_native(data, top=True) if data.__class__ is dict else data
+
+
+# ---------- frames ----------
+
+class Frame:
+    """An outgoing payload, encoded at most once per wire format."""
+
+    __slots__ = ("data", "_encoded")
+
+    def __init__(self, data: dict):
+        self.data = data
+        self._encoded: Dict[str, Message] = {}
+
+    def message(self, wire: str) -> Message:
+        """The ASGI ``websocket.send`` message for a socket speaking ``wire``."""
+        encoded = self._encoded.get(wire)
+        if encoded is None:
+            if wire == MSGPACK:
+                encoded = {"type": "websocket.send", "bytes": pack(self.data)}
+            else:
+                encoded = {"type": "websocket.send", "text": dumps(self.data).decode()}
+            self._encoded[wire] = encoded
+        return encoded
+
+
+def as_frame(data: Union[dict, Frame]) -> Frame:
+    return data if isinstance(data, Frame) else Frame(data)
+
+
+def decode(message: Message, wire: str) -> Any:
+    """Payload of a received ASGI message; raises ``WebSocketDisconnect`` on close."""
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", 1000), message.get("reason"))
+    if message.get("bytes") is not None:
+        if wire == MSGPACK:
+            return unpack(message["bytes"])
+        return orjson.loads(message["bytes"])
+    return orjson.loads(message["text"])
+
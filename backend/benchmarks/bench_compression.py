@@ -0,0 +1,89 @@
+"""Bytes saved vs. CPU spent for HTTP and WebSocket compression.
+
+    python -m benchmarks.bench_compression [--repeat 50] [--frames 2000]
+
+HTTP: list_messages (50/200) and list_chats payloads through gzip and brotli
+at several levels.  WebSocket: a stream of ``new_message`` and ``typing``
+frames through permessage-deflate with context takeover, at several window
+sizes, honouring the ``WS_DEFLATE_MIN_SIZE`` threshold.
+"""
+
+import argparse
+import time
+import zlib
+
+from app.compression import brotli
+from app.config import settings
+from app.serializers import chat_dict, dumps, message_dict
+from benchmarks.fixtures import make_chat, make_messages, make_users, member_preview
+
+
+def http_payloads() -> dict:
+    users = make_users(30)
+    chats = [(make_chat(users[i:i + 10]), make_messages(1, users, seed=i)[0]) for i in range(20)]
+    return {
+        "messages x50": dumps([message_dict(m) for m in make_messages(50, users[:2])]),
+        "messages x200": dumps([message_dict(m) for m in make_messages(200, users[:2])]),
+        "chats x20": dumps([chat_dict(c, member_preview(c), message_dict(m)) for c, m in chats]),
+    }
+
+
+def http_codecs() -> dict:
+    codecs = {f"gzip-{lvl}": (lambda b, lvl=lvl: zlib.compress(b, lvl, wbits=31)) for lvl in (1, 6, 9)}
+    if brotli is not None:
+        codecs.update({f"br-{q}": (lambda b, q=q: brotli.compress(b, quality=q)) for q in (1, 4, 11)})
+    return codecs
+
+
+def ws_frames(n: int) -> list[bytes]:
+    users = make_users(2)
+    frames = []
+    for i, msg in enumerate(make_messages(n, users)):
+        if i % 3 == 0:
+            frames.append(dumps({"type": "typing", "chat_id": msg.chat_id, "user_id": msg.sender_id}))
+        frames.append(dumps({"type": "new_message", "chat_id": msg.chat_id, "seq": msg.seq, "message": message_dict(msg)}))
+    return frames
+
+
+def deflate_stream(frames: list[bytes], window_bits: int, level: int, min_size: int) -> tuple[int, float]:
+    encoder = zlib.compressobj(level, zlib.DEFLATED, -window_bits, settings.WS_DEFLATE_MEM_LEVEL)
+    total = 0
+    start = time.process_time()
+    for frame in frames:
+        if len(frame) < min_size:
+            total += len(frame)
+        else:
+            total += len(encoder.compress(frame) + encoder.flush(zlib.Z_SYNC_FLUSH)) - 4
+    return total, time.process_time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--frames", type=int, default=2000)
+    args = parser.parse_args()
+
+    print("HTTP responses")
+    print(f"{'payload':<16} {'codec':<8} {'raw':>8} {'sent':>8} {'saved':>6} {'cpu ms':>8}")
+    for name, body in http_payloads().items():
+        for codec, fn in http_codecs().items():
+            start = time.process_time()
+            for _ in range(args.repeat):
+                out = fn(body)
+            ms = (time.process_time() - start) / args.repeat * 1000
+            print(f"{name:<16} {codec:<8} {len(body):>8} {len(out):>8} {1 - len(out) / len(body):>6.0%} {ms:>8.3f}")
+
+    frames = ws_frames(args.frames)
+    raw = sum(len(f) for f in frames)
+    print(f"\nWebSocket permessage-deflate, {len(frames)} frames, {raw / len(frames):.0f} B/frame raw")
+    print(f"{'window':>6} {'level':>5} {'min':>5} {'B/frame':>8} {'saved':>6} {'us/frame':>9}")
+    for window_bits in (9, 12, 15):
+        for level in (1, 6):
+            for min_size in (0, settings.WS_DEFLATE_MIN_SIZE):
+                sent, cpu = deflate_stream(frames, window_bits, level, min_size)
+                print(f"{window_bits:>6} {level:>5} {min_size:>5} {sent / len(frames):>8.0f} "
+                      f"{1 - sent / raw:>6.0%} {cpu / len(frames) * 1e6:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""UUIDv4 vs UUIDv7 primary keys: insert throughput and index size as a table grows.
+
+    python -m benchmarks.bench_ids [--database-url URL | --embedded]
+        [--rows 100000000] [--batch 50000] [--reports 10] [--keep]
+
+Creates two scratch tables shaped like ``messages`` (a ``uuid`` primary key
+plus the ``(chat_id, created_at)`` index), one keyed by ``uuid.uuid4`` and
+one by ``app.ids.uuid7``, and COPYs ``--rows`` rows into each in alternating
+batches of ``--batch``.  At each of ``--reports`` points it prints, per key
+kind:
+
+* ``rows/s`` over the batches since the last report;
+* the primary key index size;
+* ``miss %``: index block reads that were not in shared buffers since the
+  last report (``pg_statio_user_tables``).
+
+and at the end the leaf density of each primary key when ``pgstattuple`` is
+installed.  The difference grows once the v4 index no longer fits in
+``shared_buffers``: run at production scale (``--rows 100000000`` needs
+tens of GB and hours) to see the numbers that matter; the default of 5M
+rows shows the index-size gap and the start of the throughput one.
+Results go to ``benchmarks/results/ids-<time>-<commit>.json``; the tables
+are dropped afterwards unless ``--keep``.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+import uuid
+from datetime import datetime, timezone
+
+KINDS = ("v4", "v7")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL"))
+    parser.add_argument("--embedded", action="store_true", help="start a throwaway Postgres via pgserver")
+    parser.add_argument("--rows", type=int, default=5_000_000, help="rows per table")
+    parser.add_argument("--batch", type=int, default=50_000)
+    parser.add_argument("--reports", type=int, default=10)
+    parser.add_argument("--chats", type=int, default=10_000)
+    parser.add_argument("--keep", action="store_true", help="keep the bench_ids_* tables")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="results directory (default benchmarks/results)")
+    return parser.parse_args()
+
+
+async def connect(url: str):
+    import asyncpg
+
+    from app.config import _build_db_url
+
+    return await asyncpg.connect(_build_db_url(url, "asyncpg").replace("postgresql+asyncpg://", "postgresql://", 1))
+
+
+async def create_tables(conn) -> None:
+    for kind in KINDS:
+        await conn.execute(f"DROP TABLE IF EXISTS bench_ids_{kind}")
+        await conn.execute(
+            f"""
+            CREATE TABLE bench_ids_{kind} (
+                id uuid PRIMARY KEY,
+                chat_id uuid NOT NULL,
+                created_at timestamptz NOT NULL,
+                content text
+            )
+            """
+        )
+        await conn.execute(f"CREATE INDEX bench_ids_{kind}_chat ON bench_ids_{kind} (chat_id, created_at)")
+
+
+async def index_stats(conn, kind: str) -> dict:
+    # pending counters of this backend are flushed at the end of its next transaction
+    await conn.execute("SELECT pg_stat_force_next_flush()")
+    await conn.execute("SELECT 1")
+    await conn.execute("SELECT pg_stat_clear_snapshot()")
+    row = await conn.fetchrow(
+        "SELECT idx_blks_read, idx_blks_hit, pg_relation_size($2::regclass) AS pk_bytes "
+        "FROM pg_statio_user_tables WHERE relname = $1",
+        f"bench_ids_{kind}", f"bench_ids_{kind}_pkey",
+    )
+    return dict(row)
+
+
+async def leaf_density(conn, kind: str):
+    try:
+        return await conn.fetchval("SELECT avg_leaf_density FROM pgstatindex($1)", f"bench_ids_{kind}_pkey")
+    except Exception:  # pgstattuple not installed
+        return None
+
+
+async def run(args):
+    from app.ids import uuid7
+    from benchmarks import harness
+
+    rng = random.Random(args.seed)
+    chats = [uuid.UUID(int=rng.getrandbits(128)) for _ in range(args.chats)]
+    make_id = {"v4": uuid.uuid4, "v7": uuid7}
+    conn = await connect(args.database_url)
+    await create_tables(conn)
+
+    batches = max(1, args.rows // args.batch)
+    report_every = max(1, batches // args.reports)
+    elapsed = {kind: 0.0 for kind in KINDS}
+    inserted = {kind: 0 for kind in KINDS}
+    last = {kind: await index_stats(conn, kind) for kind in KINDS}
+    results = {kind: [] for kind in KINDS}
+    shared_buffers = await conn.fetchval("SHOW shared_buffers")
+    print(f"shared_buffers {shared_buffers}")
+    print(f"{'rows':>12} " + " ".join(f"{k + ' rows/s':>11} {k + ' pk MB':>9} {k + ' miss %':>9}" for k in KINDS))
+    try:
+        for b in range(1, batches + 1):
+            now = datetime.now(timezone.utc)
+            for kind in KINDS:
+                records = [(make_id[kind](), rng.choice(chats), now, "bench") for _ in range(args.batch)]
+                t0 = time.perf_counter()
+                await conn.copy_records_to_table(
+                    f"bench_ids_{kind}", records=records, columns=("id", "chat_id", "created_at", "content"),
+                )
+                elapsed[kind] += time.perf_counter() - t0
+                inserted[kind] += args.batch
+            if b % report_every and b != batches:
+                continue
+            line = f"{inserted['v4']:>12} "
+            for kind in KINDS:
+                stats = await index_stats(conn, kind)
+                reads = stats["idx_blks_read"] - last[kind]["idx_blks_read"]
+                hits = stats["idx_blks_hit"] - last[kind]["idx_blks_hit"]
+                point = {
+                    "rows": inserted[kind],
+                    "rows_per_s": round(report_every * args.batch / elapsed[kind], 1),
+                    "pk_bytes": stats["pk_bytes"],
+                    "index_miss_pct": round(100 * reads / max(reads + hits, 1), 2),
+                }
+                results[kind].append(point)
+                last[kind], elapsed[kind] = stats, 0.0
+                line += f"{point['rows_per_s']:>11.0f} {point['pk_bytes'] / 2**20:>9.1f} {point['index_miss_pct']:>9.2f}"
+            print(line)
+
+        summary = {}
+        for kind in KINDS:
+            summary[kind] = {
+                "pk_bytes": results[kind][-1]["pk_bytes"],
+                "avg_leaf_density": await leaf_density(conn, kind),
+                "points": results[kind],
+            }
+            density = summary[kind]["avg_leaf_density"]
+            print(f"{kind}: primary key {summary[kind]['pk_bytes'] / 2**20:.1f} MB"
+                  + (f", leaf density {density:.1f}%" if density is not None else ""))
+    finally:
+        if not args.keep:
+            for kind in KINDS:
+                await conn.execute(f"DROP TABLE IF EXISTS bench_ids_{kind}")
+        await conn.close()
+
+    params = {k: v for k, v in vars(args).items() if k not in ("database_url", "out")}
+    params["shared_buffers"] = shared_buffers
+    path = harness.save_results("ids", params, summary, args.out)
+    print(f"\nresults written to {path}")
+
+
+def main():
+    args = parse_args()
+    if args.embedded:
+        from benchmarks.harness import start_embedded_postgres
+
+        args.database_url = start_embedded_postgres(tempfile.mkdtemp(prefix="bench-pg-"))
+    if not args.database_url:
+        raise SystemExit("set DATABASE_URL, pass --database-url, or use --embedded")
+    os.environ["DATABASE_URL"] = args.database_url
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
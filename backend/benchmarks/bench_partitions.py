@@ -0,0 +1,187 @@
+"""Insert and recent-page latency on the partitioned messages table as history grows.
+
+    python -m benchmarks.bench_partitions [--database-url URL | --embedded]
+        [--steps 100000,500000,2000000] [--months 24] [--samples 500]
+
+Seeds a few chats, then backfills message history in steps, spread evenly
+over the last ``--months`` months (one partition each, created up front with
+``app.partitions.ensure_partitions``).  After each step it measures, over
+``--samples`` operations:
+
+* ``insert``: a single-row ``INSERT`` of a new message into a random chat;
+* ``recent_page``: the ``list_messages`` query (newest 50 of a random chat).
+
+and reports p50/p95 plus how many partitions the recent-page plan actually
+executed (from ``EXPLAIN (ANALYZE, FORMAT JSON)``).  Both latencies should
+stay flat as the table grows, and ``partitions_executed`` stays constant
+however many months exist: the plan walks partitions newest first (the
+empty months created ahead, then the current one or two) and stops once it
+has a page.  Results go to
+``benchmarks/results/partitions-<time>-<commit>.json``.  The backfill is
+not removed afterwards; use a scratch database.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL"))
+    parser.add_argument("--embedded", action="store_true", help="start a throwaway Postgres via pgserver")
+    parser.add_argument("--steps", default="100000,500000,2000000", help="total backfilled messages after each step")
+    parser.add_argument("--months", type=int, default=24, help="months of history to spread the backfill over")
+    parser.add_argument("--chats", type=int, default=50)
+    parser.add_argument("--samples", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="results directory (default benchmarks/results)")
+    return parser.parse_args()
+
+
+def executed_partitions(plan: dict) -> int:
+    """Partition scans in an EXPLAIN ANALYZE plan that ran at least once."""
+    count = 0
+    if plan.get("Relation Name", "").startswith("messages_p") and plan.get("Actual Loops", 0) > 0:
+        count += 1
+    for child in plan.get("Plans", []):
+        count += executed_partitions(child)
+    return count
+
+
+async def backfill(engine, chat_ids, senders, count: int, start: datetime, end: datetime):
+    """Insert ``count`` messages spread evenly between ``start`` and ``end``, server side."""
+    from sqlalchemy import text
+
+    span = (end - start).total_seconds()
+    async with engine.begin() as conn:
+        await conn.execute(
+            text(
+                """
+                INSERT INTO messages (chat_id, seq, sender_id, content, status, created_at)
+                SELECT (CAST(:chats AS uuid[]))[1 + g % cardinality(CAST(:chats AS uuid[]))],
+                       NULL,
+                       (CAST(:senders AS uuid[]))[1 + g % cardinality(CAST(:senders AS uuid[]))],
+                       'backfill ' || g,
+                       'read',
+                       CAST(:start AS timestamptz) + (g * CAST(:step AS float8)) * interval '1 second'
+                FROM generate_series(0, CAST(:count AS int) - 1) AS g
+                """
+            ),
+            {
+                "chats": chat_ids, "senders": senders, "count": count,
+                "start": start, "step": span / max(count, 1),
+            },
+        )
+        await conn.execute(text("ANALYZE messages"))
+
+
+async def measure(engine, chat_ids, senders, samples: int, rng: random.Random) -> dict:
+    from sqlalchemy import insert, text
+
+    from app.models import Message
+    from app.serializers import message_rows_query
+    from benchmarks.harness import summarize
+
+    def page(chat_id):
+        return (
+            message_rows_query()
+            .where(Message.chat_id == chat_id)
+            .order_by(Message.created_at.desc())
+            .limit(50)
+        )
+
+    inserts, pages = [], []
+    async with engine.connect() as conn:
+        for _ in range(samples):
+            row = {"chat_id": rng.choice(chat_ids), "sender_id": rng.choice(senders), "content": "bench", "status": "sent"}
+            t0 = time.perf_counter()
+            await conn.execute(insert(Message).values(**row))
+            await conn.commit()
+            inserts.append(time.perf_counter() - t0)
+
+        for _ in range(samples):
+            t0 = time.perf_counter()
+            (await conn.execute(page(rng.choice(chat_ids)))).all()
+            pages.append(time.perf_counter() - t0)
+        await conn.rollback()
+
+        compiled = page(chat_ids[0]).compile(engine.sync_engine, compile_kwargs={"literal_binds": True})
+        explain = (await conn.execute(text(f"EXPLAIN (ANALYZE, FORMAT JSON) {compiled}"))).scalar()
+        if isinstance(explain, str):
+            explain = json.loads(explain)
+        await conn.rollback()
+
+    insert_stats = summarize(inserts, 0, sum(inserts), None)
+    page_stats = summarize(pages, 0, sum(pages), None)
+    page_stats["partitions_executed"] = executed_partitions(explain[0]["Plan"])
+    return {"insert": insert_stats, "recent_page": page_stats}
+
+
+async def run(args):
+    from sqlalchemy import func, select
+
+    from app.database import engine
+    from app.models import Message
+    from app.partitions import ensure_partitions, list_partitions
+    from benchmarks import harness
+
+    rng = random.Random(args.seed)
+    data = await harness.seed(engine, users=max(20, args.chats), chats=args.chats, messages=args.chats * 10,
+                              group_size=5, seed_value=args.seed)
+    chat_ids = data.chat_ids
+    senders = data.user_ids
+
+    end = datetime.now(timezone.utc) - timedelta(hours=1)
+    start = end - timedelta(days=30 * args.months)
+    async with engine.begin() as conn:
+        await ensure_partitions(conn, start=start)
+        partitions = len(await list_partitions(conn))
+
+    steps = [int(s) for s in args.steps.split(",") if s]
+    results = {}
+    done = 0
+    print(f"{partitions} partitions")
+    print(f"{'messages':>10} {'insert p50':>11} {'p95':>7} {'page p50':>9} {'p95':>7} {'partitions':>11}")
+    for total in steps:
+        if total > done:
+            await backfill(engine, chat_ids, senders, total - done, start, end)
+            done = total
+        async with engine.connect() as conn:
+            rows = (await conn.execute(select(func.count()).select_from(Message))).scalar()
+        stats = await measure(engine, chat_ids, senders, args.samples, rng)
+        results[str(rows)] = stats
+        ins, page = stats["insert"]["latency_ms"], stats["recent_page"]["latency_ms"]
+        print(f"{rows:>10} {ins['p50']:>9.2f}ms {ins['p95']:>5.2f}ms {page['p50']:>7.2f}ms "
+              f"{page['p95']:>5.2f}ms {stats['recent_page']['partitions_executed']:>11}")
+
+    params = {k: v for k, v in vars(args).items() if k not in ("database_url", "out")}
+    params["partitions"] = partitions
+    path = harness.save_results("partitions", params, results, args.out)
+    print(f"\nresults written to {path}")
+    await engine.dispose()
+
+
+def main():
+    args = parse_args()
+    if args.embedded:
+        from benchmarks.harness import start_embedded_postgres
+
+        args.database_url = start_embedded_postgres(tempfile.mkdtemp(prefix="bench-pg-"))
+    if not args.database_url:
+        raise SystemExit("set DATABASE_URL, pass --database-url, or use --embedded")
+    os.environ["DATABASE_URL"] = args.database_url
+
+    from benchmarks.harness import migrate
+
+    migrate()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Payload size and encode time: embedded users vs. the compact (normalized) shape.
+
+    python -m benchmarks.bench_payload_shape [--repeat 200]
+
+Covers a message page in a 2-person chat and in a 30-person group, and a chat
+list of 50 groups with 30 members each (of which ``CHAT_MEMBER_PREVIEW`` are
+embedded).  Encode time includes building the
+compact shape from the embedded dicts.
+"""
+
+import argparse
+import time
+
+from app.serializers import chat_dict, compact_chats, compact_messages, dumps, message_dict
+from benchmarks.fixtures import make_chat, make_messages, make_users, member_preview
+
+
+def measure(build, repeat: int) -> tuple[int, float]:
+    size = len(dumps(build()))
+    start = time.process_time()
+    for _ in range(repeat):
+        dumps(build())
+    return size, (time.process_time() - start) / repeat * 1000
+
+
+def report(label: str, embedded, compact, repeat: int):
+    size_e, ms_e = measure(embedded, repeat)
+    size_c, ms_c = measure(compact, repeat)
+    print(f"{label:<28} {size_e:>9} {size_c:>9} {1 - size_c / size_e:>6.0%}  {ms_e:>8.3f} {ms_c:>8.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'payload':<28} {'embedded':>9} {'compact':>9} {'saved':>6}  {'emb ms':>8} {'cmp ms':>8}")
+    for members in (2, 30):
+        users = make_users(members)
+        for n in (50, 200, 1000):
+            messages = make_messages(n, users)
+            report(
+                f"messages n={n} members={members}",
+                lambda: [message_dict(m) for m in messages],
+                lambda: compact_messages([message_dict(m) for m in messages]),
+                args.repeat,
+            )
+
+    users = make_users(300)
+    chats = []
+    for i in range(50):
+        members = users[i * 5:i * 5 + 30]
+        chats.append((make_chat(members), make_messages(1, members, seed=i)[0]))
+    report(
+        "chat list 50 chats x 30",
+        lambda: [chat_dict(c, member_preview(c), message_dict(m)) for c, m in chats],
+        lambda: compact_chats([chat_dict(c, member_preview(c), message_dict(m)) for c, m in chats]),
+        args.repeat,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""Direct vs pooled (PgBouncer) database access at high concurrency.
+
+    python -m benchmarks.bench_pooling --database-url URL [--pooled-url URL]
+        [--workers 8] [--pool-size 20] [--max-overflow 10] [--concurrency 400]
+        [--duration 15]
+
+Simulates ``--workers`` app processes, each with its own engine built by
+``app.database.engine_options``, sharing ``--concurrency`` client tasks.
+Each task loops over the ``list_messages`` read path (membership check plus
+the newest 50 messages of a random seeded chat) in a transaction.  Modes:
+
+* ``direct``: straight to Postgres with prepared-statement caching.
+* ``direct_nocache``: the same with ``DB_PGBOUNCER`` on, to isolate the cost
+  of giving up the statement cache.
+* ``pooled``: through ``--pooled-url`` (a transaction-mode PgBouncer) with
+  ``DB_PGBOUNCER`` on; skipped without it.
+
+Reports throughput, latency percentiles, errors (pool timeouts, "too many
+clients") and the most client backends Postgres saw at once, sampled from
+``pg_stat_activity`` over ``--database-url``.  Results go to
+``benchmarks/results/pooling-<time>-<commit>.json``.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import time
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL"))
+    parser.add_argument("--pooled-url", help="the same database through a transaction-mode PgBouncer")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--pool-size", type=int, default=20)
+    parser.add_argument("--max-overflow", type=int, default=10)
+    parser.add_argument("--pool-timeout", type=float, default=10)
+    parser.add_argument("--concurrency", type=int, default=400)
+    parser.add_argument("--duration", type=float, default=15.0)
+    parser.add_argument("--modes", default="direct,direct_nocache,pooled")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="results directory (default benchmarks/results)")
+    return parser.parse_args()
+
+
+def make_engines(url: str, workers: int, pgbouncer: bool, args):
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    from app.config import settings
+    from app.database import engine_options
+
+    saved = {k: getattr(settings, k) for k in ("DB_PGBOUNCER", "DB_POOL_SIZE", "DB_MAX_OVERFLOW", "DB_POOL_TIMEOUT")}
+    settings.DB_PGBOUNCER = pgbouncer
+    settings.DB_POOL_SIZE = args.pool_size
+    settings.DB_MAX_OVERFLOW = args.max_overflow
+    settings.DB_POOL_TIMEOUT = args.pool_timeout
+    try:
+        return [create_async_engine(url, **engine_options()) for _ in range(workers)]
+    finally:
+        for k, v in saved.items():
+            setattr(settings, k, v)
+
+
+async def sample_backends(url: str, stop: asyncio.Event) -> int:
+    """Peak number of client backends connected to the database while running."""
+    import asyncpg
+
+    from app.config import _build_db_url
+
+    conn = await asyncpg.connect(_build_db_url(url, "asyncpg").replace("postgresql+asyncpg://", "postgresql://", 1))
+    peak = 0
+    try:
+        while not stop.is_set():
+            n = await conn.fetchval(
+                "SELECT count(*) FROM pg_stat_activity "
+                "WHERE datname = current_database() AND backend_type = 'client backend'"
+            )
+            peak = max(peak, n - 1)
+            await asyncio.sleep(0.2)
+    finally:
+        await conn.close()
+    return peak
+
+
+async def run_mode(engines, data, args, rng: random.Random) -> dict:
+    from sqlalchemy import and_, select
+
+    from app.models import Message, chat_members
+    from app.serializers import message_rows_query
+    from benchmarks.harness import summarize
+
+    latencies, errors = [], {}
+    stop = asyncio.Event()
+    sampler = asyncio.create_task(sample_backends(args.database_url, stop))
+    deadline = time.perf_counter() + args.duration
+    pairs = [(chat_id, uid) for chat_id, members in data.chat_members.items() for uid in members]
+
+    async def client(i: int):
+        engine = engines[i % len(engines)]
+        while time.perf_counter() < deadline:
+            chat_id, user_id = rng.choice(pairs)
+            t0 = time.perf_counter()
+            try:
+                async with engine.begin() as conn:
+                    await conn.execute(select(chat_members).where(
+                        and_(chat_members.c.chat_id == chat_id, chat_members.c.user_id == user_id)
+                    ))
+                    (await conn.execute(
+                        message_rows_query().where(Message.chat_id == chat_id)
+                        .order_by(Message.created_at.desc()).limit(50)
+                    )).all()
+                latencies.append(time.perf_counter() - t0)
+            except Exception as exc:
+                while exc.__cause__ is not None:  # the driver's own error, e.g. TooManyConnectionsError
+                    exc = exc.__cause__
+                name = type(exc).__name__
+                errors[name] = errors.get(name, 0) + 1
+                await asyncio.sleep(0.05)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(i) for i in range(args.concurrency)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    peak = await sampler
+    for engine in engines:
+        await engine.dispose()
+
+    result = summarize(latencies, sum(errors.values()), elapsed, None)
+    result["error_types"] = errors
+    result["peak_server_backends"] = peak
+    return result
+
+
+async def run(args):
+    from app.database import engine
+    from benchmarks import harness
+
+    rng = random.Random(args.seed)
+    data = await harness.seed(engine, users=200, chats=100, messages=20000, group_size=10, seed_value=args.seed)
+    await engine.dispose()
+
+    modes = [m for m in args.modes.split(",") if m]
+    if "pooled" in modes and not args.pooled_url:
+        print("no --pooled-url: skipping pooled mode")
+        modes.remove("pooled")
+
+    results = {}
+    print(f"{'mode':<16} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7} {'backends':>9}")
+    for mode in modes:
+        url = args.pooled_url if mode == "pooled" else args.database_url
+        engines = make_engines(url, args.workers, pgbouncer=mode != "direct", args=args)
+        r = await run_mode(engines, data, args, rng)
+        results[mode] = r
+        lat = r["latency_ms"]
+        print(f"{mode:<16} {r['throughput_ops']:>8} {lat['p50']:>8} {lat['p95']:>8} {lat['p99']:>8} "
+              f"{r['errors']:>7} {r['peak_server_backends']:>9}")
+        if r["error_types"]:
+            print(f"{'':<16} {r['error_types']}")
+
+    params = {k: v for k, v in vars(args).items() if k not in ("database_url", "pooled_url", "out")}
+    path = harness.save_results("pooling", params, results, args.out)
+    print(f"\nresults written to {path}")
+
+
+def main():
+    args = parse_args()
+    if not args.database_url:
+        raise SystemExit("set DATABASE_URL or pass --database-url")
+    os.environ["DATABASE_URL"] = args.database_url
+
+    from benchmarks.harness import migrate
+
+    migrate()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
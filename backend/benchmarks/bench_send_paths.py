@@ -0,0 +1,217 @@
+"""Latency of each way of sending a message: response time and time until every member has it.
+
+    python -m benchmarks.bench_send_paths [--database-url URL | --embedded]
+        [--group-sizes 2,50,500] [--requests 300] [--warmup 20] [--fanout-timeout 5]
+
+For each group size, seeds a chat with that many members, connects every
+member with a stand-in socket (sends cost the encoding, not a network), and
+sends ``--requests`` messages one after another through each path:
+
+* ``rest_send``: ``POST /api/chats/{id}/messages``
+* ``rest_image``: ``POST /api/chats/{id}/messages/image`` with a tiny PNG
+* ``rest_forward``: ``POST /api/chats/forward`` of a seeded message
+* ``ws_message``: the socket ``message`` frame handler
+
+The app runs in-process with its lifespan (so the outbox dispatcher is
+running) and requests go through ``httpx.ASGITransport``.  Per path it
+reports response latency, ``fanout``: from the start of the request until
+the last member socket got the ``new_message`` frame, and SQL statements per
+send (sends not seen by every member within ``--fanout-timeout`` are
+counted as missed).  Results go to ``benchmarks/results/send_paths-<time>-<commit>.json``.
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+PATHS = ("rest_send", "rest_image", "rest_forward", "ws_message")
+PNG = bytes.fromhex("89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+                    "1f15c4890000000d49444154789c6360000002000154a24f5d0000000049454e44ae426082")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL"))
+    parser.add_argument("--embedded", action="store_true", help="start a throwaway Postgres via pgserver")
+    parser.add_argument("--group-sizes", default="2,50,500")
+    parser.add_argument("--requests", type=int, default=300, help="sends per path and group size")
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--paths", default=",".join(PATHS))
+    parser.add_argument("--fanout-timeout", type=float, default=5.0, help="seconds to wait for every member to get a send")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="results directory (default benchmarks/results)")
+    return parser.parse_args()
+
+
+class Sink:
+    """Stands in for a member's socket: records when a ``new_message`` frame arrives."""
+
+    def __init__(self, inbox: "Inbox"):
+        self.inbox = inbox
+
+    async def send(self, message: dict) -> None:
+        data = message.get("text") or message.get("bytes") or b""
+        if b"new_message" in (data.encode() if isinstance(data, str) else data):
+            self.inbox.received()
+
+
+class Inbox:
+    def __init__(self):
+        self.count = 0
+        self.last = 0.0
+        self.changed = asyncio.Event()
+
+    def received(self) -> None:
+        self.count += 1
+        self.last = time.perf_counter()
+        self.changed.set()
+
+    async def wait_for(self, count: int, timeout: float) -> bool:
+        deadline = time.perf_counter() + timeout
+        while self.count < count:
+            self.changed.clear()
+            try:
+                await asyncio.wait_for(self.changed.wait(), max(deadline - time.perf_counter(), 0))
+            except asyncio.TimeoutError:
+                return False
+        return True
+
+
+async def run_path(path: str, client, chat_id, sender, forward_id, inbox: Inbox, members: int, counter, n: int,
+                   timeout: float) -> dict:
+    from app.database import async_session
+    from app.routers import ws
+    from benchmarks import harness
+
+    async def send(i: int):
+        if path == "rest_send":
+            resp = await client.post(f"/api/chats/{chat_id}/messages", json={"content": f"bench {i}"})
+        elif path == "rest_image":
+            resp = await client.post(
+                f"/api/chats/{chat_id}/messages/image", params={"caption": f"bench {i}"},
+                files={"file": ("b.png", PNG, "image/png")},
+            )
+        elif path == "rest_forward":
+            resp = await client.post("/api/chats/forward", json={"message_id": str(forward_id), "to_chat_id": str(chat_id)})
+        else:
+            async with async_session() as db:
+                await ws._handle_ws_message(sender, {"type": "message", "chat_id": str(chat_id), "content": f"bench {i}"}, db)
+                await db.commit()
+            return
+        resp.raise_for_status()
+
+    latencies, fanouts, errors, missed = [], [], 0, 0
+    queries = 0
+    started = time.perf_counter()
+    for i in range(n):
+        expected = inbox.count + members
+        before = counter.count
+        t0 = time.perf_counter()
+        try:
+            await send(i)
+        except Exception:
+            errors += 1
+            continue
+        latencies.append(time.perf_counter() - t0)
+        queries += counter.count - before
+        if await inbox.wait_for(expected, timeout):
+            fanouts.append(inbox.last - t0)
+        else:
+            missed += 1
+            inbox.count = expected
+    result = harness.summarize(latencies, errors, time.perf_counter() - started, queries)
+    values = sorted(fanouts)
+    result["fanout_ms"] = {
+        "p50": round(harness.percentile(values, 50) * 1000, 2),
+        "p95": round(harness.percentile(values, 95) * 1000, 2),
+        "p99": round(harness.percentile(values, 99) * 1000, 2),
+    }
+    result["fanout_missed"] = missed
+    return result
+
+
+async def run(args):
+    import httpx
+    from sqlalchemy import select
+
+    from app.config import settings
+    from app.database import async_session, engine
+    from app.main import app
+    from app.models import Message, User
+    from app.routers.ws import manager
+    from app.wire import JSON
+    from benchmarks import harness
+
+    settings.RATE_LIMIT_ENABLED = False
+    settings.LOOP_WATCHDOG_ENABLED = False  # seeding hashes passwords on the loop
+    settings.UPLOAD_DIR = tempfile.mkdtemp(prefix="bench-uploads-")
+    paths = [p for p in args.paths.split(",") if p]
+    sizes = [int(s) for s in args.group_sizes.split(",") if s]
+    counter = harness.QueryCounter(engine)
+    scenarios = {}
+
+    async with app.router.lifespan_context(app):
+        for size in sizes:
+            data = await harness.seed(engine, users=max(size, 2), chats=2, messages=20, group_size=size,
+                                      seed_value=args.seed)
+            chat_id = data.chat_ids[0] if size <= 2 else data.chat_ids[1]
+            members = data.chat_members[chat_id]
+            me = members[0]
+            async with engine.connect() as conn:
+                forward_id = (await conn.execute(
+                    select(Message.id).where(Message.chat_id == chat_id).limit(1)
+                )).scalar_one()
+            async with async_session() as db:
+                sender = (await db.execute(select(User).where(User.id == me))).scalar_one()
+
+            inbox = Inbox()
+            for uid in members:
+                sink = Sink(inbox)
+                manager.active.setdefault(uid, set()).add(sink)
+                manager.wire[sink] = JSON
+
+            transport = httpx.ASGITransport(app=app)
+            headers = {"Authorization": f"Bearer {data.tokens[me]}"}
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", headers=headers) as client:
+                print(f"\n{size} members")
+                print(f"{'path':<14} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'fanout p50':>11} {'fanout p95':>11} {'sql/op':>7}")
+                for path in paths:
+                    await run_path(path, client, chat_id, sender, forward_id, inbox, len(members), counter,
+                                   args.warmup, args.fanout_timeout)
+                    result = await run_path(path, client, chat_id, sender, forward_id, inbox, len(members), counter,
+                                            args.requests, args.fanout_timeout)
+                    scenarios[f"{path}@{size}"] = result
+                    lat, fan = result["latency_ms"], result["fanout_ms"]
+                    print(f"{path:<14} {lat['p50']:>8.2f} {lat['p95']:>8.2f} {lat['p99']:>8.2f} "
+                          f"{fan['p50']:>11.2f} {fan['p95']:>11.2f} {result['db_queries_per_op']:>7}"
+                          + (f"  errors {result['errors']}" if result["errors"] else "")
+                          + (f"  fanout missed {result['fanout_missed']}" if result["fanout_missed"] else ""))
+
+            for uid in members:
+                manager.active.pop(uid, None)
+    await engine.dispose()
+
+    params = {k: v for k, v in vars(args).items() if k not in ("database_url", "out")}
+    path = harness.save_results("send_paths", params, scenarios, args.out)
+    print(f"\nresults written to {path}")
+
+
+def main():
+    args = parse_args()
+    if args.embedded:
+        from benchmarks.harness import start_embedded_postgres
+
+        args.database_url = start_embedded_postgres(tempfile.mkdtemp(prefix="bench-pg-"))
+    if not args.database_url:
+        raise SystemExit("set DATABASE_URL, pass --database-url, or use --embedded")
+    os.environ["DATABASE_URL"] = args.database_url
+    from benchmarks.harness import migrate
+
+    migrate()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
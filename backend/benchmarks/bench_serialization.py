@@ -0,0 +1,67 @@
+"""CPU time per list_messages response: Pydantic models vs. the orjson fast path.
+
+    python -m benchmarks.bench_serialization [--repeat 200]
+
+"pydantic" reproduces the old endpoint: ``MessageOut.model_validate`` per ORM
+object, then FastAPI re-validating against ``List[MessageOut]`` and encoding.
+"fast" is ``message_from_row`` over flat result rows + ``ORJSONResponse``.
+Database time is excluded from both.
+"""
+
+import argparse
+import time
+from typing import List
+
+from pydantic import TypeAdapter
+
+from app.schemas import MessageOut, UserOut
+from app.serializers import ORJSONResponse, message_from_row
+from benchmarks.fixtures import make_messages, make_users
+
+SIZES = (50, 200, 1000)
+_adapter = TypeAdapter(List[MessageOut])
+_MESSAGE_FIELDS = [f for f in MessageOut.model_fields if f not in ("sender", "forwarded_from")]
+
+
+def as_row(msg) -> tuple:
+    """Lay a message out like a ``message_rows_query()`` result row."""
+    def user(u):
+        return tuple(getattr(u, f) if u else None for f in UserOut.model_fields)
+    return tuple(getattr(msg, f) for f in _MESSAGE_FIELDS) + user(msg.sender) + user(msg.forwarded_from)
+
+
+def pydantic_path(messages) -> bytes:
+    models = [MessageOut.model_validate(m) for m in messages]
+    return _adapter.dump_json(_adapter.validate_python(models, from_attributes=True))
+
+
+def fast_path(rows) -> bytes:
+    return ORJSONResponse([message_from_row(r) for r in rows]).body
+
+
+def cpu_ms(fn, data, repeat: int) -> float:
+    fn(data)  # warm up
+    start = time.process_time()
+    for _ in range(repeat):
+        fn(data)
+    return (time.process_time() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    users = make_users(2)
+    print(f"{'messages':>8}  {'pydantic ms':>12}  {'fast ms':>8}  {'speedup':>7}  {'bytes':>8}")
+    for n in SIZES:
+        messages = make_messages(n, users)
+        rows = [as_row(m) for m in messages]
+        slow = cpu_ms(pydantic_path, messages, args.repeat)
+        fast = cpu_ms(fast_path, rows, args.repeat)
+        size = len(fast_path(rows))
+        print(f"{n:>8}  {slow:>12.3f}  {fast:>8.3f}  {slow / fast:>6.1f}x  {size:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Bytes and CPU per WebSocket frame: JSON text vs MessagePack binary.
+
+    python -m benchmarks.bench_wire [--messages 1000] [--fanout 100] [--repeat 20]
+
+Frames are ``new_message`` events shaped like the live ones (``MessageOut``
+in JSON mode plus ``chat_id``/``seq``).  For each encoding it reports the
+average frame size, raw and after per-message deflate at ``WS_DEFLATE_LEVEL``
+(roughly what permessage-deflate puts on the wire), and the CPU time to
+encode one frame on the server and decode it on a client.
+
+The fan-out rows time delivering each frame to ``--fanout`` sockets: the old
+path encoded once per socket (``send_json``), ``Frame`` encodes once per
+format however many sockets speak it.  Needs ``msgpack`` for its rows.
+"""
+
+import argparse
+import time
+import zlib
+
+import orjson
+
+from app import wire
+from app.config import settings
+from app.schemas import MessageOut
+from app.serializers import dumps
+from benchmarks.fixtures import make_messages, make_users
+
+
+def frames(n: int) -> list:
+    users = make_users(5)
+    return [
+        {
+            "type": "new_message",
+            "message": MessageOut.model_validate(m).model_dump(mode="json"),
+            "chat_id": str(m.chat_id),
+            "seq": m.seq,
+        }
+        for m in make_messages(n, users)
+    ]
+
+
+def cpu_us(fn, items, repeat: int) -> float:
+    for item in items[:10]:  # warm up
+        fn(item)
+    start = time.process_time()
+    for _ in range(repeat):
+        for item in items:
+            fn(item)
+    return (time.process_time() - start) / (repeat * len(items)) * 1e6
+
+
+def encoder(fmt: str):
+    return lambda payload: wire.Frame(payload).message(fmt)
+
+
+def client_decoder(fmt: str):
+    """What a client's stock decoder does with the frame (ids stay bytes)."""
+    if fmt == wire.MSGPACK:
+        return lambda raw: wire.msgpack.unpackb(raw, timestamp=3)
+    return orjson.loads
+
+
+def body(message: dict) -> bytes:
+    return message.get("bytes") or message["text"].encode()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--fanout", type=int, default=100, help="sockets per frame in the fan-out rows")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    payloads = frames(args.messages)
+    formats = wire.available_formats()
+    if wire.MSGPACK not in formats:
+        print("msgpack is not installed: JSON only")
+
+    print(f"{'format':<8} {'bytes':>7} {'deflated':>9} {'encode us':>10} {'decode us':>10}")
+    for fmt in reversed(formats):
+        encoded = [body(wire.Frame(p).message(fmt)) for p in payloads]
+        size = sum(map(len, encoded)) / len(encoded)
+        deflated = sum(
+            len(zlib.compress(b, settings.WS_DEFLATE_LEVEL, -settings.WS_DEFLATE_WINDOW_BITS)) for b in encoded
+        ) / len(encoded)
+        enc = cpu_us(encoder(fmt), payloads, args.repeat)
+        dec = cpu_us(client_decoder(fmt), encoded, args.repeat)
+        print(f"{fmt:<8} {size:>7.0f} {deflated:>9.0f} {enc:>10.2f} {dec:>10.2f}")
+
+    print(f"\nfan-out to {args.fanout} sockets, us per frame")
+    sample = payloads[: max(1, len(payloads) // 10)]
+    per_socket = cpu_us(lambda p: [dumps(p).decode() for _ in range(args.fanout)], sample, args.repeat)
+    print(f"{'per-socket json':<24} {per_socket:>10.1f}")
+    half = args.fanout // 2
+    sockets = [wire.JSON] * (args.fanout - half) + [formats[0]] * half
+
+    def fan_out(p):
+        frame = wire.Frame(p)
+        for fmt in sockets:
+            frame.message(fmt)
+
+    print(f"{'Frame (' + '+'.join(sorted(set(sockets))) + ')':<24} {cpu_us(fan_out, sample, args.repeat):>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
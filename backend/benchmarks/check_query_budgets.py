@@ -0,0 +1,106 @@
+"""Check that read endpoints issue a constant number of SQL statements as data grows.
+
+    python -m benchmarks.check_query_budgets [--database-url URL] [--rounds 3]
+
+Seeds a small dataset, then calls each route through the ASGI app with
+``QUERY_BUDGET_STRICT`` on, adding chats, members and messages visible to the
+caller between rounds (``app.query_budget.assert_constant_queries``).  Exits
+non-zero if any route's count grows or exceeds its ``@query_budget``.
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import uuid
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL"))
+    parser.add_argument("--rounds", type=int, default=3)
+    return parser.parse_args()
+
+
+async def run(args) -> bool:
+    import httpx
+    from sqlalchemy import insert, update
+
+    from app.config import settings
+    from app.database import engine
+    from app.main import app
+    from app.models import Chat, Message, User, chat_members
+    from app.query_budget import assert_constant_queries
+    from app.recent import recent_messages
+    from benchmarks import harness
+
+    settings.QUERY_BUDGET_STRICT = True
+    settings.RATE_LIMIT_ENABLED = False
+    recent_messages.per_chat = 0  # measure the Postgres path, not cache hits
+    data = await harness.seed(engine, users=20, chats=10, messages=200, group_size=5)
+    me = next(uid for uid in data.user_ids if data.user_chats[uid])
+    my_chat = data.user_chats[me][0]
+    other = next(uid for uid in data.chat_members[my_chat] if uid != me)
+    seq = {"next": 10_000}
+
+    async def grow():
+        """A new group with fresh members and messages, plus more messages in ``my_chat``."""
+        async with engine.begin() as conn:
+            users = [{"id": uuid.uuid4(), "phone": f"+9{uuid.uuid4().int % 10**12:012d}"} for _ in range(3)]
+            await conn.execute(insert(User), users)
+            chat_id = uuid.uuid4()
+            await conn.execute(insert(Chat), [{"id": chat_id, "chat_type": "group", "title": "grown", "created_by": me}])
+            await conn.execute(insert(chat_members), [{"chat_id": chat_id, "user_id": u} for u in (me, *(u["id"] for u in users))])
+            rows = []
+            for cid, n in ((chat_id, 5), (my_chat, 20)):
+                for _ in range(n):
+                    seq["next"] += 1
+                    rows.append({"chat_id": cid, "seq": seq["next"], "sender_id": me, "content": "grown", "status": "sent"})
+            await conn.execute(insert(Message), rows)
+            await conn.execute(update(Chat).where(Chat.id.in_([chat_id, my_chat])).values(last_seq=seq["next"]))
+
+    headers = {"Authorization": f"Bearer {data.tokens[me]}"}
+    routes = {
+        "list_chats": ("/api/chats", None),
+        "list_chats compact": ("/api/chats", {"compact": "true"}),
+        "get_chat": (f"/api/chats/{my_chat}", None),
+        "list_members": (f"/api/chats/{my_chat}/members", {"limit": "2"}),
+        "list_messages": (f"/api/chats/{my_chat}/messages", None),
+        "private chat (existing)": (f"/api/chats/private/{other}", None),
+        "search_users": ("/api/users/search", {"q": data.search_terms[0][:-1]}),
+        "get_user": (f"/api/users/{other}", None),
+        "lookup_users": ("/api/users", {"ids": ",".join(map(str, data.user_ids[:50]))}),
+        "sync": ("/api/sync", {"since": "0-0"}),
+    }
+
+    ok = True
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test", headers=headers) as client:
+        print(f"{'route':<26} {'statements':>10}")
+        for name, (path, params) in routes.items():
+            async def call():
+                resp = await client.get(path, params=params)
+                resp.raise_for_status()
+            try:
+                await call()  # warm-up: creates the private chat on first use
+                count = await assert_constant_queries(call, grow, rounds=args.rounds)
+                print(f"{name:<26} {count:>10}")
+            except Exception as exc:
+                ok = False
+                print(f"{name:<26} {'FAIL':>10}  {exc}")
+    await engine.dispose()
+    return ok
+
+
+def main():
+    args = parse_args()
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    from benchmarks.harness import migrate
+
+    migrate()
+    sys.exit(0 if asyncio.run(run(args)) else 1)
+
+
+if __name__ == "__main__":
+    main()
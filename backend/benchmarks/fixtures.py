@@ -0,0 +1,69 @@
+"""In-memory ORM objects shaped like production data, for DB-less benchmarks."""
+
+import random
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from app.config import settings
+from app.models import Chat, Message, User
+from app.serializers import user_dict
+
+_WORDS = "hey ok sure tomorrow lunch meeting send photo where are you thanks lol see later".split()
+
+
+def make_users(n: int) -> list[User]:
+    now = datetime.now(timezone.utc)
+    return [
+        User(
+            id=uuid.uuid4(),
+            phone=f"+1555{i:07d}",
+            username=f"user{i}",
+            display_name=f"User Number {i}",
+            bio="Just another account on the messenger, saying hi to everyone." if i % 2 else None,
+            avatar_url=f"/uploads/avatars/{uuid.uuid4()}_{i:08x}.jpg",
+            last_seen=now,
+        )
+        for i in range(n)
+    ]
+
+
+def make_messages(n: int, users: list[User], chat_id: uuid.UUID | None = None, seed: int = 0) -> list[Message]:
+    rnd = random.Random(seed)
+    chat_id = chat_id or uuid.uuid4()
+    start = datetime.now(timezone.utc) - timedelta(minutes=n)
+    messages = []
+    for i in range(n):
+        sender = users[i % len(users)]
+        forwarded = users[(i + 1) % len(users)] if i % 10 == 0 else None
+        messages.append(Message(
+            id=uuid.uuid4(),
+            chat_id=chat_id,
+            seq=i + 1,
+            sender_id=sender.id,
+            sender=sender,
+            content=" ".join(rnd.choices(_WORDS, k=rnd.randint(2, 20))),
+            image_url=None,
+            is_edited=i % 7 == 0,
+            forwarded_from_id=forwarded.id if forwarded else None,
+            forwarded_from=forwarded,
+            status="read",
+            created_at=start + timedelta(minutes=i),
+        ))
+    return messages
+
+
+def make_chat(users: list[User], last_message: Message | None = None) -> Chat:
+    chat = Chat(
+        id=uuid.uuid4(),
+        chat_type="group" if len(users) > 2 else "private",
+        title="Weekend plans" if len(users) > 2 else None,
+        created_at=datetime.now(timezone.utc),
+        member_count=len(users),
+    )
+    chat.members = users
+    return chat
+
+
+def member_preview(chat: Chat) -> list[dict]:
+    """The members ``chat_dict`` embeds for ``chat``, as the chat endpoints pick them."""
+    return [user_dict(u) for u in sorted(chat.members, key=lambda u: u.id)[:settings.CHAT_MEMBER_PREVIEW]]
@@ -0,0 +1,196 @@
+"""Shared plumbing for DB-backed benchmarks: migrations, seeding, query
+counting, latency statistics and result files.
+
+Import this only after ``DATABASE_URL`` points at the benchmark database;
+``app.config`` reads it on first import.
+"""
+
+import json
+import os
+import platform
+import random
+import subprocess
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from sqlalchemy import event, insert, text, update
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+
+def start_embedded_postgres(data_dir: str) -> str:
+    """Start a throwaway Postgres via the optional ``pgserver`` package; returns its URL."""
+    import pgserver  # pip install pgserver
+
+    server = pgserver.get_server(data_dir, cleanup_mode="stop")
+    return server.get_uri().replace("postgresql://", "postgresql+asyncpg://", 1)
+
+
+def migrate():
+    from alembic import command
+    from alembic.config import Config
+
+    cfg = Config(str(BACKEND_DIR / "alembic.ini"))
+    cfg.set_main_option("script_location", str(BACKEND_DIR / "alembic"))
+    command.upgrade(cfg, "head")
+
+
+# ---------- seeding ----------
+
+@dataclass
+class SeedData:
+    user_ids: List[uuid.UUID] = field(default_factory=list)
+    tokens: Dict[uuid.UUID, str] = field(default_factory=dict)
+    chat_ids: List[uuid.UUID] = field(default_factory=list)
+    user_chats: Dict[uuid.UUID, List[uuid.UUID]] = field(default_factory=dict)
+    chat_members: Dict[uuid.UUID, List[uuid.UUID]] = field(default_factory=dict)
+    search_terms: List[str] = field(default_factory=list)
+
+
+async def reset_database(engine):
+    async with engine.begin() as conn:
+        tables = (await conn.execute(text(
+            "SELECT tablename FROM pg_tables WHERE schemaname = 'public' AND tablename != 'alembic_version'"
+        ))).scalars().all()
+        if tables:
+            await conn.execute(text(f"TRUNCATE {', '.join(tables)} CASCADE"))
+
+
+async def seed(engine, users: int, chats: int, messages: int, group_size: int, seed_value: int = 0) -> SeedData:
+    """Bulk-insert users, a mix of private and group chats, and messages."""
+    from app.models import Chat, Message, User, chat_members
+    from app.partitions import ensure_partitions
+    from app.security import create_access_token, hash_password
+
+    rnd = random.Random(seed_value)
+    run = uuid.uuid4().hex[:6]
+    data = SeedData()
+    password_hash = hash_password("loadtest")
+    now = datetime.now(timezone.utc)
+
+    user_rows = []
+    for i in range(users):
+        uid = uuid.uuid4()
+        data.user_ids.append(uid)
+        data.tokens[uid] = create_access_token({"sub": str(uid)})
+        data.user_chats[uid] = []
+        user_rows.append({
+            "id": uid,
+            "phone": f"+{int(run, 16) % 10**6:06d}{i:08d}",
+            "username": f"lt_{run}_{i}",
+            "display_name": f"Load Tester {i}",
+            "password_hash": password_hash,
+        })
+    data.search_terms = [f"lt_{run}_{i}" for i in rnd.sample(range(users), min(users, 50))]
+
+    chat_rows, member_rows, members_of = [], [], data.chat_members
+    for i in range(chats):
+        cid = uuid.uuid4()
+        data.chat_ids.append(cid)
+        private = i % 2 == 0
+        members = rnd.sample(data.user_ids, 2 if private else min(group_size, users))
+        members_of[cid] = members
+        chat_rows.append({
+            "id": cid,
+            "chat_type": "private" if private else "group",
+            "title": None if private else f"Group {i}",
+            "created_by": members[0],
+        })
+        for uid in members:
+            member_rows.append({"chat_id": cid, "user_id": uid})
+            data.user_chats[uid].append(cid)
+
+    message_rows, last_seq = [], {cid: 0 for cid in data.chat_ids}
+    for i in range(messages):
+        cid = rnd.choice(data.chat_ids)
+        last_seq[cid] += 1
+        message_rows.append({
+            "id": uuid.uuid4(),
+            "chat_id": cid,
+            "seq": last_seq[cid],
+            "sender_id": rnd.choice(members_of[cid]),
+            "content": f"seeded message {i}",
+            "status": "read",
+            "created_at": now - timedelta(seconds=messages - i),
+        })
+
+    async with engine.begin() as conn:
+        if message_rows:
+            await ensure_partitions(conn, start=message_rows[0]["created_at"])
+        for table, rows in ((User, user_rows), (Chat, chat_rows), (chat_members, member_rows), (Message, message_rows)):
+            for start in range(0, len(rows), 5000):
+                await conn.execute(insert(table), rows[start:start + 5000])
+        for cid, seq in last_seq.items():
+            if seq:
+                await conn.execute(update(Chat).where(Chat.id == cid).values(last_seq=seq))
+    return data
+
+
+# ---------- measurement ----------
+
+class QueryCounter:
+    """Counts SQL statements issued through the app's engine (in-process servers only)."""
+
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine.sync_engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args, **kwargs):
+        self.count += 1
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, max(0, round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[k]
+
+
+def summarize(latencies: List[float], errors: int, duration: float, queries: Optional[int]) -> dict:
+    values = sorted(latencies)
+    ops = len(values)
+    return {
+        "ops": ops,
+        "errors": errors,
+        "duration_s": round(duration, 3),
+        "throughput_ops": round(ops / duration, 1) if duration else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(values, 50) * 1000, 2),
+            "p95": round(percentile(values, 95) * 1000, 2),
+            "p99": round(percentile(values, 99) * 1000, 2),
+            "max": round(values[-1] * 1000, 2) if values else 0.0,
+        },
+        "db_queries": queries,
+        "db_queries_per_op": round(queries / ops, 2) if queries is not None and ops else None,
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, stderr=subprocess.DEVNULL,
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def save_results(name: str, params: dict, scenarios: dict, out_dir: Optional[Path] = None) -> Path:
+    out_dir = Path(out_dir or RESULTS_DIR)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    commit = git_commit()
+    stamp = time.strftime("%Y%m%dT%H%M%S")
+    path = out_dir / f"{name}-{stamp}-{commit}.json"
+    path.write_text(json.dumps({
+        "benchmark": name,
+        "commit": commit,
+        "timestamp": stamp,
+        "host": {"python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count()},
+        "params": params,
+        "scenarios": scenarios,
+    }, indent=2, default=str))
+    return path
@@ -0,0 +1,324 @@
+"""End-to-end load test of the REST and WebSocket paths against real Postgres.
+
+    python -m benchmarks.loadtest [--database-url URL | --embedded] [--reset]
+        [--users 500] [--chats 300] [--messages 20000] [--group-size 20]
+        [--concurrency 50] [--duration 20] [--ws-clients 1000] [--ws-rate 1.0]
+        [--scenarios list_chats,list_messages,search_users,ws] [--server-url URL]
+
+Migrates and seeds the database, boots ``app.main:app`` in-process on uvicorn
+(with the same WebSocket protocol as ``app.server``), then runs each scenario
+for ``--duration`` seconds:
+
+* ``list_chats``, ``list_messages``, ``search_users``: ``--concurrency``
+  HTTP workers, each request as a random seeded user.
+* ``ws``: ``--ws-clients`` sockets, each sending about ``--ws-rate`` frames/s
+  (message 20%, typing 50%, read 30%).  Latency is measured for messages,
+  from send until the sender's own ``new_message`` echo arrives.
+
+Reports throughput, p50/p95/p99 latency and SQL statements per operation
+(counted on the app's engine, so only for the in-process server) and writes
+them to ``benchmarks/results/loadtest-<time>-<commit>.json``.  Load
+generator and server share one event loop; for absolute numbers point
+``--server-url`` at a separately started server (query counts are then
+omitted) and compare runs made the same way.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import socket
+import tempfile
+import time
+import uuid
+
+SCENARIOS = ("list_chats", "list_messages", "search_users", "ws")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL"))
+    parser.add_argument("--embedded", action="store_true", help="start a throwaway Postgres via pgserver")
+    parser.add_argument("--reset", action="store_true", help="truncate all tables before seeding")
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--chats", type=int, default=300)
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--group-size", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--ws-clients", type=int, default=1000)
+    parser.add_argument("--ws-rate", type=float, default=1.0, help="frames per second per socket")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--server-url", help="load an already running server instead of booting one")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="results directory (default benchmarks/results)")
+    return parser.parse_args()
+
+
+def raise_fd_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def start_server(port: int):
+    import uvicorn
+
+    from app.compression import DeflateWebSocketProtocol
+    from app.config import settings
+    from app.main import app
+
+    settings.RATE_LIMIT_ENABLED = False  # simulated users act far faster than real ones
+    server = uvicorn.Server(uvicorn.Config(
+        app, host="127.0.0.1", port=port, log_level="warning", backlog=4096,
+        ws=DeflateWebSocketProtocol, ws_per_message_deflate=settings.WS_DEFLATE_ENABLED,
+    ))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        if task.done():
+            task.result()
+        await asyncio.sleep(0.05)
+    return server, task
+
+
+# ---------- REST ----------
+
+def rest_request(name: str, data, rnd: random.Random):
+    uid = rnd.choice(data.user_ids)
+    headers = {"Authorization": f"Bearer {data.tokens[uid]}"}
+    if name == "list_chats":
+        return "/api/chats", None, headers
+    if name == "list_messages":
+        chat_id = rnd.choice(data.chat_ids)
+        uid = rnd.choice(data.chat_members[chat_id])
+        headers = {"Authorization": f"Bearer {data.tokens[uid]}"}
+        return f"/api/chats/{chat_id}/messages", {"limit": 50}, headers
+    return "/api/users/search", {"q": rnd.choice(data.search_terms)}, headers
+
+
+async def run_rest(name: str, base_url: str, data, args):
+    import httpx
+
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + args.duration
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        async def worker(i: int):
+            nonlocal errors
+            rnd = random.Random(args.seed * 1000 + i)
+            while time.perf_counter() < deadline:
+                path, params, headers = rest_request(name, data, rnd)
+                start = time.perf_counter()
+                try:
+                    resp = await client.get(path, params=params, headers=headers)
+                    ok = resp.status_code < 400
+                except httpx.HTTPError:
+                    ok = False
+                if ok:
+                    latencies.append(time.perf_counter() - start)
+                else:
+                    errors += 1
+
+        await asyncio.gather(*(worker(i) for i in range(args.concurrency)))
+    return latencies, errors
+
+
+# ---------- WebSocket ----------
+
+class WSClient:
+    def __init__(self, index: int, user_id: uuid.UUID, chat_ids: list, rnd: random.Random):
+        self.index = index
+        self.user_id = str(user_id)
+        self.chat_ids = [str(c) for c in chat_ids]
+        self.rnd = rnd
+        self.pending = {}  # content -> send time
+        self.latest = {}  # chat_id -> last message id seen
+        self.latencies = []
+        self.errors = 0
+        self.sent = 0
+        self.counter = 0
+
+    async def reader(self, ws):
+        async for raw in ws:
+            frame = json.loads(raw)
+            if frame.get("type") != "new_message":
+                continue
+            msg = frame["message"]
+            self.latest[frame["chat_id"]] = msg["id"]
+            sent_at = self.pending.pop(msg["content"], None)
+            if sent_at is not None:
+                self.latencies.append(time.perf_counter() - sent_at)
+
+    async def writer(self, ws, deadline: float, rate: float):
+        await asyncio.sleep(self.rnd.random() / rate)  # spread the first frames
+        while time.perf_counter() < deadline:
+            chat_id = self.rnd.choice(self.chat_ids)
+            roll = self.rnd.random()
+            if roll < 0.2:
+                self.counter += 1
+                content = f"lt {self.index}:{self.counter}"
+                self.pending[content] = time.perf_counter()
+                frame = {"type": "message", "chat_id": chat_id, "content": content}
+            elif roll < 0.5 and chat_id in self.latest:
+                frame = {"type": "read", "chat_id": chat_id, "message_id": self.latest[chat_id]}
+            else:
+                frame = {"type": "typing", "chat_id": chat_id}
+            await ws.send(json.dumps(frame))
+            self.sent += 1
+            await asyncio.sleep(self.rnd.expovariate(rate))
+
+
+async def run_ws(ws_url: str, data, args):
+    import websockets
+
+    rnd = random.Random(args.seed)
+    users = [uid for uid in data.user_ids if data.user_chats[uid]]
+    clients = [
+        WSClient(i, uid, data.user_chats[uid], random.Random(args.seed * 1000 + i))
+        for i, uid in enumerate(rnd.choices(users, k=args.ws_clients))
+    ]
+    connect_latencies, connect_errors = [], 0
+    connected = asyncio.Event()
+    remaining = len(clients)
+    gate = asyncio.Semaphore(200)  # cap concurrent handshakes
+    timing = {}
+
+    async def session(client: WSClient):
+        nonlocal connect_errors, remaining
+        try:
+            async with gate:
+                start = time.perf_counter()
+                ws = await websockets.connect(
+                    f"{ws_url}?token={data.tokens[uuid.UUID(client.user_id)]}",
+                    max_size=None, open_timeout=60,
+                )
+                connect_latencies.append(time.perf_counter() - start)
+        except (OSError, asyncio.TimeoutError, websockets.WebSocketException):
+            connect_errors += 1
+            ws = None
+        remaining -= 1
+        if remaining == 0:  # all handshakes done: the measured window starts now
+            timing["start"] = time.perf_counter()
+            timing["deadline"] = timing["start"] + args.duration
+            connected.set()
+        if ws is None:
+            return
+        await connected.wait()
+        reader = asyncio.create_task(client.reader(ws))
+        try:
+            await client.writer(ws, timing["deadline"], args.ws_rate)
+            await asyncio.sleep(1.0)  # let in-flight echoes land
+        except websockets.WebSocketException:
+            client.errors += 1
+        finally:
+            reader.cancel()
+            await ws.close()
+
+    await asyncio.gather(*(session(c) for c in clients))
+    latencies = [lat for c in clients for lat in c.latencies]
+    lost = sum(len(c.pending) for c in clients)
+    frames = sum(c.sent for c in clients)
+    return {
+        "latencies": latencies,
+        "errors": sum(c.errors for c in clients) + lost,
+        "elapsed": args.duration,
+        "connect_latencies": connect_latencies,
+        "connect_errors": connect_errors,
+        "frames_sent": frames,
+    }
+
+
+# ---------- driver ----------
+
+async def run(args):
+    from benchmarks import harness
+
+    scenarios = [s for s in args.scenarios.split(",") if s]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        raise SystemExit(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    from app.database import engine
+
+    if args.reset:
+        await harness.reset_database(engine)
+    print(f"seeding {args.users} users, {args.chats} chats, {args.messages} messages ...")
+    data = await harness.seed(engine, args.users, args.chats, args.messages, args.group_size, args.seed)
+
+    server = task = None
+    counter = None
+    base_url = args.server_url
+    if base_url is None:
+        counter = harness.QueryCounter(engine)
+        port = free_port()
+        server, task = await start_server(port)
+        base_url = f"http://127.0.0.1:{port}"
+    ws_url = base_url.replace("http", "ws", 1).rstrip("/") + "/ws"
+
+    results = {}
+    print(f"{'scenario':<14} {'ops':>8} {'err':>5} {'ops/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'sql/op':>7}")
+    try:
+        for name in scenarios:
+            queries_before = counter.count if counter else None
+            if name == "ws":
+                out = await run_ws(ws_url, data, args)
+                summary = harness.summarize(out["latencies"], out["errors"], out["elapsed"], None)
+                summary["frames_sent"] = out["frames_sent"]
+                summary["frames_per_s"] = round(out["frames_sent"] / out["elapsed"], 1)
+                summary["connect"] = harness.summarize(out["connect_latencies"], out["connect_errors"], 0, None)["latency_ms"]
+                summary["connect_errors"] = out["connect_errors"]
+                ops = out["frames_sent"]
+            else:
+                start = time.perf_counter()
+                latencies, errors = await run_rest(name, base_url, data, args)
+                summary = harness.summarize(latencies, errors, time.perf_counter() - start, None)
+                ops = summary["ops"]
+            if counter:
+                queries = counter.count - queries_before
+                summary["db_queries"] = queries
+                summary["db_queries_per_op"] = round(queries / ops, 2) if ops else None
+            results[name] = summary
+            lat = summary["latency_ms"]
+            per_op = summary["db_queries_per_op"]
+            print(f"{name:<14} {summary['ops']:>8} {summary['errors']:>5} {summary['throughput_ops']:>9.1f} "
+                  f"{lat['p50']:>8.2f} {lat['p95']:>8.2f} {lat['p99']:>8.2f} {per_op if per_op is not None else '-':>7}")
+    finally:
+        if server is not None:
+            server.should_exit = True
+            await task
+        await engine.dispose()
+
+    params = {k: v for k, v in vars(args).items() if k not in ("database_url", "out")}
+    path = harness.save_results("loadtest", params, results, args.out)
+    print(f"\nresults written to {path}")
+
+
+def main():
+    args = parse_args()
+    raise_fd_limit()
+    if args.embedded:
+        from benchmarks.harness import start_embedded_postgres
+
+        args.database_url = start_embedded_postgres(tempfile.mkdtemp(prefix="loadtest-pg-"))
+    if not args.database_url:
+        raise SystemExit("set DATABASE_URL, pass --database-url, or use --embedded")
+    # app.config reads it on first import, so set it before anything imports it
+    os.environ["DATABASE_URL"] = args.database_url
+
+    from benchmarks.harness import migrate
+
+    migrate()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+from app.events import compact_events, format_cursor, parse_cursor
+
+
+def test_edit_folds_into_new_message():
+    rows = [
+        ("message:1", {"type": "new_message", "id": "1", "content": "a"}),
+        ("message:1", {"type": "message_edited", "id": "1", "content": "b"}),
+    ]
+    assert compact_events(rows) == [{"type": "new_message", "id": "1", "content": "b"}]
+
+
+def test_new_then_deleted_cancels_out():
+    rows = [
+        ("message:1", {"type": "new_message", "id": "1"}),
+        ("message:2", {"type": "new_message", "id": "2"}),
+        ("message:1", {"type": "message_deleted", "id": "1"}),
+    ]
+    assert compact_events(rows) == [{"type": "new_message", "id": "2"}]
+
+
+def test_edit_then_delete_keeps_delete():
+    rows = [
+        ("message:1", {"type": "message_edited", "id": "1"}),
+        ("message:1", {"type": "message_deleted", "id": "1"}),
+    ]
+    assert compact_events(rows) == [{"type": "message_deleted", "id": "1"}]
+
+
+def test_later_chat_change_folds_into_chat_added():
+    rows = [
+        ("chat:1", {"type": "chat_added", "id": "1", "name": "old", "member_count": 2}),
+        ("chat:1", {"type": "chat_updated", "id": "1", "name": "new"}),
+    ]
+    assert compact_events(rows) == [{"type": "chat_added", "id": "1", "name": "new", "member_count": 2}]
+
+
+def test_order_of_last_change():
+    rows = [
+        ("a", {"type": "x", "n": 1}),
+        ("b", {"type": "x", "n": 2}),
+        ("a", {"type": "x", "n": 3}),
+    ]
+    assert compact_events(rows) == [{"type": "x", "n": 2}, {"type": "x", "n": 3}]
+
+
+def test_cursor_roundtrip():
+    assert parse_cursor(format_cursor((123, 45))) == (123, 45)
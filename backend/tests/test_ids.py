@@ -0,0 +1,16 @@
+import uuid
+
+from app.ids import uuid7
+
+
+def test_uuid7_version_and_variant():
+    value = uuid7()
+    assert value.version == 7
+    assert value.variant == uuid.RFC_4122
+
+
+def test_uuid7_strictly_increasing():
+    ids = [uuid7() for _ in range(10_000)]
+    assert ids == sorted(ids)
+    assert len(set(ids)) == len(ids)
+    assert [i.bytes for i in ids] == sorted(i.bytes for i in ids)
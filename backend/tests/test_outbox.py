@@ -0,0 +1,108 @@
+from app.outbox import _advance
+
+
+class Table:
+    """Outbox rows as ``(xid, id)``, with Postgres-like snapshots."""
+
+    def __init__(self):
+        self.rows = []
+        self.running = set()
+        self.next_id = 1
+
+    def begin(self, xid):
+        self.running.add(xid)
+
+    def insert(self, xid, n=1):
+        for _ in range(n):
+            self.rows.append((xid, self.next_id))
+            self.next_id += 1
+
+    def commit(self, xid):
+        self.running.discard(xid)
+
+    def snapshot(self):
+        xmax = max([xid for xid, _ in self.rows] + list(self.running), default=0) + 1
+        return xmax, sorted(self.running)
+
+    def read(self, after, open_, limit):
+        visible = [key for key in self.rows if key[0] not in self.running]
+        pending = [
+            key for key in visible
+            if key > after or (key[0] in open_ and key[1] > open_[key[0]])
+        ]
+        return sorted(pending)[:limit]
+
+
+class Reader:
+    def __init__(self, table, batch_size):
+        self.table = table
+        self.batch_size = batch_size
+        xmax, in_flight = table.snapshot()
+        self.after, self.open = (xmax, 0), dict.fromkeys(in_flight, 0)
+        self.sent = []
+
+    def drain(self):
+        while True:
+            xmax, in_flight = self.table.snapshot()
+            keys = self.table.read(self.after, self.open, self.batch_size)
+            self.sent += keys
+            self.after, self.open = _advance(self.after, self.open, keys, xmax, in_flight, self.batch_size)
+            if len(keys) < self.batch_size:
+                return
+
+
+def test_open_transaction_bigger_than_a_batch_is_sent_once():
+    table = Table()
+    reader = Reader(table, batch_size=2)
+    table.begin(5)
+    table.insert(5, 5)
+    table.begin(8)
+    table.insert(8, 3)
+    table.commit(8)
+    reader.drain()
+    assert [key[0] for key in reader.sent] == [8, 8, 8]
+    assert reader.open == {5: 0}
+
+    table.commit(5)
+    table.begin(12)
+    table.insert(12, 3)
+    table.commit(12)
+    reader.drain()
+    assert sorted(reader.sent) == sorted(table.rows)
+    assert len(set(reader.sent)) == len(reader.sent)
+    assert reader.open == {}
+
+
+def test_late_commit_below_a_partly_read_transaction():
+    table = Table()
+    table.begin(5)
+    table.begin(7)
+    reader = Reader(table, batch_size=2)
+    table.insert(5)
+    table.insert(7, 4)
+    table.commit(7)
+    reader.drain()
+    assert [key[0] for key in reader.sent] == [7, 7, 7, 7]
+
+    table.commit(5)
+    reader.drain()
+    assert sorted(reader.sent) == sorted(table.rows)
+    assert len(set(reader.sent)) == len(reader.sent)
+
+
+def test_commits_in_flight_while_reading():
+    table = Table()
+    reader = Reader(table, batch_size=3)
+    for xid in range(10, 30):
+        table.begin(xid)
+        table.insert(xid, xid % 4)
+    for xid in range(10, 30):
+        if xid % 3:
+            table.commit(xid)
+        reader.drain()
+    for xid in range(12, 30, 3):
+        table.commit(xid)
+    reader.drain()
+    assert sorted(reader.sent) == sorted(table.rows)
+    assert len(set(reader.sent)) == len(reader.sent)
+    assert reader.open == {}
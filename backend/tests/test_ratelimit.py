@@ -0,0 +1,64 @@
+import math
+
+import pytest
+
+from app.ratelimit import RateLimiter, TokenBucket, parse_limit
+
+
+def test_parse_limit():
+    assert parse_limit("5/20") == (5.0, 20.0)
+    assert parse_limit("0.5") == (0.5, 1.0)
+    assert parse_limit("3") == (3.0, 3.0)
+
+
+@pytest.mark.parametrize("spec", ["0/10", "-1/5", "5/0"])
+def test_parse_limit_rejects_nonpositive(spec):
+    with pytest.raises(ValueError):
+        parse_limit(spec)
+
+
+def test_bucket_refills_at_rate():
+    bucket = TokenBucket(rate=2, burst=4, now=0)
+    assert bucket.take(0, 4) == 0
+    assert bucket.wait(0) == pytest.approx(0.5)
+    assert bucket.take(1, 2) == 0
+    assert bucket.take(1) == pytest.approx(0.5)
+
+
+def test_bucket_rejection_spends_nothing():
+    bucket = TokenBucket(rate=1, burst=5, now=0)
+    assert bucket.take(0, 3) == 0
+    assert bucket.take(0, 3) == pytest.approx(1)
+    assert bucket.take(0, 2) == 0
+
+
+def test_bucket_more_than_burst_is_never_allowed():
+    bucket = TokenBucket(rate=1, burst=5, now=0)
+    assert bucket.take(0, 6) == math.inf
+    assert bucket.tokens == 5
+
+
+def test_limiter_spends_only_when_every_limit_allows():
+    limiter = RateLimiter({"a": "1/10", "b": "1/2"})
+    assert limiter.check({"a": 1, "b": 2}, "u") == 0
+    # "b" is empty: "a" must not be charged for the rejected attempt
+    assert limiter.check({"a": 5, "b": 1}, "u") > 0
+    assert limiter.check({"a": 9}, "u") == 0
+
+
+def test_limiter_subjects_and_unknown_names():
+    limiter = RateLimiter({"a": "1/1"})
+    assert limiter.check({"a": 1}, "u1") == 0
+    assert limiter.check({"a": 1}, "u2") == 0
+    assert limiter.check({"a": 1}, "u1") > 0
+    assert limiter.check({"other": 100}, "u1") == 0
+    assert limiter.burst("a") == 1
+    assert limiter.burst("other") == math.inf
+
+
+def test_limiter_evicts_least_recently_used():
+    limiter = RateLimiter({"a": "1/1"}, max_buckets=2)
+    for subject in ("u1", "u2", "u3"):
+        limiter.check({"a": 1}, subject)
+    assert ("a", "u1") not in limiter._buckets
+    assert len(limiter._buckets) == 2
@@ -0,0 +1,54 @@
+import uuid
+
+from app.recent import RecentMessages
+
+CHAT = uuid.uuid4()
+
+
+def message(seq, status="sent"):
+    return {"id": uuid.UUID(int=seq), "chat_id": str(CHAT), "seq": seq, "status": status}
+
+
+def filled(status_version=0):
+    cache = RecentMessages(per_chat=10, max_bytes=1 << 20)
+    cache.fill(CHAT, 3, status_version, [message(1), message(2), message(3)], whole=True)
+    return cache
+
+
+def test_hit_and_miss_on_newer_seq():
+    cache = filled()
+    assert [m["seq"] for m in cache.page(CHAT, 3, 0, 2)] == [2, 3]
+    assert cache.page(CHAT, 4, 0, 2) is None
+
+
+def test_status_changed_elsewhere_is_a_miss():
+    cache = filled(status_version=5)
+    assert cache.page(CHAT, 3, 5, 3) is not None
+    assert cache.page(CHAT, 3, 6, 3) is None
+
+
+def test_local_status_change_keeps_the_ring():
+    cache = filled(status_version=5)
+    cache.update(CHAT, 6, {uuid.UUID(int=2): {"status": "read"}})
+    page = cache.page(CHAT, 3, 6, 3)
+    assert [m["status"] for m in page] == ["sent", "read", "sent"]
+
+
+def test_missed_status_change_drops_the_ring():
+    cache = filled(status_version=5)
+    cache.update(CHAT, 7, {uuid.UUID(int=2): {"status": "read"}})
+    assert len(cache) == 0
+
+
+def test_older_status_change_is_ignored():
+    cache = filled(status_version=5)
+    cache.update(CHAT, 5, {uuid.UUID(int=2): {"status": "delivered"}})
+    assert [m["status"] for m in cache.page(CHAT, 3, 5, 3)] == ["sent", "sent", "sent"]
+
+
+def test_events_extend_the_ring_in_order():
+    cache = filled()
+    cache.apply({"type": "new_message", "chat_id": str(CHAT), "seq": 4, "message": message(4)})
+    assert [m["seq"] for m in cache.page(CHAT, 4, 0, 10)] == [1, 2, 3, 4]
+    cache.apply({"type": "new_message", "chat_id": str(CHAT), "seq": 6, "message": message(6)})
+    assert len(cache) == 0
@@ -0,0 +1,99 @@
+import pytest
+
+from app import segments
+from app.config import settings
+from app.serializers import MESSAGE_RECORD_FIELDS
+
+SEQ = MESSAGE_RECORD_FIELDS.index("seq")
+CHAT = "00000000-0000-7000-8000-000000000001"
+
+
+@pytest.fixture(autouse=True)
+def segment_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "SEGMENT_DIR", str(tmp_path))
+    segments._open.clear()
+    yield tmp_path
+    segments._open.clear()
+
+
+def record(seq):
+    values = [None] * len(MESSAGE_RECORD_FIELDS)
+    values[SEQ] = seq
+    return values
+
+
+def write(first, last, block_size=4):
+    writer = segments.SegmentWriter(CHAT, block_size=block_size)
+    for seq in range(first, last + 1):
+        writer.add(record(seq))
+    return writer.close()
+
+
+def seqs(before, limit, skip=0, exclude=()):
+    fields, records = segments.read_older(CHAT, before, limit, skip, exclude)
+    assert fields == list(MESSAGE_RECORD_FIELDS)
+    return [r[SEQ] for r in records]
+
+
+def test_writer_names_file_by_seq_range(segment_dir):
+    path = write(1, 10)
+    assert path.parent == segment_dir / CHAT
+    assert segments.segment_paths(CHAT) == [(1, 10, path)]
+    assert segments.Segment(path).blocks == 3
+    assert not list(path.parent.glob("*.tmp"))
+
+
+def test_empty_writer_publishes_nothing():
+    assert segments.SegmentWriter(CHAT).close() is None
+    assert segments.segment_paths(CHAT) == []
+
+
+def test_read_older_newest_first():
+    write(1, 10)
+    assert seqs(None, 3) == [10, 9, 8]
+    assert seqs(6, 3) == [5, 4, 3]
+    assert seqs(3, 10) == [2, 1]
+    assert seqs(1, 10) == []
+
+
+def test_read_older_spans_segments():
+    write(1, 10)
+    write(11, 25)
+    assert seqs(13, 5) == [12, 11, 10, 9, 8]
+    assert seqs(None, 100) == list(range(25, 0, -1))
+
+
+def test_read_older_skip():
+    write(1, 10)
+    write(11, 25)
+    assert seqs(None, 4, skip=13) == [12, 11, 10, 9]
+    assert seqs(20, 5, skip=17) == [2, 1]
+    assert seqs(None, 5, skip=30) == []
+
+
+def test_read_older_leaves_out_deleted():
+    write(1, 10)
+    write(11, 20)
+    assert seqs(None, 4, exclude={20, 18}) == [19, 17, 16, 15]
+    assert seqs(None, 3, skip=2, exclude={19, 12, 11}) == [17, 16, 15]
+    assert seqs(13, 5, exclude={11, 10}) == [12, 9, 8, 7, 6]
+
+
+def test_find_record():
+    write(1, 10)
+    writer = segments.SegmentWriter(CHAT, block_size=4)
+    for seq in range(11, 21):
+        r = record(seq)
+        r[MESSAGE_RECORD_FIELDS.index("id")] = f"id-{seq}"
+        writer.add(r)
+    writer.close()
+    fields, found = segments.find_record(CHAT, "id-13")
+    assert found[fields.index("seq")] == 13
+    assert segments.find_record(CHAT, "missing")[1] is None
+
+
+def test_rejects_foreign_file(segment_dir):
+    path = segment_dir / "junk.seg"
+    path.write_bytes(b"not a segment at all")
+    with pytest.raises(ValueError):
+        segments.Segment(path)
@@ -0,0 +1,55 @@
+import uuid
+from datetime import datetime, timezone
+
+import pytest
+
+msgpack = pytest.importorskip("msgpack")
+
+from app.wire import MSGPACK, Frame, pack, unpack  # noqa: E402
+
+
+def test_pack_encodes_ids_and_times_natively():
+    chat_id = uuid.uuid4()
+    created = datetime(2024, 5, 1, 12, 0, tzinfo=timezone.utc)
+    raw = pack({"type": "new_message", "chat_id": str(chat_id), "created_at": created.isoformat()})
+    data = msgpack.unpackb(raw, raw=False, timestamp=3)
+    assert data["chat_id"] == chat_id.bytes
+    assert data["created_at"] == created
+
+
+def test_unpack_converts_known_id_fields_only():
+    chat_id, user_id = uuid.uuid4(), uuid.uuid4()
+    blob = b"\x00" * 16
+    raw = msgpack.packb({
+        "type": "message",
+        "id": "client-1",
+        "chat_id": chat_id.bytes,
+        "user_ids": [user_id.bytes],
+        "content": blob,
+        "nested": {"message_id": chat_id.bytes, "other": blob},
+    }, use_bin_type=True)
+    assert unpack(raw) == {
+        "type": "message",
+        "id": "client-1",
+        "chat_id": str(chat_id),
+        "user_ids": [str(user_id)],
+        "content": blob,
+        "nested": {"message_id": str(chat_id), "other": blob},
+    }
+
+
+def test_top_level_id_is_left_alone():
+    blob = uuid.uuid4().bytes
+    assert unpack(msgpack.packb({"id": blob}, use_bin_type=True)) == {"id": blob}
+
+
+def test_unpack_non_dict_frame():
+    assert unpack(msgpack.packb([1, 2])) == [1, 2]
+
+
+def test_roundtrip_through_frame():
+    sender = uuid.uuid4()
+    frame = Frame({"type": "new_message", "message": {"id": str(uuid.uuid4()), "sender_id": str(sender)}})
+    message = frame.message(MSGPACK)
+    assert frame.message(MSGPACK) is message
+    assert unpack(message["bytes"])["message"]["sender_id"] == str(sender)
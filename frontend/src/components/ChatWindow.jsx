@@ -50,7 +50,7 @@ function HeaderMiniProfile({ user, onClose }) {
 
 export default function ChatWindow() {
   const { user } = useAuthStore();
-  const { activeChat, messages, fetchMessages, typingUsers, onlineUsers, sendImage, editMessage, deleteMessage } = useChatStore();
+  const { activeChat, messages, fetchMessages, typingUsers, onlineUsers, users, sendImage, editMessage, deleteMessage } = useChatStore();
   const [text, setText] = useState("");
   const [imagePreview, setImagePreview] = useState(null);
   const [imageFile, setImageFile] = useState(null);
@@ -184,7 +184,7 @@ export default function ChatWindow() {
   // Avatar: for private chats use other user's avatar, otherwise chat avatar
   const avatarUrl = activeChat?.chat_type === "private" ? otherUser?.avatar_url : activeChat?.avatar_url;
   const subtitle = activeChat?.chat_type === "group"
-    ? `${activeChat.members?.length || 0} members`
+    ? `${activeChat.member_count ?? activeChat.members?.length ?? 0} members`
     : isOnline
     ? "online"
     : otherUser?.last_seen
@@ -197,7 +197,8 @@ export default function ChatWindow() {
     ? [...chatTyping]
         .filter((uid) => uid !== user?.id)
         .map((uid) => {
-          const m = activeChat?.members?.find((u) => u.id === uid);
+          // members only holds a preview of large groups; the rest come from the store's cache
+          const m = activeChat?.members?.find((u) => u.id === uid) || users[uid];
           return m?.display_name || "Someone";
         })
     : [];
@@ -33,7 +33,7 @@ export default function ForwardModal({ message, onClose }) {
   const handleForward = async (chatId) => {
     setSending(true);
     try {
-      await forwardMessage(message.id, chatId);
+      await forwardMessage(message.id, chatId, message.chat_id);
       toast.success("Message forwarded");
       onClose();
     } catch (err) {
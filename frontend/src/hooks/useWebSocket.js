@@ -7,12 +7,31 @@ let ws = null;
 let reconnectTimer = null;
 let currentToken = null;
 let mountCount = 0;
+// chatId -> last event seq seen, sent back as `since` on reconnect
+const lastSeq = {};
 
 function handleMessage(event) {
-  const data = JSON.parse(event.data);
+  dispatch(JSON.parse(event.data));
+}
+
+function dispatch(data) {
   const store = useChatStore.getState();
 
+  if (data.seq != null && data.chat_id) {
+    if (data.seq <= (lastSeq[data.chat_id] || 0)) return; // already applied
+    lastSeq[data.chat_id] = data.seq;
+  }
+
   switch (data.type) {
+    case "replay":
+      data.events.forEach(dispatch);
+      if (data.reset.length) {
+        data.reset.forEach((chatId) => delete lastSeq[chatId]);
+        store.fetchChats();
+        const active = store.activeChat;
+        if (active && data.reset.includes(active.id)) store.fetchMessages(active.id);
+      }
+      break;
     case "new_message":
       store.addNewMessage(data.message);
       break;
@@ -65,6 +84,8 @@ function connectWS(token) {
     const host = window.location.host;
     wsUrl = `${protocol}//${host}/ws?token=${token}`;
   }
+  const since = Object.entries(lastSeq).map(([chatId, seq]) => `${chatId}:${seq}`).join(",");
+  if (since) wsUrl += `&since=${since}`;
   ws = new WebSocket(wsUrl);
 
   ws.onopen = () => {
@@ -87,6 +108,7 @@ function connectWS(token) {
 
 function disconnectWS() {
   currentToken = null;
+  Object.keys(lastSeq).forEach((chatId) => delete lastSeq[chatId]);
   if (reconnectTimer) { clearTimeout(reconnectTimer); reconnectTimer = null; }
   if (ws) { try { ws.close(); } catch(_) {} ws = null; }
 }
@@ -1,12 +1,16 @@
 import { create } from "zustand";
 import api from "../api";
 
+// ids with a lookup in flight, so a burst of typing frames asks once
+const resolving = new Set();
+
 export const useChatStore = create((set, get) => ({
   chats: [],
   activeChat: null,
   messages: [],
   typingUsers: {}, // chatId -> Set<userId>
   onlineUsers: new Set(),
+  users: {}, // userId -> profile, for members outside a chat's preview
 
   resetStore: () => {
     set({
@@ -15,7 +19,9 @@ export const useChatStore = create((set, get) => ({
       messages: [],
       typingUsers: {},
       onlineUsers: new Set(),
+      users: {},
     });
+    resolving.clear();
   },
 
   fetchChats: async () => {
@@ -106,8 +112,10 @@ export const useChatStore = create((set, get) => ({
     await api.delete(`/chats/${chatId}/messages/${messageId}`);
   },
 
-  forwardMessage: async (messageId, toChatId) => {
-    const res = await api.post(`/chats/forward`, { message_id: messageId, to_chat_id: toChatId });
+  forwardMessage: async (messageId, toChatId, fromChatId) => {
+    const res = await api.post(`/chats/forward`, {
+      message_id: messageId, to_chat_id: toChatId, from_chat_id: fromChatId,
+    });
     return res.data;
   },
 
@@ -143,8 +151,24 @@ export const useChatStore = create((set, get) => ({
     });
   },
 
+  resolveUsers: async (userIds) => {
+    const { users } = get();
+    const missing = userIds.filter((id) => !users[id] && !resolving.has(id));
+    if (missing.length === 0) return;
+    missing.forEach((id) => resolving.add(id));
+    try {
+      const res = await api.get("/users", { params: { ids: missing.join(",") } });
+      set({ users: { ...get().users, ...res.data } });
+    } finally {
+      missing.forEach((id) => resolving.delete(id));
+    }
+  },
+
   setTyping: (chatId, userId) => {
-    const { typingUsers } = get();
+    const { typingUsers, activeChat } = get();
+    if (activeChat?.id === chatId && !activeChat.members?.some((u) => u.id === userId)) {
+      get().resolveUsers([userId]).catch(() => {});
+    }
     const existing = typingUsers[chatId] || new Set();
     existing.add(userId);
     set({ typingUsers: { ...typingUsers, [chatId]: existing } });